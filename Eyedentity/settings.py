@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.sites',
     'django.contrib.sitemaps',
+    'django.contrib.humanize',
     'django_ckeditor_5',
     'ckeditor',
     'ckeditor_uploader',
@@ -47,6 +48,8 @@ if DEBUG:
     INSTALLED_APPS += ['debug_toolbar']
 
 MIDDLEWARE = [
+    'apps.main.request_metrics.RequestMetricsMiddleware',
+    'apps.main.request_values.RequestValuesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -104,6 +107,16 @@ else:
         }
     }
 
+# The default database goes through the circuit breaker's backends; see
+# apps/main/db_circuit.py. Other engines are left as they are.
+DB_CIRCUIT_ENABLED = os.environ.get('DB_CIRCUIT_ENABLED', 'True') == 'True'
+DB_CIRCUIT_ENGINES = {
+    'django.db.backends.postgresql': 'apps.main.db_backends.postgresql',
+    'django.db.backends.sqlite3': 'apps.main.db_backends.sqlite3',
+}
+if DB_CIRCUIT_ENABLED:
+    DATABASES['default']['ENGINE'] = DB_CIRCUIT_ENGINES.get(DATABASES['default']['ENGINE'], DATABASES['default']['ENGINE'])
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -166,6 +179,60 @@ else:
         },
     }
 
+# Stage uploads on local disk and push them to the default storage from the
+# run_jobs worker instead of inside the admin request (apps/main/storage.py).
+QUEUED_UPLOADS = os.environ.get('QUEUED_UPLOADS', 'False') == 'True'
+MEDIA_STAGING_ROOT = os.environ.get('MEDIA_STAGING_ROOT', BASE_DIR / 'media_staging')
+if QUEUED_UPLOADS:
+    STORAGES["default"] = {
+        "BACKEND": "apps.main.storage.QueuedUploadStorage",
+        "OPTIONS": {"remote": STORAGES["default"]},
+    }
+
+# Sitemaps are prebuilt as gzipped shards plus an index by build_sitemaps
+# and served from local disk (apps/main/static_sitemaps.py).
+SITEMAPS = {
+    'static': 'apps.main.sitemaps.StaticViewSitemap',
+    'products': 'apps.main.sitemaps.ProductSitemap',
+    'categories': 'apps.main.sitemaps.CategorySitemap',
+    'blog_posts': 'apps.blog.sitemaps.BlogPostSitemap',
+    'blog_categories': 'apps.blog.sitemaps.BlogCategorySitemap',
+}
+SITEMAP_ROOT = os.environ.get('SITEMAP_ROOT', BASE_DIR / 'sitemaps')
+SITEMAP_SHARD_SIZE = int(os.environ.get('SITEMAP_SHARD_SIZE', 5000))
+SITEMAP_PROTOCOL = os.environ.get('SITEMAP_PROTOCOL', 'http' if DEBUG else 'https')
+SITEMAP_REBUILD_DELAY = int(os.environ.get('SITEMAP_REBUILD_DELAY', 300))
+STORAGES["sitemaps"] = {
+    "BACKEND": "django.core.files.storage.FileSystemStorage",
+    "OPTIONS": {"location": SITEMAP_ROOT, "base_url": "/"},
+}
+
+# Per-request query/template/cache metrics as Server-Timing plus a log line;
+# see apps/main/request_metrics.py. Slow thresholds are in milliseconds,
+# REQUEST_METRICS_SLOW_VIEWS maps URL names to their own threshold.
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'True') == 'True'
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '1.0' if DEBUG else '0.1'))
+REQUEST_METRICS_PUBLIC = os.environ.get('REQUEST_METRICS_PUBLIC', str(DEBUG)) == 'True'
+REQUEST_METRICS_SLOW_MS = int(os.environ.get('REQUEST_METRICS_SLOW_MS', 500))
+REQUEST_METRICS_SLOW_VIEWS = {
+    'shop': 800,
+    'blog_search': 800,
+}
+
+# Background jobs run inline after commit unless a run_jobs worker is deployed.
+JOBS_EAGER = os.environ.get('JOBS_EAGER', str(DEBUG)) == 'True'
+
+# WhatsApp click tracking is buffered per process and batch-inserted.
+CLICK_BUFFER_SIZE = int(os.environ.get('CLICK_BUFFER_SIZE', 10000))
+CLICK_BUFFER_BATCH = int(os.environ.get('CLICK_BUFFER_BATCH', 200))
+CLICK_BUFFER_INTERVAL = float(os.environ.get('CLICK_BUFFER_INTERVAL', 2))
+CLICK_SPILL_DIR = os.environ.get('CLICK_SPILL_DIR', BASE_DIR / 'click_spill')
+
+# Blog view counts are buffered per process and written every N seconds;
+# a visitor is counted at most once per post per COUNTER_DEDUP_WINDOW seconds.
+COUNTER_FLUSH_INTERVAL = int(os.environ.get('COUNTER_FLUSH_INTERVAL', 10))
+COUNTER_DEDUP_WINDOW = int(os.environ.get('COUNTER_DEDUP_WINDOW', 60 * 30))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SITE_ID = 1
@@ -266,13 +333,48 @@ LOGGING = {
     },
 }
 
+# In-process LRU (L1) in front of a cache shared by every worker (L2), with
+# cross-worker invalidation; see apps/main/cache_backends.py. L2 is Redis
+# when REDIS_URL is set, otherwise a file-based cache.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_DIR = os.environ.get('CACHE_DIR', '/tmp/eyedentity_cache')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+        'BACKEND': 'apps.main.cache_backends.TwoTierCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', 30)),
+            'L1_MAX_ENTRIES': 1000,
+            'NAMESPACES': {
+                'company_info': {'timeout': 60 * 60},
+                'cache_tag:': {'l1_timeout': 5},
+                'page_cache:': {'max_entries': 200},
+                # Only read during database outages.
+                'page_stale:': {'l1_timeout': 0},
+                'shop_facets:': {'max_entries': 200},
+                'image_derivatives:': {'max_entries': 2000},
+                # Rate limits must agree across workers.
+                'newsletter_signup_': {'l1_timeout': 0},
+                'counter_seen:': {'l1_timeout': 0},
+                # Stampede locks; see apps/main/fragments.py.
+                'compute_lock:': {'l1_timeout': 0},
+            },
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
 }
 
+# 'db' (default), 'cached_db' or 'signed_cookies'. Anonymous browsing never
+# writes a session; see apps/main/visitor.py.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_BACKEND', 'db')
 SESSION_COOKIE_AGE = 1209600
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_SAVE_EVERY_REQUEST = False
@@ -286,12 +388,36 @@ MESSAGE_TAGS = {
 }
 
 PAGINATE_BY = 12
+CURSOR_PAGINATION = os.environ.get('CURSOR_PAGINATION', 'False') == 'True'
+CURSOR_PAGINATION_OFFSET_PAGES = 5
+PAGINATION_ESTIMATE_COUNT = os.environ.get('PAGINATION_ESTIMATE_COUNT', 'False') == 'True'
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', str(not DEBUG)) == 'True'
+PAGE_CACHE_TIMEOUT = 60 * 10
+# Last good copies served while the database is down; see apps/main/page_cache.py.
+PAGE_STALE_TIMEOUT = 60 * 60 * 24
+
+# Fail fast instead of connecting after this many connection failures in a
+# row, and probe the database in the background; see apps/main/db_circuit.py.
+DB_CIRCUIT_FAILURES = int(os.environ.get('DB_CIRCUIT_FAILURES', 3))
+DB_CIRCUIT_PROBE_INTERVAL = int(os.environ.get('DB_CIRCUIT_PROBE_INTERVAL', 5))
+
+RELATED_PRODUCTS_K = 8
+RELATED_PRODUCTS_CANDIDATES = 200
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
 THUMBNAIL_SIZE = (300, 300)
 PRODUCT_IMAGE_SIZE = (800, 600)
 BLOG_IMAGE_SIZE = (1200, 600)
 
+# Widths of the resized copies made of every product/category/hero upload;
+# see apps/main/images.py.
+IMAGE_DERIVATIVE_WIDTHS = {
+    'card': THUMBNAIL_SIZE[0],
+    'detail': PRODUCT_IMAGE_SIZE[0],
+    'zoom': PRODUCT_IMAGE_SIZE[0] * 2,
+}
+IMAGE_DERIVATIVE_AVIF = os.environ.get('IMAGE_DERIVATIVE_AVIF', 'False') == 'True'
+
 DEFAULT_META_DESCRIPTION = "Eyedentity Eyewear - Premium eyewear solutions in Harare, Zimbabwe. Stylish, protective, and uniquely you."
 DEFAULT_META_KEYWORDS = "eyewear, glasses, sunglasses, Harare, Zimbabwe, blue light, photochromic, polarized"
 
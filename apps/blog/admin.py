@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from .models import BlogCategory, BlogPost, Tag, BlogComment
+from .comments import comments_changed
 
 
 @admin.register(BlogCategory)
@@ -170,12 +171,16 @@ class BlogCommentAdmin(admin.ModelAdmin):
     actions = ['approve_comments', 'unapprove_comments']
     
     def approve_comments(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
         updated = queryset.update(is_approved=True)
+        comments_changed(post_ids)
         self.message_user(request, f'{updated} comments approved.')
     approve_comments.short_description = 'Approve selected comments'
     
     def unapprove_comments(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
         updated = queryset.update(is_approved=False)
+        comments_changed(post_ids)
         self.message_user(request, f'{updated} comments unapproved.')
     unapprove_comments.short_description = 'Unapprove selected comments'
 
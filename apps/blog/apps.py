@@ -4,3 +4,6 @@ class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.blog'
     verbose_name = 'Blog Application'
+
+    def ready(self):
+        import apps.blog.signals
@@ -0,0 +1,109 @@
+"""
+Threaded comments for blog posts.
+
+All approved comments of a post are loaded in a single query and assembled
+into a tree in memory; replies to comments that are not approved are left
+out with their parent. The tree is cached per post as plain dicts and
+paginated by top-level thread without touching the database, so a post
+page costs at most one comment query per change instead of one per
+nesting level.
+
+``comments_changed`` rebuilds the cached tree and stores its size in the
+denormalized ``BlogPost.comment_count`` shown in listings. The comment
+signals call it on save/delete, and the admin calls it after bulk
+approve/unapprove, which bypasses signals.
+"""
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from apps.main.cache_tags import bump_tags
+
+
+COMMENTS_PER_PAGE = 20
+COMMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+validate_http_url = URLValidator(schemes=['http', 'https'])
+
+
+def http_url(value):
+    """``value`` if it is an http(s) URL, else ''; commenters can link nothing else."""
+    try:
+        validate_http_url(value or '')
+    except ValidationError:
+        return ''
+    return value
+
+
+def comment_cache_key(post_id):
+    return f'blog_comments:{post_id}'
+
+
+def load_comment_tree(post_id):
+    """Approved comments of a post as nested dicts, newest thread first."""
+    from .models import BlogComment
+
+    rows = BlogComment.objects.filter(post_id=post_id, is_approved=True).order_by('created_at', 'id').values(
+        'id', 'parent_id', 'name', 'website', 'content', 'created_at',
+    )
+    nodes = {}
+    threads = []
+    for row in rows:
+        nodes[row['id']] = node = {**row, 'replies': []}
+        if row['parent_id'] is None:
+            threads.append(node)
+    count = len(threads)
+    for node in nodes.values():
+        parent_id = node['parent_id']
+        if parent_id is not None and parent_id in nodes:
+            nodes[parent_id]['replies'].append(node)
+    # Only replies reachable from a thread are shown (and counted).
+    stack = list(threads)
+    while stack:
+        node = stack.pop()
+        count += len(node['replies'])
+        stack.extend(node['replies'])
+    threads.reverse()
+    return {'threads': threads, 'count': count}
+
+
+def get_comment_tree(post_id):
+    key = comment_cache_key(post_id)
+    tree = cache.get(key)
+    if tree is None:
+        tree = load_comment_tree(post_id)
+        cache.set(key, tree, COMMENT_CACHE_TIMEOUT)
+    return tree
+
+
+def get_comment_page(post, page_number=1, per_page=COMMENTS_PER_PAGE):
+    """Page of top-level threads (with all their replies) plus the total count."""
+    tree = get_comment_tree(post.pk)
+    page = Paginator(tree['threads'], per_page).get_page(page_number)
+    return page, tree['count']
+
+
+def refresh_comments(post_id):
+    """Rebuild and cache a post's tree; store its count on the post."""
+    from .models import BlogPost
+
+    tree = load_comment_tree(post_id)
+    cache.set(comment_cache_key(post_id), tree, COMMENT_CACHE_TIMEOUT)
+    BlogPost.objects.filter(pk=post_id).exclude(comment_count=tree['count']).update(comment_count=tree['count'])
+    return tree
+
+
+def comments_changed(post_ids, using=None):
+    """Refresh counts and cached trees once the change has committed."""
+    post_ids = set(post_ids)
+
+    def refresh():
+        for post_id in post_ids:
+            refresh_comments(post_id)
+        bump_tags('blog')
+
+    transaction.on_commit(refresh, using=using)
@@ -0,0 +1,199 @@
+"""
+Save-time processing of blog post HTML.
+
+``BlogPost.save`` runs the CKEditor HTML through :func:`process_content`
+once. A single pass of the standard library's streaming ``HTMLParser``
+produces everything the site needs, stored on the post so no view or admin
+page has to parse the content again:
+
+* ``word_count`` and ``read_time`` (at ``WORDS_PER_MINUTE``);
+* ``plain_text``, the tag-free text the search index uses;
+* ``rendered_html``: the content with ``loading="lazy"`` and
+  ``decoding="async"`` on images, ``width``/``height`` filled in from the
+  image file where the editor left them out, and an ``id`` on every
+  ``<h2>``-``<h4>``;
+* ``toc``, the headings as ``[{'level', 'id', 'text'}]`` for the table of
+  contents.
+"""
+
+import html
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.text import slugify
+
+
+WORDS_PER_MINUTE = 200
+TOC_LEVELS = ('h2', 'h3', 'h4')
+SKIP_TEXT = ('script', 'style', 'template')
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'source', 'track', 'wbr',
+}
+# Text in these ends a word, so "one</p><p>two" counts as two words.
+BLOCK_ELEMENTS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'li', 'ol', 'p', 'pre', 'section', 'table', 'td', 'th',
+    'tr', 'ul',
+}
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+@dataclass
+class ProcessedContent:
+    word_count: int = 0
+    read_time: int = 1
+    plain_text: str = ''
+    rendered_html: str = ''
+    toc: list = field(default_factory=list)
+
+
+def _attrs_html(attrs):
+    return ''.join(
+        f' {name}' if value is None else f' {name}="{html.escape(value, quote=True)}"'
+        for name, value in attrs
+    )
+
+
+def image_size(src):
+    """Intrinsic (width, height) of an image in media storage, or None."""
+    media_url = settings.MEDIA_URL or ''
+    if not src or not media_url or not src.startswith(media_url):
+        return None
+    from PIL import Image
+
+    try:
+        with default_storage.open(src[len(media_url):], 'rb') as f:
+            # Only the header is read; the pixels are never decoded.
+            return Image.open(f).size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+class ContentProcessor(HTMLParser):
+    def __init__(self, image_size=image_size):
+        super().__init__(convert_charrefs=True)
+        self.image_size = image_size
+        self.out = []
+        self.text = []
+        self.skip_depth = 0
+        self.heading = None
+        self.toc = []
+        self.ids = set()
+
+    # -- output -------------------------------------------------------------
+
+    def emit(self, chunk):
+        (self.heading['inner'] if self.heading else self.out).append(chunk)
+
+    def unique_id(self, text):
+        base = slugify(text)[:60] or 'section'
+        anchor, n = base, 2
+        while anchor in self.ids:
+            anchor, n = f'{base}-{n}', n + 1
+        self.ids.add(anchor)
+        return anchor
+
+    # -- parser callbacks ---------------------------------------------------
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TEXT:
+            self.skip_depth += 1
+        if tag in BLOCK_ELEMENTS:
+            self.text.append(' ')
+        if tag == 'img':
+            attrs = self.image_attrs(attrs)
+        if tag in TOC_LEVELS and self.heading is None:
+            self.heading = {'tag': tag, 'attrs': attrs, 'inner': [], 'text': []}
+            return
+        self.emit(f'<{tag}{_attrs_html(attrs)}>')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_ELEMENTS:
+            self.text.append(' ')
+        if tag == 'img':
+            attrs = self.image_attrs(attrs)
+        self.emit(f'<{tag}{_attrs_html(attrs)}>')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TEXT and self.skip_depth:
+            self.skip_depth -= 1
+        if tag in BLOCK_ELEMENTS:
+            self.text.append(' ')
+        if self.heading is not None and tag == self.heading['tag']:
+            self.close_heading()
+            return
+        if tag not in VOID_ELEMENTS:
+            self.emit(f'</{tag}>')
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            self.emit(data)
+            return
+        self.emit(html.escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading['text'].append(data)
+
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        pass
+
+    # -- element rewrites ---------------------------------------------------
+
+    def image_attrs(self, attrs):
+        values = dict(attrs)
+        attrs = list(attrs)
+        if not (values.get('width') and values.get('height')):
+            size = self.image_size(values.get('src'))
+            if size:
+                width, height = size
+                if (values.get('width') or '').isdigit():
+                    # Keep the editor's width; scale the height to match.
+                    height = max(1, round(height * int(values['width']) / width))
+                    width = int(values['width'])
+                attrs = [(name, value) for name, value in attrs if name not in ('width', 'height')]
+                attrs += [('width', str(width)), ('height', str(height))]
+        present = {name for name, value in attrs}
+        attrs += [(name, value) for name, value in (('loading', 'lazy'), ('decoding', 'async')) if name not in present]
+        return attrs
+
+    def close_heading(self):
+        heading, self.heading = self.heading, None
+        text = WHITESPACE_RE.sub(' ', ''.join(heading['text'])).strip()
+        attrs = dict(heading['attrs'])
+        anchor = attrs.get('id') or self.unique_id(text)
+        self.ids.add(anchor)
+        attrs = [(name, value) for name, value in heading['attrs'] if name != 'id'] + [('id', anchor)]
+        self.out.append(f'<{heading["tag"]}{_attrs_html(attrs)}>')
+        self.out.extend(heading['inner'])
+        self.out.append(f'</{heading["tag"]}>')
+        if text:
+            self.toc.append({'level': int(heading['tag'][1]), 'id': anchor, 'text': text})
+
+    def result(self):
+        self.close()
+        if self.heading is not None:
+            self.close_heading()
+        plain_text = WHITESPACE_RE.sub(' ', ''.join(self.text)).strip()
+        words = len(plain_text.split()) if plain_text else 0
+        return ProcessedContent(
+            word_count=words,
+            read_time=max(1, round(words / WORDS_PER_MINUTE)),
+            plain_text=plain_text,
+            rendered_html=''.join(self.out),
+            toc=self.toc,
+        )
+
+
+def process_content(content, image_size=image_size):
+    """Parse post HTML once; see the module docstring for what comes back."""
+    processor = ContentProcessor(image_size=image_size)
+    processor.feed(content or '')
+    return processor.result()
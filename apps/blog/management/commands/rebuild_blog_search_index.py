@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from apps.blog.models import BlogPost
+from apps.blog.search import get_search_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text blog search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of posts indexed per batch (default: 200)')
+        parser.add_argument('--database', default='default',
+                            help='Database alias to rebuild (default: default)')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        if backend.name == 'basic':
+            self.stdout.write(self.style.WARNING(
+                'The basic search backend has no index; nothing to rebuild.'
+            ))
+            return
+
+        total = rebuild_index(
+            BlogPost.objects.using(options['database']),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} posts with the {backend.name} search backend.'
+        ))
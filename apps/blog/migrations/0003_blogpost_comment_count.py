@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-16 21:40
+
+from django.db import migrations, models
+
+
+def backfill_comment_counts(apps, schema_editor):
+    """Approved comments reachable from an approved top-level comment"""
+    BlogComment = apps.get_model('blog', 'BlogComment')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    db = schema_editor.connection.alias
+    parents = {}
+    posts = {}
+    for pk, post_id, parent_id in BlogComment.objects.using(db).filter(is_approved=True).values_list('pk', 'post_id', 'parent_id'):
+        parents[pk] = parent_id
+        posts[pk] = post_id
+
+    def visible(pk):
+        while pk is not None:
+            if pk not in parents:
+                return False
+            pk = parents[pk]
+        return True
+
+    counts = {}
+    for pk, post_id in posts.items():
+        if visible(pk):
+            counts[post_id] = counts.get(post_id, 0) + 1
+    for post_id, count in counts.items():
+        BlogPost.objects.using(db).filter(pk=post_id).update(comment_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_alter_blogpost_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Migration creating the full-text blog search index (see apps/blog/search.py)
+
+import html
+import re
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS blog_blogpostsearch (
+        post_id bigint PRIMARY KEY REFERENCES blog_blogpost (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL,
+        body text NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS blog_blogpostsearch_document_gin ON blog_blogpostsearch USING gin (document)",
+]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS blog_blogpostsearch USING fts5(
+        title, excerpt, body, tags,
+        tokenize = 'porter unicode61'
+    )
+    """,
+]
+
+
+BATCH_SIZE = 500
+
+# The indexing code is frozen here, as it stood at this migration, so later
+# changes to apps/blog/search.py or BlogPost cannot break it. It runs on
+# the historical BlogPost, which has no plain_text field yet.
+WHITESPACE_RE = re.compile(r'\s+')
+
+POSTGRES_INSERT = (
+    "INSERT INTO blog_blogpostsearch (post_id, document, body) "
+    "SELECT id, "
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', excerpt), 'B') || "
+    "setweight(to_tsvector('english', body), 'C') || "
+    "setweight(to_tsvector('english', tags), 'D'), body "
+    "FROM (SELECT %s::bigint AS id, %s::text AS title, %s::text AS excerpt, "
+    "%s::text AS body, %s::text AS tags) AS doc "
+    "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document, body = EXCLUDED.body"
+)
+
+SQLITE_INSERT = "INSERT INTO blog_blogpostsearch (rowid, title, excerpt, body, tags) VALUES (%s, %s, %s, %s, %s)"
+
+
+def build_document(post):
+    tags = [tag.name for tag in post.tags.all()]
+    if post.category_id:
+        tags.append(post.category.name)
+    body = WHITESPACE_RE.sub(' ', html.unescape(strip_tags(post.content or ''))).strip()
+    return (post.pk, post.title, post.excerpt, body, ' '.join(tags))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_CREATE
+    elif vendor == 'sqlite':
+        statements = SQLITE_CREATE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    posts = BlogPost.objects.using(schema_editor.connection.alias).select_related('category').prefetch_related('tags')
+    insert = POSTGRES_INSERT if vendor == 'postgresql' else SQLITE_INSERT
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for post in posts.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+            rows.append(build_document(post))
+            if len(rows) >= BATCH_SIZE:
+                cursor.executemany(insert, rows)
+                rows = []
+        if rows:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP TABLE IF EXISTS blog_blogpostsearch")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_blogpost_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+from apps.blog.content import process_content
+
+
+def backfill_rendered_content(apps, schema_editor):
+    """Process the content of existing posts once"""
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    db = schema_editor.connection.alias
+    for post in BlogPost.objects.using(db).only('pk', 'content', 'read_time').iterator():
+        processed = process_content(post.content)
+        BlogPost.objects.using(db).filter(pk=post.pk).update(
+            word_count=processed.word_count,
+            read_time=processed.read_time if post.content else post.read_time,
+            plain_text=processed.plain_text,
+            rendered_html=processed.rendered_html,
+            toc=processed.toc,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_blog_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='plain_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rendered_content, migrations.RunPython.noop),
+    ]
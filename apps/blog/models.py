@@ -4,6 +4,14 @@ from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
 
+from apps.main.counters import WriteBehindCounter
+
+from .content import process_content
+
+
+# Buffered ``BlogPost.views`` increments, keyed by slug (see counters.py).
+post_views = WriteBehindCounter('blog_views', 'blog.BlogPost', 'views', lookup='slug', filters={'is_published': True})
+
 
 class BlogCategory(models.Model):
     name = models.CharField(max_length=100)
@@ -62,7 +70,14 @@ class BlogPost(models.Model):
     is_published = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     views = models.IntegerField(default=0)
+    # Approved comments; kept current by comments.comments_changed.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     read_time = models.PositiveIntegerField(default=5, help_text="Estimated read time in minutes")
+    # Derived from ``content`` on save (see content.py).
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    plain_text = models.TextField(blank=True, editable=False)
+    rendered_html = models.TextField(blank=True, editable=False)
+    toc = models.JSONField(default=list, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(blank=True, null=True)
@@ -81,27 +96,39 @@ class BlogPost(models.Model):
             self.published_at = timezone.now()
         if not self.meta_description and self.excerpt:
             self.meta_description = self.excerpt[:160]
-        if self.content:
-            import re
-            clean_content = re.sub('<.*?>', '', self.content)
-            word_count = len(clean_content.split())
-            self.read_time = max(1, round(word_count / 200))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.refresh_rendered_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'word_count', 'read_time', 'plain_text', 'rendered_html', 'toc'}
         super().save(*args, **kwargs)
 
+    def refresh_rendered_content(self):
+        """Refresh the fields derived from ``content``"""
+        processed = process_content(self.content)
+        self.word_count = processed.word_count
+        self.plain_text = processed.plain_text
+        self.rendered_html = processed.rendered_html
+        self.toc = processed.toc
+        if self.content:
+            self.read_time = processed.read_time
+
     def get_absolute_url(self):
         return reverse('blog_detail', kwargs={'slug': self.slug})
 
     def increment_views(self):
+        """Count a view; written to the database in batches by ``post_views``"""
         self.views += 1
-        self.save(update_fields=['views'])
+        post_views.incr(self.slug)
 
     def get_related_posts(self, count=3):
         related_posts = BlogPost.objects.filter(
-            category=self.category,
+            category_id=self.category_id,
             is_published=True
-        ).exclude(id=self.id)
-        if self.tags.exists():
-            tag_ids = list(self.tags.values_list('id', flat=True))
+        ).exclude(id=self.id).select_related('category')
+        # all() so a prefetched tag list costs no query.
+        tag_ids = [tag.id for tag in self.tags.all()]
+        if tag_ids:
             related_posts = related_posts.filter(tags__in=tag_ids).distinct()
         return related_posts.order_by('-published_at', '-created_at')[:count]
 
@@ -111,14 +138,6 @@ class BlogPost(models.Model):
             return "1 min read"
         return f"{self.read_time} min read"
 
-    @property
-    def word_count(self):
-        if self.content:
-            import re
-            clean_content = re.sub('<.*?>', '', self.content)
-            return len(clean_content.split())
-        return 0
-
 
 class BlogComment(models.Model):
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='comments')
@@ -0,0 +1,350 @@
+"""
+Full-text blog search.
+
+Posts are indexed into a ``blog_blogpostsearch`` table that the 0004
+migration creates per database vendor, over their tag-stripped content:
+
+* PostgreSQL: a ``tsvector`` weighted title (A) > excerpt (B) > body (C) >
+  tags and category (D) with a GIN index, ranked with ``ts_rank`` and
+  highlighted with ``ts_headline``.
+* SQLite: an FTS5 virtual table ranked with ``bm25`` using the same order
+  of weights, highlighted with ``snippet()``.
+
+Any other database, or ``BLOG_SEARCH_BACKEND = 'basic'``, falls back to
+``icontains`` over the post fields with the snippet cut in Python. Queries
+are parsed with the product search's ``parse_query`` and its term synonyms,
+which keep the original term in their group. Synonym phrases stay as their
+words: posts are not indexed with the product phrase tokens, so
+"anti-glare" searches for "anti" and "glare".
+
+The index is kept current by the signals in ``apps.blog.signals`` (post
+saves, tag changes, tag and category renames); ``rebuild_blog_search_index``
+rebuilds it from scratch.
+"""
+
+import html
+import re
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from apps.main.search import parse_query
+
+
+SEARCH_TABLE = 'blog_blogpostsearch'
+SNIPPET_WORDS = 30
+
+# Backends mark matches with these; they are swapped for <mark> after the
+# snippet has been HTML-escaped.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def plain_text(content):
+    """Post HTML as plain text: tags stripped, entities decoded, spaces collapsed."""
+    return WHITESPACE_RE.sub(' ', html.unescape(strip_tags(content or ''))).strip()
+
+
+def build_document(post):
+    """Return the (title, excerpt, body, tags) fields to index."""
+    tags = [tag.name for tag in post.tags.all()]
+    if post.category_id:
+        tags.append(post.category.name)
+    return (post.title, post.excerpt, post.plain_text or plain_text(post.content), ' '.join(tags))
+
+
+def render_snippet(marked):
+    """Escape a snippet and turn the match markers into <mark> tags."""
+    text = escape(marked).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(text)
+
+
+def cut_snippet(text, groups, words=SNIPPET_WORDS):
+    """Python snippet: the ``words`` words around the first matching term."""
+    terms = [term for group in groups for term in group]
+    if not text or not terms:
+        return ''
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    tokens = text.split(' ')
+    first = next((i for i, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(0, first - words // 3)
+    window = ' '.join(tokens[start:start + words])
+    marked = pattern.sub(lambda m: MARK_START + m.group(0) + MARK_END, window)
+    prefix = '… ' if start else ''
+    suffix = ' …' if start + words < len(tokens) else ''
+    return prefix + marked + suffix
+
+
+class BasicBlogSearch:
+    """``icontains`` search, used where no full-text index is available."""
+
+    name = 'basic'
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def search(self, queryset, query, with_rank=True):
+        from .models import BlogPost
+
+        groups = parse_query(query, phrases=False)
+        if not groups:
+            return queryset.none()
+        for group in groups:
+            condition = Q()
+            for term in group:
+                # Tags go through a subquery so the result needs no DISTINCT.
+                tagged = BlogPost.tags.through.objects.filter(tag__name__icontains=term).values('blogpost_id')
+                condition |= (
+                    Q(title__icontains=term) |
+                    Q(excerpt__icontains=term) |
+                    Q(content__icontains=term) |
+                    Q(category__name__icontains=term) |
+                    Q(pk__in=tagged)
+                )
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def order_by_rank(self, queryset):
+        if 'search_rank' in queryset.query.annotations:
+            return queryset.order_by(F('search_rank').desc(nulls_last=True), '-published_at', '-created_at')
+        return queryset.order_by('-published_at', '-created_at')
+
+    def snippets(self, posts, query):
+        groups = parse_query(query, phrases=False)
+        return {post.pk: cut_snippet(post.plain_text or plain_text(post.content), groups) for post in posts}
+
+    def index_posts(self, posts):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+
+class PostgresBlogSearch(BasicBlogSearch):
+    """Weighted ``tsvector`` search ranked with ``ts_rank``."""
+
+    name = 'postgres'
+    config = 'english'
+
+    def to_tsquery(self, groups):
+        return ' & '.join(
+            '(' + ' | '.join(f'{term}:*' for term in group) + ')'
+            for group in groups
+        )
+
+    def search(self, queryset, query, with_rank=True):
+        groups = parse_query(query, phrases=False)
+        if not groups:
+            return queryset.none()
+        tsquery = self.to_tsquery(groups)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f"SELECT post_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('{self.config}', %s)",
+            [tsquery],
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank(s.document, to_tsquery('{self.config}', %s)) "
+            f"FROM {SEARCH_TABLE} s WHERE s.post_id = {table}.id",
+            [tsquery],
+        )
+        queryset = queryset.filter(id__in=matches)
+        return queryset.annotate(search_rank=rank) if with_rank else queryset
+
+    def snippets(self, posts, query):
+        groups = parse_query(query, phrases=False)
+        ids = [post.pk for post in posts]
+        if not groups or not ids:
+            return {}
+        options = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=15, MaxFragments=2'
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT post_id, ts_headline('{self.config}', body, to_tsquery('{self.config}', %s), %s) "
+                f"FROM {SEARCH_TABLE} WHERE post_id = ANY(%s)",
+                [self.to_tsquery(groups), options, ids],
+            )
+            return dict(cursor.fetchall())
+
+    def index_posts(self, posts):
+        rows = [(post.pk, *build_document(post)) for post in posts]
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (post_id, document, body) "
+                f"SELECT id, "
+                f"setweight(to_tsvector('{self.config}', title), 'A') || "
+                f"setweight(to_tsvector('{self.config}', excerpt), 'B') || "
+                f"setweight(to_tsvector('{self.config}', body), 'C') || "
+                f"setweight(to_tsvector('{self.config}', tags), 'D'), body "
+                f"FROM (SELECT %s::bigint AS id, %s::text AS title, %s::text AS excerpt, "
+                f"%s::text AS body, %s::text AS tags) AS doc "
+                f"ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document, body = EXCLUDED.body",
+                rows,
+            )
+
+    def remove_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE post_id = ANY(%s)", [post_ids])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+class SQLiteBlogSearch(BasicBlogSearch):
+    """FTS5 search ranked with ``bm25`` (title > excerpt > body > tags)."""
+
+    name = 'sqlite'
+    weights = '10.0, 4.0, 2.0, 1.0'
+    # bm25 normalizes by the length of the whole row and saturates, so with
+    # long post bodies weights alone cannot keep title matches first. Title
+    # and excerpt matches get a tier bonus well above any bm25 score.
+    tier_bonus = {'title': 2000, 'excerpt': 1000}
+    body_column = 2
+
+    def to_match(self, groups):
+        return ' AND '.join(
+            '(' + ' OR '.join(f'"{term}"*' for term in group) + ')'
+            for group in groups
+        )
+
+    def search(self, queryset, query, with_rank=True):
+        groups = parse_query(query, phrases=False)
+        if not groups:
+            return queryset.none()
+        match = self.to_match(groups)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [match],
+        )
+        # bm25() is lower-is-better; negate it so every backend sorts descending.
+        tiers = ' + '.join(
+            f"CASE WHEN rowid IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s) "
+            f"THEN {bonus} ELSE 0 END"
+            for bonus in self.tier_bonus.values()
+        )
+        rank = RawSQL(
+            f"SELECT -bm25({SEARCH_TABLE}, {self.weights}) + {tiers} FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+            [*(f'{column} : ({match})' for column in self.tier_bonus), match],
+        )
+        queryset = queryset.filter(id__in=matches)
+        return queryset.annotate(search_rank=rank) if with_rank else queryset
+
+    def snippets(self, posts, query):
+        groups = parse_query(query, phrases=False)
+        ids = [post.pk for post in posts]
+        if not groups or not ids:
+            return {}
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({SEARCH_TABLE}, {self.body_column}, %s, %s, '…', {SNIPPET_WORDS}) "
+                f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"AND rowid IN ({', '.join(['%s'] * len(ids))})",
+                [MARK_START, MARK_END, self.to_match(groups), *ids],
+            )
+            return dict(cursor.fetchall())
+
+    def index_posts(self, posts):
+        rows = [(post.pk, *build_document(post)) for post in posts]
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, excerpt, body, tags) "
+                f"VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_posts(self, post_ids):
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in post_ids])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+BACKENDS = {
+    'basic': BasicBlogSearch,
+    'postgresql': PostgresBlogSearch,
+    'postgres': PostgresBlogSearch,
+    'sqlite': SQLiteBlogSearch,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """Return the search backend for ``using``, honouring BLOG_SEARCH_BACKEND."""
+    name = getattr(settings, 'BLOG_SEARCH_BACKEND', None) or connections[using].vendor
+    return BACKENDS.get(name, BasicBlogSearch)(using=using)
+
+
+def search_posts(queryset, query, with_rank=True):
+    """Filter ``queryset`` by ``query`` and annotate ``search_rank`` where supported."""
+    return get_search_backend(queryset.db).search(queryset, query, with_rank=with_rank)
+
+
+def order_by_relevance(queryset):
+    return get_search_backend(queryset.db).order_by_rank(queryset)
+
+
+def attach_snippets(posts, query, using=DEFAULT_DB_ALIAS):
+    """Set ``search_snippet`` (safe HTML with <mark>ed matches) on each post."""
+    posts = list(posts)
+    snippets = get_search_backend(using).snippets(posts, query)
+    groups = parse_query(query, phrases=False)
+    for post in posts:
+        marked = snippets.get(post.pk) or ''
+        if MARK_START not in marked:
+            # Matched on the title, excerpt or tags only: show the excerpt.
+            marked = cut_snippet(post.excerpt, groups) or post.excerpt
+        post.search_snippet = render_snippet(marked)
+    return posts
+
+
+def indexable_posts(queryset):
+    return queryset.select_related('category').prefetch_related('tags')
+
+
+def reindex_posts(post_ids, using=DEFAULT_DB_ALIAS):
+    """Refresh the index rows for ``post_ids``, dropping any that no longer exist."""
+    from .models import BlogPost
+
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    backend = get_search_backend(using)
+    posts = list(indexable_posts(BlogPost.objects.using(using).filter(pk__in=post_ids)))
+    backend.index_posts(posts)
+    backend.remove_posts(post_ids - {post.pk for post in posts})
+
+
+def rebuild_index(queryset, batch_size=200):
+    """Clear the index and re-add every post in ``queryset``. Returns the count."""
+    backend = get_search_backend(queryset.db)
+    backend.clear()
+    total = 0
+    batch = []
+    for post in indexable_posts(queryset).order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            backend.index_posts(batch)
+            total += len(batch)
+            batch = []
+    backend.index_posts(batch)
+    return total + len(batch)
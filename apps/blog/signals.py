@@ -0,0 +1,91 @@
+import logging
+
+from django.db import transaction, DatabaseError
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+
+from apps.main.cache_tags import bump_tags
+from apps.main.static_sitemaps import schedule_sitemap_build
+from .comments import comments_changed
+from .search import reindex_posts
+from .models import BlogPost, BlogCategory, Tag, BlogComment
+
+logger = logging.getLogger(__name__)
+
+# BlogComment is handled by comment_changed, which bumps the tag itself.
+BLOG_MODELS = [BlogPost, BlogCategory, Tag]
+
+def bump_blog_cache_tag(sender, **kwargs):
+    """Retire cached blog pages once the change is committed"""
+    # View counter bumps should not flush every cached blog page.
+    if kwargs.get('update_fields') == frozenset(['views']):
+        return
+    if kwargs.get('action', 'post_').startswith('post_'):
+        transaction.on_commit(lambda: bump_tags('blog'), using=kwargs.get('using'))
+
+for model in BLOG_MODELS:
+    post_save.connect(bump_blog_cache_tag, sender=model, dispatch_uid=f'cache_tags_save_{model._meta.label}')
+    post_delete.connect(bump_blog_cache_tag, sender=model, dispatch_uid=f'cache_tags_delete_{model._meta.label}')
+m2m_changed.connect(bump_blog_cache_tag, sender=BlogPost.tags.through, dispatch_uid='cache_tags_m2m_blogpost_tags')
+
+
+def comment_changed(sender, instance, **kwargs):
+    """Refresh the post's comment count and cached comment tree"""
+    comments_changed([instance.post_id], using=kwargs.get('using'))
+
+post_save.connect(comment_changed, sender=BlogComment, dispatch_uid='blog_comment_saved')
+post_delete.connect(comment_changed, sender=BlogComment, dispatch_uid='blog_comment_deleted')
+
+
+def schedule_search_reindex(post_ids, using):
+    """Refresh the search index rows for ``post_ids`` once the transaction commits"""
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+
+    def reindex():
+        try:
+            reindex_posts(post_ids, using=using)
+        except DatabaseError as e:
+            logger.warning("Could not update blog search index: %s", e)
+
+    transaction.on_commit(reindex, using=using)
+
+def update_post_search_index(sender, instance, using, **kwargs):
+    """Keep the post's search document in sync with the row"""
+    schedule_search_reindex([instance.pk], using)
+
+def update_post_tags_search_index(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Re-index posts whose tag list changed"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_search_reindex([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._search_cleared_posts = list(instance.blogpost_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        schedule_search_reindex(instance.__dict__.pop('_search_cleared_posts', []), using)
+    elif action in ('post_add', 'post_remove'):
+        schedule_search_reindex(pk_set or [], using)
+
+def update_tag_search_index(sender, instance, using, **kwargs):
+    """Tag and category names are part of each post's search document"""
+    posts = instance.blogpost_set if sender is Tag else instance.posts
+    schedule_search_reindex(posts.values_list('pk', flat=True), using)
+
+post_save.connect(update_post_search_index, sender=BlogPost, dispatch_uid='blog_search_post_saved')
+post_delete.connect(update_post_search_index, sender=BlogPost, dispatch_uid='blog_search_post_deleted')
+m2m_changed.connect(update_post_tags_search_index, sender=BlogPost.tags.through, dispatch_uid='blog_search_post_tags')
+post_save.connect(update_tag_search_index, sender=Tag, dispatch_uid='blog_search_tag_saved')
+# Deleting a tag drops its through rows without m2m_changed.
+pre_delete.connect(update_tag_search_index, sender=Tag, dispatch_uid='blog_search_tag_deleted')
+post_save.connect(update_tag_search_index, sender=BlogCategory, dispatch_uid='blog_search_category_saved')
+
+
+def sitemap_content_changed(sender, using, **kwargs):
+    """Queue a debounced rebuild of the prebuilt sitemaps"""
+    if kwargs.get('update_fields') == frozenset(['views']):
+        return
+    schedule_sitemap_build(using=using)
+
+for model in (BlogPost, BlogCategory):
+    post_save.connect(sitemap_content_changed, sender=model, dispatch_uid=f'sitemap_save_{model._meta.label}')
+    post_delete.connect(sitemap_content_changed, sender=model, dispatch_uid=f'sitemap_delete_{model._meta.label}')
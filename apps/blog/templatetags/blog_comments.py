@@ -0,0 +1,11 @@
+from django import template
+
+from apps.blog.comments import http_url as clean_http_url
+
+register = template.Library()
+
+
+@register.filter
+def http_url(value):
+    """``value`` if it is an http(s) URL, else ''; for commenter links."""
+    return clean_http_url(value)
@@ -1,3 +1,243 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 
-# Create your tests here.
+from apps.main.testing import QueryBudgetMixin, requires_template, seed_catalog, seed_blog
+from apps.main.tests import QUERY_BUDGET_SETTINGS
+
+from .models import BlogComment, BlogPost, post_views
+from .comments import get_comment_page, load_comment_tree
+from .content import process_content
+from .search import reindex_posts, search_posts
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class BlogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Every URL in apps/blog/urls.py against a cold cache, with the same
+    budgets for 10 and 10,000 posts (LargeBlogQueryBudgetTests).
+    """
+
+    rows = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=10)
+        seeded = seed_blog(posts=cls.rows)
+        cls.post = seeded['post']
+        cls.category = seeded['category']
+        cls.tag = seeded['tag']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_blog_list(self):
+        self.assertQueryBudget(8, '/blog/')
+
+    def test_blog_list_category(self):
+        self.assertQueryBudget(8, '/blog/', data={'category': self.category.slug})
+
+    def test_blog_list_search(self):
+        self.assertQueryBudget(8, '/blog/', data={'search': 'guide'})
+
+    def test_blog_list_last_page(self):
+        self.assertQueryBudget(8, '/blog/', data={'page': 'last'})
+
+    def test_blog_search(self):
+        self.assertQueryBudget(8, '/blog/search/', data={'q': 'frames'})
+
+    def test_blog_detail(self):
+        self.assertQueryBudget(9, f'/blog/{self.post.slug}/')
+
+    def test_blog_detail_comment_page(self):
+        self.assertQueryBudget(9, f'/blog/{self.post.slug}/', data={'comments_page': 2})
+
+    def test_post_comment(self):
+        self.assertQueryBudget(
+            4, f'/blog/{self.post.slug}/', method='post', status=302,
+            data={'submit_comment': '1', 'name': 'Reader', 'email': 'reader@example.com', 'content': 'Thanks'},
+        )
+
+    @requires_template('blog/blog_category.html')
+    def test_blog_category(self):
+        self.assertQueryBudget(6, f'/blog/category/{self.category.slug}/')
+
+    @requires_template('blog/blog_tag.html')
+    def test_blog_tag(self):
+        self.assertQueryBudget(6, f'/blog/tag/{self.tag.slug}/')
+
+    def test_popular_posts(self):
+        self.assertQueryBudget(2, '/blog/api/popular/')
+
+    def test_recent_posts(self):
+        self.assertQueryBudget(2, '/blog/api/recent/')
+
+
+class LargeBlogQueryBudgetTests(BlogQueryBudgetTests):
+    rows = 10000
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class BlogSearchTests(TestCase):
+    """Product synonym phrases do not hide posts that use the phrase."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_blog(posts=3)
+        cls.post = BlogPost.objects.create(
+            title='Why anti-glare coating matters', slug='why-anti-glare', author=User.objects.get(),
+            category=seeded['category'],
+            content='<p>Fewer reflections on screens.</p>', excerpt='Coatings explained', is_published=True,
+        )
+        reindex_posts([cls.post.pk])
+
+    def test_phrase_synonyms(self):
+        for backend in ['sqlite', 'basic']:
+            for query in ['anti-glare', 'anti glare', 'Anti-Glare coating']:
+                with self.subTest(backend=backend, query=query), self.settings(BLOG_SEARCH_BACKEND=backend):
+                    found = search_posts(BlogPost.objects.all(), query, with_rank=False)
+                    self.assertEqual(list(found), [self.post])
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class PostViewCountTests(TestCase):
+    """Views are counted for published posts only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=2)
+        cls.post = seed_blog(posts=2)['post']
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCounted(self, slug, status, counted):
+        before = post_views.unflushed(slug)
+        self.assertEqual(self.client.get(f'/blog/{slug}/').status_code, status)
+        self.assertEqual(post_views.unflushed(slug) - before, counted)
+
+    def test_published_post_counted(self):
+        self.assertCounted(self.post.slug, 200, 1)
+
+    def test_missing_post_not_counted(self):
+        self.assertCounted('no-such-post', 404, 0)
+
+    def test_unpublished_post_not_counted(self):
+        BlogPost.objects.filter(pk=self.post.pk).update(is_published=False)
+        self.assertCounted(self.post.slug, 404, 0)
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class CommentWebsiteTests(TestCase):
+    """Commenter websites are linked only when they are http(s) URLs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=2)
+        cls.post = seed_blog(posts=1, comments=0)['post']
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, website):
+        return self.client.post(f'/blog/{self.post.slug}/', {
+            'submit_comment': '1', 'name': 'Reader', 'email': 'reader@example.com',
+            'website': website, 'content': 'Thanks',
+        })
+
+    def test_script_url_dropped(self):
+        self.comment('javascript:alert(document.cookie)')
+        self.assertEqual(BlogComment.objects.get().website, '')
+        self.assertNotContains(self.client.get(f'/blog/{self.post.slug}/'), 'javascript:')
+
+    def test_http_url_linked(self):
+        self.comment('https://example.com/')
+        self.assertContains(self.client.get(f'/blog/{self.post.slug}/'), 'href="https://example.com/"')
+
+    def test_stored_script_url_not_linked(self):
+        BlogComment.objects.create(
+            post=self.post, name='Old', email='old@example.com', website='javascript:alert(1)',
+            content='Saved before the check', is_approved=True,
+        )
+        self.assertNotContains(self.client.get(f'/blog/{self.post.slug}/'), 'javascript:')
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class CommentTreeTests(TestCase):
+    """Comment threads are built in one query, cached, and paginated by thread."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=2)
+        cls.post = seed_blog(posts=1, comments=0)['post']
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, content, parent=None, approved=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BlogComment.objects.create(
+                post=self.post, parent=parent, name='Reader', email='reader@example.com',
+                content=content, is_approved=approved,
+            )
+
+    def test_tree(self):
+        first = self.comment('first')
+        reply = self.comment('reply', parent=first)
+        self.comment('nested', parent=reply)
+        hidden = self.comment('hidden', approved=False)
+        self.comment('reply to hidden', parent=hidden)
+        self.comment('second')
+        with self.assertNumQueries(1):
+            tree = load_comment_tree(self.post.pk)
+        self.assertEqual([thread['content'] for thread in tree['threads']], ['second', 'first'])
+        self.assertEqual(tree['threads'][1]['replies'][0]['replies'][0]['content'], 'nested')
+        # Replies under an unapproved comment are neither shown nor counted.
+        self.assertEqual(tree['count'], 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 4)
+
+    def test_pages_by_thread(self):
+        for i in range(3):
+            self.comment(f'thread {i}', parent=self.comment(f'top {i}'))
+        with self.assertNumQueries(0):
+            page, count = get_comment_page(self.post, 2, per_page=2)
+        self.assertEqual(count, 6)
+        self.assertEqual([thread['content'] for thread in page], ['top 0'])
+        self.assertEqual(page[0]['replies'][0]['content'], 'thread 0')
+        # Out-of-range pages fall back to the last one.
+        self.assertEqual(get_comment_page(self.post, 99, per_page=2)[0].number, 2)
+
+
+class ContentProcessingTests(SimpleTestCase):
+    """process_content: rendered HTML, plain text, word count and TOC in one pass."""
+
+    def test_text_stays_escaped(self):
+        processed = process_content('<p>1 &lt; 2 &amp; <b>bold</b><!-- note --></p>')
+        self.assertEqual(processed.rendered_html, '<p>1 &lt; 2 &amp; <b>bold</b></p>')
+        self.assertEqual(processed.plain_text, '1 < 2 & bold')
+
+    def test_attribute_values_escaped(self):
+        processed = process_content('<a href="/x?a=1&amp;b=&quot;2&quot;">link</a>')
+        self.assertEqual(processed.rendered_html, '<a href="/x?a=1&amp;b=&quot;2&quot;">link</a>')
+
+    def test_word_count(self):
+        processed = process_content('<p>one</p><p>two<br>three</p><script>var not_words = 1;</script>' + '<p>word</p>' * 400)
+        self.assertEqual(processed.word_count, 403)
+        self.assertEqual(processed.read_time, 2)
+        self.assertNotIn('not_words', processed.plain_text)
+        self.assertEqual(process_content('').word_count, 0)
+        self.assertEqual(process_content('').read_time, 1)
+
+    def test_headings(self):
+        processed = process_content('<h2>Care</h2><h3>Care</h3><h2 id="fit">Fit <em>guide</em></h2>')
+        self.assertEqual(processed.toc, [
+            {'level': 2, 'id': 'care', 'text': 'Care'},
+            {'level': 3, 'id': 'care-2', 'text': 'Care'},
+            {'level': 2, 'id': 'fit', 'text': 'Fit guide'},
+        ])
+        self.assertIn('<h2 id="fit">Fit <em>guide</em></h2>', processed.rendered_html)
+
+    def test_images(self):
+        processed = process_content('<img src="/media/a.jpg" width="300">', image_size=lambda src: (600, 400))
+        self.assertEqual(processed.rendered_html, '<img src="/media/a.jpg" width="300" height="200" loading="lazy" decoding="async">')
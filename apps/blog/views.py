@@ -1,22 +1,32 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q, Count
 from django.http import JsonResponse, Http404
 from django.views.generic import ListView, DetailView
 from django.utils import timezone
 from django.contrib import messages
 
-from .models import BlogPost, BlogCategory, Tag, BlogComment
+from apps.main.fragments import get_or_compute
+from apps.main.pagination import paginate
+from apps.main.page_cache import cache_anonymous_page
 
+from .models import BlogPost, BlogCategory, Tag, BlogComment, post_views
+from .comments import get_comment_page, http_url
+from .search import search_posts, order_by_relevance, attach_snippets
 
+
+SIDEBAR_TIMEOUT = 60 * 10
+PUBLISHED_SLUGS_TIMEOUT = 60 * 60
+
+
+@cache_anonymous_page('blog')
 def blog_list(request):
     """Blog listing page with category filtering and search"""
-    posts_list = BlogPost.objects.filter(is_published=True)
-    categories = BlogCategory.objects.filter(is_active=True).annotate(
-        post_count=Count('posts', filter=Q(posts__is_published=True))
-    ).order_by('name')
-
-    print('posts', posts_list)
+    posts_list = BlogPost.objects.filter(is_published=True).select_related('category', 'author')
+    categories = get_or_compute('blog_sidebar:categories', lambda: list(
+        BlogCategory.objects.filter(is_active=True).annotate(
+            post_count=Count('posts', filter=Q(posts__is_published=True))
+        ).order_by('name')
+    ), SIDEBAR_TIMEOUT, tags=('blog',))
     
     # Category filtering
     current_category = request.GET.get('category', '')
@@ -31,56 +41,57 @@ def blog_list(request):
     # Search functionality
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        posts_list = posts_list.filter(
-            Q(title__icontains=search_query) |
-            Q(content__icontains=search_query) |
-            Q(excerpt__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
-    
-    # Order by featured first, then by published date
-    posts_list = posts_list.order_by('-is_featured', '-published_at', '-created_at')
+        posts_list = order_by_relevance(search_posts(posts_list, search_query))
+    else:
+        # Order by featured first, then by published date
+        posts_list = posts_list.order_by('-is_featured', '-published_at', '-created_at')
     
     # Pagination
-    paginator = Paginator(posts_list, 9)  # 9 posts per page
-    page = request.GET.get('page')
-    
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    posts = paginate(request, posts_list, 9)  # 9 posts per page
     
     context = {
         'posts': posts,
         'categories': categories,
         'current_category': current_category,
         'search_query': search_query,
-        'total_posts': paginator.count,
+        'total_posts': posts.paginator.count,
     }
     return render(request, 'blog/blog_list.html', context)
 
 
+def load_published_slugs():
+    return frozenset(BlogPost.objects.filter(is_published=True).values_list('slug', flat=True))
+
+
+def count_post_view(request, slug):
+    """Count the view on every GET, including ones served from the page cache"""
+    # Runs before the view, so a 404 would be counted too; unknown slugs are skipped.
+    slugs = get_or_compute('blog_published_slugs', load_published_slugs, PUBLISHED_SLUGS_TIMEOUT, tags=('blog',))
+    if slug in slugs:
+        post_views.hit(request, slug)
+
+
+@cache_anonymous_page('blog', on_request=count_post_view)
 def blog_detail(request, slug):
     """Blog post detail page with related posts"""
-    post = get_object_or_404(BlogPost, slug=slug, is_published=True)
-    
-    # Increment view count
-    post.increment_views()
+    post = get_object_or_404(
+        BlogPost.objects.select_related('category', 'author').prefetch_related('tags'),
+        slug=slug, is_published=True,
+    )
     
     # Get related posts
     related_posts = post.get_related_posts(3)
     
     # Get company info for contact details
-    from apps.main.views import get_company_info
+    from apps.main.company import get_company_info
     company_info = get_company_info()
     
     # Handle comment submission
     if request.method == 'POST' and 'submit_comment' in request.POST:
         name = request.POST.get('name', '').strip()
         email = request.POST.get('email', '').strip()
-        website = request.POST.get('website', '').strip()
+        # Anything but an http(s) URL (javascript:, data:) is dropped.
+        website = http_url(request.POST.get('website', '').strip())
         content = request.POST.get('content', '').strip()
         parent_id = request.POST.get('parent_id')
 
@@ -106,23 +117,19 @@ def blog_detail(request, slug):
         else:
             messages.error(request, 'Please fill in all required fields.')
 
-    # Get all comments (newest first)
-    comments = BlogComment.objects.filter(
-        post=post,
-        is_approved=True,
-        parent=None
-    ).order_by('-created_at')
-    print('commeent', comments)
-    
+    comments, comment_count = get_comment_page(post, request.GET.get('comments_page'))
+
     context = {
         'post': post,
         'related_posts': related_posts,
         'comments': comments,
+        'comment_count': comment_count,
         'company_info': company_info,
     }
     return render(request, 'blog/blog_detail.html', context)
 
 
+@cache_anonymous_page('blog')
 def blog_category(request, slug):
     """Blog category page showing all posts in a category"""
     category = get_object_or_404(BlogCategory, slug=slug, is_active=True)
@@ -132,24 +139,17 @@ def blog_category(request, slug):
     ).order_by('-is_featured', '-published_at', '-created_at')
     
     # Pagination
-    paginator = Paginator(posts_list, 9)
-    page = request.GET.get('page')
-    
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    posts = paginate(request, posts_list, 9)
     
     context = {
         'category': category,
         'posts': posts,
-        'total_posts': paginator.count,
+        'total_posts': posts.paginator.count,
     }
     return render(request, 'blog/blog_category.html', context)
 
 
+@cache_anonymous_page('blog')
 def blog_tag(request, slug):
     """Blog tag page showing all posts with a specific tag"""
     tag = get_object_or_404(Tag, slug=slug, is_active=True)
@@ -159,57 +159,35 @@ def blog_tag(request, slug):
     ).order_by('-published_at', '-created_at')
     
     # Pagination
-    paginator = Paginator(posts_list, 9)
-    page = request.GET.get('page')
-    
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    posts = paginate(request, posts_list, 9)
     
     context = {
         'tag': tag,
         'posts': posts,
-        'total_posts': paginator.count,
+        'total_posts': posts.paginator.count,
     }
     return render(request, 'blog/blog_tag.html', context)
 
 
+@cache_anonymous_page('blog')
 def blog_search(request):
     """Dedicated blog search page"""
     query = request.GET.get('q', '').strip()
-    posts_list = BlogPost.objects.filter(is_published=True)
+    posts_list = BlogPost.objects.filter(is_published=True).select_related('category', 'author')
     
     if query:
-        posts_list = posts_list.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(excerpt__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(tags__name__icontains=query)
-        ).distinct()
+        posts_list = order_by_relevance(search_posts(posts_list, query))
     else:
         posts_list = posts_list.none()  # Empty queryset if no query
     
-    posts_list = posts_list.order_by('-published_at', '-created_at')
-    
     # Pagination
-    paginator = Paginator(posts_list, 9)
-    page = request.GET.get('page')
-    
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    posts = paginate(request, posts_list, 9)
+    posts.object_list = attach_snippets(posts.object_list, query)
     
     context = {
         'query': query,
         'posts': posts,
-        'total_results': paginator.count,
+        'total_results': posts.paginator.count,
     }
     return render(request, 'blog/blog_search.html', context)
 
@@ -217,9 +195,13 @@ def blog_search(request):
 # AJAX Views
 def get_popular_posts(request):
     """Get popular blog posts for AJAX requests"""
+    return JsonResponse({'posts': get_or_compute('blog_sidebar:popular', load_popular_posts, SIDEBAR_TIMEOUT, tags=('blog',))})
+
+
+def load_popular_posts():
     posts = BlogPost.objects.filter(
         is_published=True
-    ).order_by('-views', '-published_at')[:5]
+    ).select_related('category').order_by('-views', '-published_at')[:5]
     
     posts_data = []
     for post in posts:
@@ -231,15 +213,18 @@ def get_popular_posts(request):
             'category': post.category.name,
             'read_time': post.reading_time_display,
         })
-    
-    return JsonResponse({'posts': posts_data})
+    return posts_data
 
 
 def get_recent_posts(request):
     """Get recent blog posts for AJAX requests"""
+    return JsonResponse({'posts': get_or_compute('blog_sidebar:recent', load_recent_posts, SIDEBAR_TIMEOUT, tags=('blog',))})
+
+
+def load_recent_posts():
     posts = BlogPost.objects.filter(
         is_published=True
-    ).order_by('-published_at', '-created_at')[:5]
+    ).select_related('category').order_by('-published_at', '-created_at')[:5]
     
     posts_data = []
     for post in posts:
@@ -251,8 +236,7 @@ def get_recent_posts(request):
             'category': post.category.name,
             'featured_image': post.featured_image.url if post.featured_image else '',
         })
-    
-    return JsonResponse({'posts': posts_data})
+    return posts_data
 
 
 # Class-based views (alternative implementations)
@@ -264,7 +248,7 @@ class BlogListView(ListView):
     paginate_by = 9
     
     def get_queryset(self):
-        queryset = BlogPost.objects.filter(is_published=True)
+        queryset = BlogPost.objects.filter(is_published=True).select_related('category', 'author')
         
         # Category filtering
         category_slug = self.request.GET.get('category')
@@ -272,13 +256,9 @@ class BlogListView(ListView):
             queryset = queryset.filter(category__slug=category_slug)
         
         # Search
-        search_query = self.request.GET.get('search')
+        search_query = self.request.GET.get('search', '').strip()
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(content__icontains=search_query) |
-                Q(excerpt__icontains=search_query)
-            )
+            return order_by_relevance(search_posts(queryset, search_query))
         
         return queryset.order_by('-is_featured', '-published_at')
     
@@ -298,12 +278,12 @@ class BlogDetailView(DetailView):
     slug_field = 'slug'
     
     def get_queryset(self):
-        return BlogPost.objects.filter(is_published=True)
+        return BlogPost.objects.filter(is_published=True).select_related('category', 'author').prefetch_related('tags')
     
     def get_object(self):
         obj = super().get_object()
-        # Increment views
-        obj.increment_views()
+        if post_views.hit(self.request, obj.slug):
+            obj.views += 1
         return obj
     
     def get_context_data(self, **kwargs):
@@ -311,7 +291,7 @@ class BlogDetailView(DetailView):
         context['related_posts'] = self.object.get_related_posts(3)
         
         # Get company info
-        from apps.main.views import get_company_info
+        from apps.main.company import get_company_info
         context['company_info'] = get_company_info()
         
         return context
\ No newline at end of file
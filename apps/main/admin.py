@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from django.utils import timezone
+from django.template.response import TemplateResponse
 from .models import (
     Category, Product, ProductImage, Feature, Testimonial, 
-    CompanyInfo, Newsletter, ContactMessage, UserProfile, AboutGlasses, Wishlist, WhatsAppOrderClick
+    CompanyInfo, Newsletter, ContactMessage, UserProfile, AboutGlasses, Wishlist, WhatsAppOrderClick,
+    Job, ClickRollup,
 )
+from .rollups import click_report
 
 # Register AboutGlasses for admin editing
 @admin.register(AboutGlasses)
@@ -221,15 +225,66 @@ class WishlistAdmin(admin.ModelAdmin):
 @admin.register(WhatsAppOrderClick)
 class WhatsAppOrderClickAdmin(admin.ModelAdmin):
     list_display = ['product_name', 'price', 'ip_address', 'clicked_at']
-    list_filter = ['clicked_at']
-    search_fields = ['product_name', 'product_id', 'ip_address']
+    search_fields = ['product_id', 'ip_address']
     readonly_fields = ['clicked_at']
-    date_hierarchy = 'clicked_at'
+    # Reports live in the Click Reports dashboard; counting or date-filtering
+    # the raw click table does not scale.
+    show_full_result_count = False
     
     def has_add_permission(self, request):
         return False  
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['kind', 'idempotency_key']
+    readonly_fields = ['created_at', 'finished_at', 'locked_at', 'last_error']
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.PENDING, attempts=0, run_after=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'{updated} jobs queued for retry.')
+    retry_jobs.short_description = "Retry selected jobs"
+
+    def has_add_permission(self, request):
+        return False
+
 # Admin site customization
 admin.site.site_header = "Eyedentity Eyewear Admin"
 admin.site.site_title = "Eyedentity Admin"
-admin.site.index_title = "Welcome to Eyedentity Administration"
\ No newline at end of file
+admin.site.index_title = "Welcome to Eyedentity Administration"
+
+@admin.register(ClickRollup)
+class ClickRollupAdmin(admin.ModelAdmin):
+    """Read-only click dashboard; reads the rollup tables, never the raw clicks"""
+    change_list_template = 'admin/main/click_dashboard.html'
+    RANGES = [7, 30, 90, 365]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.RANGES:
+            days = 30
+        context = {
+            **self.admin_site.each_context(request),
+            **click_report(days),
+            'title': 'WhatsApp order clicks',
+            'opts': self.model._meta,
+            'ranges': self.RANGES,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, self.change_list_template, context)
@@ -0,0 +1,244 @@
+"""
+Micro-benchmarks for the model properties and templates on hot paths
+(``manage.py benchmark``).
+
+Each benchmark times one call per object over a list of fresh objects (so
+``cached_property`` values are computed, not read back), repeated for a
+number of rounds, and reports the best and median microseconds per call
+and the queries per call. Model properties run twice: on ``memory``
+fixtures, unsaved instances with their relations filled in by hand, and on
+``db`` fixtures loaded the way the views load them. The templates render
+with the context their view builds, through the context processors.
+
+The ``db`` fixtures come from ``seed_benchmark_data``, which the command
+runs in a throwaway test database so the numbers do not depend on
+whatever the configured database holds. ``run_benchmarks`` returns plain
+dicts, written as JSON by the command so runs on different commits can be
+compared with ``compare_results``.
+"""
+
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import QueryDict
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from .facets import get_facets, has_active_filters, parse_filters
+from .images import prime_manifests
+from .models import AboutGlasses, Category, Feature, Product, Testimonial, Wishlist, WishlistItem
+from .whatsapp import prime_whatsapp_links
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register ``setup(fixtures)``, which returns ``(call, args)``: ``call(arg)`` is timed for each arg."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def prefetched(instance, name, objects):
+    """Fill ``instance.<name>.all()`` without the database, as prefetch_related would."""
+    queryset = getattr(instance, name).model.objects.none()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache = {**getattr(instance, '_prefetched_objects_cache', {}), name: queryset}
+    return instance
+
+
+class Fixtures:
+    """Fresh objects for every round; ``size`` objects per round."""
+
+    def __init__(self, size):
+        self.size = size
+        self.category = Category(id=1, name='Sunglasses', slug='sunglasses')
+        self.features = [Feature(id=i, name=name) for i, name in enumerate(['UV400', 'Polarized', 'Lightweight'], 1)]
+
+    def memory_products(self):
+        return [
+            prefetched(Product(
+                id=i, name=f'Aviator {i}', slug=f'aviator-{i}', product_code=f'EYE-{i:05d}', category=self.category,
+                description='Metal aviators', price=Decimal('45.00'), old_price=Decimal('60.00') if i % 2 else None,
+                lens_type='sunglasses', frame_material='Metal', stock_quantity=i % 8,
+            ), 'features', self.features)
+            for i in range(1, self.size + 1)
+        ]
+
+    def db_products(self):
+        return list(
+            Product.objects.filter(is_active=True).select_related('category').prefetch_related('features')
+            .order_by('pk')[:self.size]
+        )
+
+    def memory_wishlists(self):
+        products = self.memory_products()[:5]
+        return [
+            prefetched(Wishlist(id=i, session_key=f'bench{i}'), 'items', [
+                WishlistItem(id=i * 10 + n, product=product) for n, product in enumerate(products)
+            ])
+            for i in range(1, self.size + 1)
+        ]
+
+    def db_wishlists(self):
+        wishlist = Wishlist.objects.get(session_key='benchmark')
+        return [Wishlist.objects.get(pk=wishlist.pk) for _ in range(self.size)]
+
+    def memory_posts(self):
+        from apps.blog.models import BlogPost
+        return [BlogPost(id=i, title=f'Post {i}', slug=f'post-{i}', read_time=i % 9 + 1) for i in range(1, self.size + 1)]
+
+    def db_posts(self):
+        from apps.blog.models import BlogPost
+        return list(BlogPost.objects.filter(is_published=True).order_by('pk')[:self.size])
+
+    def request(self, path):
+        from django.contrib.sessions.backends.db import SessionStore
+
+        request = RequestFactory().get(path, HTTP_HOST='localhost')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        return request
+
+
+PROPERTIES = [
+    ('Product.discount_percentage', 'products', lambda product: product.discount_percentage),
+    ('Product.whatsapp_link', 'products', lambda product: product.whatsapp_link),
+    ('Product.whatsapp_share_link', 'products', lambda product: product.whatsapp_share_link),
+    ('Product.get_full_url', 'products', lambda product: product.get_full_url()),
+    ('Wishlist.total_price', 'wishlists', lambda wishlist: wishlist.total_price),
+    ('BlogPost.word_count', 'posts', lambda post: post.word_count),
+    ('BlogPost.reading_time_display', 'posts', lambda post: post.reading_time_display),
+]
+
+
+def property_benchmark(fixture, access):
+    def setup(fixtures):
+        return access, getattr(fixtures, fixture)()
+    return setup
+
+
+for source in ('memory', 'db'):
+    for label, kind, access in PROPERTIES:
+        benchmark(f'{source}:{label}')(property_benchmark(f'{source}_{kind}', access))
+
+
+@benchmark('blog:process_content')
+def process_content_benchmark(fixtures):
+    # What word_count and the rendered HTML cost, now that they are computed on save.
+    from apps.blog.models import BlogPost
+    from apps.blog.content import process_content
+
+    return process_content, [post.content for post in BlogPost.objects.order_by('pk')[:fixtures.size]]
+
+
+@benchmark('template:main/shop.html')
+def shop_template(fixtures):
+    products = fixtures.db_products()
+    prime_whatsapp_links(products)
+    prime_manifests(p.image.name for p in products)
+    filters = parse_filters(QueryDict())
+    context = {
+        'products': Paginator(products, max(len(products), 1)).page(1),
+        'categories': list(Category.objects.filter(is_active=True).order_by('order', 'name')),
+        'search_query': '',
+        'current_category': '',
+        'price_filter': '',
+        'filters': filters,
+        'facets': get_facets(filters, ''),
+        'has_active_filters': has_active_filters(filters),
+        'order_by': '-created_at',
+    }
+    return _render('main/shop.html', context, fixtures.request('/shop/'))
+
+
+@benchmark('template:main/home.html')
+def home_template(fixtures):
+    products = fixtures.db_products()
+    prime_whatsapp_links(products)
+    sale = products[:len(products) // 2]
+    categories = list(Category.objects.filter(is_active=True)[:6])
+    prime_manifests([p.image.name for p in products] + [c.image.name for c in categories])
+    context = {
+        'sale_products': sale,
+        'sale_product_groups': [sale[i:i + 3] for i in range(0, len(sale), 3)],
+        'featured_products': products[len(products) // 2:],
+        'categories': categories,
+        'testimonials': list(Testimonial.objects.filter(is_active=True)[:3]),
+        'about_glasses_cards': list(AboutGlasses.objects.order_by('id')),
+    }
+    return _render('main/home.html', context, fixtures.request('/'))
+
+
+def _render(template_name, context, request):
+    from .company import get_company_info
+
+    context['company_info'] = get_company_info()
+    # One render per round: the list holds the request once.
+    return (lambda request: render_to_string(template_name, context, request)), [request]
+
+
+def seed_benchmark_data(size):
+    """The ``db`` fixtures: ``size`` products and posts, and a five-item wishlist."""
+    from .testing import seed_blog, seed_catalog
+
+    seed_catalog(products=size)
+    seed_blog(posts=size)
+    wishlist = Wishlist.objects.create(session_key='benchmark')
+    WishlistItem.objects.bulk_create([
+        WishlistItem(wishlist=wishlist, product=product) for product in Product.objects.order_by('pk')[:5]
+    ])
+
+
+def measure(setup, fixtures, rounds):
+    """Best and median microseconds per call, and queries per call."""
+    per_call = []
+    queries = calls = 0
+    for _ in range(rounds):
+        call, args = setup(fixtures)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            for arg in args:
+                call(arg)
+            elapsed = time.perf_counter() - start
+        if args:
+            per_call.append(elapsed / len(args) * 1e6)
+        queries += len(captured)
+        calls += len(args)
+    return {
+        'us_per_call': round(min(per_call), 3) if per_call else None,
+        'median_us': round(statistics.median(per_call), 3) if per_call else None,
+        'queries_per_call': round(queries / calls, 3) if calls else None,
+        'calls': calls,
+    }
+
+
+def run_benchmarks(size=50, rounds=5, only=None):
+    """Run every benchmark whose name contains ``only``; returns ``{name: result}``."""
+    fixtures = Fixtures(size)
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        # One untimed round fills the per-process caches (link config, manifests).
+        measure(setup, fixtures, 1)
+        results[name] = measure(setup, fixtures, rounds)
+    return results
+
+
+def compare_results(current, previous):
+    """``(name, previous us, current us, ratio)`` for the benchmarks in both runs."""
+    rows = []
+    for name, result in current.items():
+        before = previous.get(name)
+        if before and before['us_per_call'] and result['us_per_call']:
+            rows.append((name, before['us_per_call'], result['us_per_call'], result['us_per_call'] / before['us_per_call']))
+    return rows
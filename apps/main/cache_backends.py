@@ -0,0 +1,284 @@
+"""
+Two-tier cache backend.
+
+``TwoTierCache`` keeps a small LRU of recently used entries in process
+memory (L1) in front of a shared cache that every worker can see (L2, any
+other entry in ``CACHES`` - file based, Redis, memcached, database).
+
+Reads hit L1 first. Writes and deletes go to L2, and each one is appended
+to an invalidation log kept in L2 (a sequence counter plus one entry per
+write). Every worker polls the counter at most once per ``SYNC_INTERVAL``
+seconds and evicts the keys written since its last poll, so an admin edit
+made in one worker is seen by the others within about a second instead of
+after the entry's full timeout. If the log has gaps (entries expired, L2
+was flushed) the whole L1 is dropped. L1 entries also expire on their own
+after ``L1_TIMEOUT`` seconds, which bounds staleness even if a log entry is
+lost to a race on an L2 without atomic ``incr``.
+
+Example::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'apps.main.cache_backends.TwoTierCache',
+            'OPTIONS': {
+                'L2': 'shared',
+                'L1_TIMEOUT': 30,
+                'L1_MAX_ENTRIES': 500,
+                'NAMESPACES': {
+                    # Rate limits must be exact across workers: skip L1.
+                    'newsletter_signup_': {'l1_timeout': 0},
+                    'company_info': {'timeout': 60 * 60, 'l1_timeout': 60},
+                },
+            },
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/var/tmp/eyedentity_cache',
+        },
+    }
+
+Namespaces are matched by longest key prefix. Each may set ``timeout``
+(the L2 timeout used when the caller does not pass one), ``l1_timeout``
+(0 disables L1 for the namespace) and ``max_entries`` (its own L1 LRU
+size).
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from .request_metrics import record_cache
+
+
+SEQ_KEY = 'two_tier:seq'
+LOG_KEY = 'two_tier:log:{}'
+LOG_TIMEOUT = 60 * 10
+# Polls that are further behind than this just drop L1.
+MAX_LOG_REPLAY = 500
+
+_MISSING = object()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', server or 'shared')
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1.0)
+        self._namespaces = sorted(
+            options.get('NAMESPACES', {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self._l1 = {}
+        self._lock = threading.Lock()
+        self._seen = None
+        self._own = set()
+        self._last_sync = 0.0
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # -- namespaces -------------------------------------------------------
+
+    def _namespace(self, key):
+        for prefix, config in self._namespaces:
+            if key.startswith(prefix):
+                return prefix, config
+        return '', {}
+
+    def _l2_timeout(self, key, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self._namespace(key)[1].get('timeout', DEFAULT_TIMEOUT)
+        return timeout
+
+    def _l1_ttl(self, key, timeout):
+        ttl = self._namespace(key)[1].get('l1_timeout', self._l1_timeout)
+        if timeout is not None and timeout is not DEFAULT_TIMEOUT:
+            ttl = min(ttl, timeout)
+        return ttl
+
+    # -- L1 ---------------------------------------------------------------
+
+    def _l1_get(self, key, version):
+        l1_key = self.make_and_validate_key(key, version)
+        prefix = self._namespace(key)[0]
+        with self._lock:
+            bucket = self._l1.get(prefix)
+            entry = bucket.get(l1_key) if bucket else None
+            if entry is None:
+                return _MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del bucket[l1_key]
+                return _MISSING
+            bucket.move_to_end(l1_key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_ttl(key, timeout)
+        if ttl is None or ttl <= 0:
+            return
+        l1_key = self.make_and_validate_key(key, version)
+        prefix, config = self._namespace(key)
+        max_entries = config.get('max_entries', self._l1_max_entries)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            bucket = self._l1.setdefault(prefix, OrderedDict())
+            bucket[l1_key] = (time.monotonic() + ttl, pickled)
+            bucket.move_to_end(l1_key)
+            while len(bucket) > max_entries:
+                bucket.popitem(last=False)
+
+    def _l1_evict(self, l1_keys):
+        with self._lock:
+            for bucket in self._l1.values():
+                for l1_key in l1_keys:
+                    bucket.pop(l1_key, None)
+
+    def _l1_clear(self):
+        with self._lock:
+            self._l1.clear()
+
+    # -- cross-worker invalidation ------------------------------------------
+
+    def _broadcast(self, keys, version):
+        # Namespaces with l1_timeout 0 never reach any worker's L1.
+        keys = [key for key in keys if (self._l1_ttl(key, DEFAULT_TIMEOUT) or 0) > 0]
+        if not keys:
+            return
+        l1_keys = [self.make_and_validate_key(key, version) for key in keys]
+        self._l1_evict(l1_keys)
+        l2 = self.l2
+        l2.add(SEQ_KEY, 0, None)
+        for attempt in range(3):
+            try:
+                seq = l2.incr(SEQ_KEY)
+            except ValueError:
+                l2.add(SEQ_KEY, 0, None)
+                continue
+            if l2.add(LOG_KEY.format(seq), l1_keys, LOG_TIMEOUT):
+                if len(self._own) < MAX_LOG_REPLAY:
+                    self._own.add(seq)
+                break
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._last_sync < self._sync_interval:
+            return
+        self._last_sync = now
+        # A missing counter means L2 was flushed or has not been written yet.
+        seq = self.l2.get(SEQ_KEY) or 0
+        seen, self._seen = self._seen, seq
+        if seen is None or seq == seen:
+            return
+        if seq < seen or seq - seen > MAX_LOG_REPLAY:
+            self._own.clear()
+            self._l1_clear()
+            return
+        # Our own writes already updated L1.
+        numbers = [n for n in range(seen + 1, seq + 1) if n not in self._own]
+        self._own.difference_update(range(seen + 1, seq + 1))
+        log_keys = [LOG_KEY.format(n) for n in numbers]
+        entries = self.l2.get_many(log_keys)
+        if len(entries) < len(log_keys):
+            self._l1_clear()
+            return
+        self._l1_evict([l1_key for l1_keys in entries.values() for l1_key in l1_keys])
+
+    # -- cache API --------------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        value = self._l1_get(key, version)
+        if value is not _MISSING:
+            record_cache(hits=1)
+            return value
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(misses=1)
+            return default
+        record_cache(hits=1)
+        self._l1_set(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1_get(key, version)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            for key, value in self.l2.get_many(missing, version=version).items():
+                self._l1_set(key, value, version)
+                found[key] = value
+        record_cache(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        self._sync()
+        return self._l1_get(key, version) is not _MISSING or self.l2.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, self._l2_timeout(key, timeout), version=version)
+        self._broadcast([key], version)
+        self._l1_set(key, value, version, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.l2.add(key, value, self._l2_timeout(key, timeout), version=version):
+            return False
+        self._broadcast([key], version)
+        self._l1_set(key, value, version, timeout)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        by_timeout = {}
+        for key, value in data.items():
+            by_timeout.setdefault(self._l2_timeout(key, timeout), {})[key] = value
+        failed = []
+        for l2_timeout, group in by_timeout.items():
+            failed.extend(self.l2.set_many(group, l2_timeout, version=version) or [])
+        self._broadcast(list(data), version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(key, value, version, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, self._l2_timeout(key, timeout), version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version=version)
+        self._broadcast([key], version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self._broadcast(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._broadcast([key], version)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self._l1_clear()
+        self._seen = None
+        self._own.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
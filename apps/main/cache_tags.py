@@ -0,0 +1,37 @@
+"""
+Generational cache tags.
+
+Each tag ("catalog", "company", "blog", ...) has a version number stored in
+the cache. Anything cached under a key that embeds the current versions of
+its tags is retired in O(1) by bumping one of those tags - no need to find
+and delete the individual entries.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def tag_key(tag):
+    return f'cache_tag:{tag}'
+
+
+def get_tag_versions(tags):
+    """Return the current version of every tag in ``tags``, in order."""
+    keys = [tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key, 0)
+    return [versions[key] for key in keys]
+
+
+def get_tag_version(tag):
+    return get_tag_versions([tag])[0]
+
+
+def bump_tags(*tags):
+    """Retire every cache entry keyed on any of ``tags``."""
+    now = time.time_ns()
+    cache.set_many({tag_key(tag): now for tag in tags}, None)
@@ -0,0 +1,323 @@
+"""
+Buffered ingestion for WhatsApp order clicks.
+
+The tracking endpoint only appends the click to an in-process, bounded
+queue and answers 204. A daemon thread per process writes the queue to
+``WhatsAppOrderClick`` with ``bulk_create`` once ``CLICK_BUFFER_BATCH``
+clicks are waiting or every ``CLICK_BUFFER_INTERVAL`` seconds, so a burst of
+clicks costs one INSERT per batch instead of one per click.
+
+* When the queue is full (``CLICK_BUFFER_SIZE``) new clicks are dropped and
+  counted.
+* When a flush fails because the database is unreachable, or the process
+  exits, the pending clicks are written to a spill file in
+  ``CLICK_SPILL_DIR``. Spill files are written to a temporary name, fsynced
+  and renamed, so a crash never leaves a half-written one. The flusher of
+  any process re-inserts them, one file per transaction, once the database
+  accepts writes again; delivery is at-least-once.
+* When a batch is refused for its data, the clicks are inserted one at a
+  time and the rows that still fail are set aside in a ``.bad`` file next
+  to the spill files. A spill file that fails on its data is set aside the
+  same way, so it does not hold up the files after it.
+
+With ``CLICK_BUFFER_THREAD = False`` (the test settings) no thread is
+started: clicks wait in the queue until ``flush()`` is called, and are
+discarded at exit.
+
+``stats()`` returns this process's counters (queue depth, accepted,
+flushed, spilled, rejected, dropped); staff can read them at
+``api/track-whatsapp-order/stats/``.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db_circuit import DATABASE_ERRORS
+from .models import WhatsAppOrderClick
+
+
+logger = logging.getLogger(__name__)
+
+SPILL_SUFFIX = '.jsonl'
+BAD_SUFFIX = '.bad'
+REPLAY_BATCH = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def spill_dir():
+    return str(_setting('CLICK_SPILL_DIR', os.path.join(settings.BASE_DIR, 'click_spill')))
+
+
+def clean_price(value):
+    """``value`` as a price ``WhatsAppOrderClick`` can store; ValueError if it is not one."""
+    field = WhatsAppOrderClick._meta.get_field('price')
+    try:
+        price = Decimal(str(value or 0))
+    except InvalidOperation:
+        raise ValueError(f'Invalid price: {value!r}')
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    if not price.is_finite() or not 0 <= price < limit:
+        raise ValueError(f'Price out of range: {value!r}')
+    price = price.quantize(Decimal(1).scaleb(-field.decimal_places))
+    if price >= limit:
+        raise ValueError(f'Price out of range: {value!r}')
+    return price
+
+
+def _serialize(click):
+    return {
+        'product_id': click.product_id,
+        'product_name': click.product_name,
+        'price': str(click.price),
+        'session_key': click.session_key,
+        'ip_address': click.ip_address,
+        'user_agent': click.user_agent,
+        'clicked_at': click.clicked_at.isoformat(),
+    }
+
+
+def _deserialize(data):
+    return WhatsAppOrderClick(
+        product_id=data['product_id'],
+        product_name=data['product_name'],
+        price=Decimal(data['price']),
+        session_key=data['session_key'],
+        ip_address=data['ip_address'],
+        user_agent=data['user_agent'],
+        clicked_at=parse_datetime(data['clicked_at']),
+    )
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _release_orphans():
+    """Hand back files claimed by a process that died while replaying them."""
+    for claimed in glob.glob(os.path.join(spill_dir(), '*' + SPILL_SUFFIX + '.*.replaying')):
+        path, pid, _ = claimed.rsplit('.', 2)
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            try:
+                os.rename(claimed, path)
+            except OSError:
+                pass
+
+
+class ClickBuffer:
+    """Bounded queue of unsaved clicks plus the thread that flushes it."""
+
+    def __init__(self, max_size=None, batch_size=None, interval=None):
+        self.max_size = max_size or _setting('CLICK_BUFFER_SIZE', 10000)
+        self.batch_size = batch_size or _setting('CLICK_BUFFER_BATCH', 200)
+        self.interval = interval or _setting('CLICK_BUFFER_INTERVAL', 2.0)
+        self.queue = queue.Queue(self.max_size)
+        self.wakeup = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.counters = {
+            'accepted': 0, 'flushed': 0, 'spilled': 0, 'replayed': 0, 'rejected': 0, 'dropped': 0,
+            'failed_flushes': 0,
+        }
+        self.thread = None
+        self.pid = None
+        self.stopping = False
+
+    def add(self, click):
+        """Queue one unsaved ``WhatsAppOrderClick``; False if it was dropped."""
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(click)
+        except queue.Full:
+            self.counters['dropped'] += 1
+            return False
+        self.counters['accepted'] += 1
+        if self.queue.qsize() >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def stats(self):
+        return {'pid': os.getpid(), 'queue_depth': self.queue.qsize(), 'max_size': self.max_size, **self.counters}
+
+    def _ensure_thread(self):
+        if not _setting('CLICK_BUFFER_THREAD', True):
+            return
+        # Checked by pid so a buffer inherited through fork gets its own thread.
+        if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name='click-buffer', daemon=True)
+                self.thread.start()
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Write everything queued; spill it to disk if the database refuses."""
+        with self.flush_lock:
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                try:
+                    # A savepoint when called inside a transaction, so a refused batch can be retried.
+                    with transaction.atomic():
+                        WhatsAppOrderClick.objects.bulk_create(batch)
+                except DATABASE_ERRORS as e:
+                    self.counters['failed_flushes'] += 1
+                    logger.warning("Click flush failed, spilling %s clicks: %s", len(batch), e)
+                    self._spill(batch + self._drain_all())
+                    return False
+                except Exception as e:
+                    logger.warning("Click batch of %s refused, inserting one by one: %s", len(batch), e)
+                    if not self._flush_rows(batch):
+                        return False
+                else:
+                    self.counters['flushed'] += len(batch)
+        return True
+
+    def _flush_rows(self, batch):
+        """Insert ``batch`` row by row, setting aside the rows the database refuses."""
+        rejected = []
+        for i, click in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    WhatsAppOrderClick.objects.bulk_create([click])
+            except DATABASE_ERRORS as e:
+                self.counters['failed_flushes'] += 1
+                logger.warning("Click flush failed, spilling %s clicks: %s", len(batch) - i, e)
+                self._spill(batch[i:] + self._drain_all())
+                self._set_aside(rejected)
+                return False
+            except Exception as e:
+                logger.error("Click for product %r rejected: %s", click.product_id, e)
+                rejected.append(click)
+            else:
+                self.counters['flushed'] += 1
+        self._set_aside(rejected)
+        return True
+
+    def _drain_all(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _spill(self, clicks, suffix=SPILL_SUFFIX, counter='spilled'):
+        if not clicks:
+            return
+        directory = spill_dir()
+        name = os.path.join(directory, f'clicks-{os.getpid()}-{uuid.uuid4().hex}')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(name + '.tmp', 'w') as f:
+                for click in clicks:
+                    f.write(json.dumps(_serialize(click)) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(name + '.tmp', name + suffix)
+        except OSError as e:
+            self.counters['dropped'] += len(clicks)
+            logger.error("Could not spill %s clicks to %s: %s", len(clicks), directory, e)
+            return
+        self.counters[counter] += len(clicks)
+
+    def _set_aside(self, clicks):
+        """Keep clicks the database refused for inspection; they are never replayed."""
+        self._spill(clicks, suffix=SPILL_SUFFIX + BAD_SUFFIX, counter='rejected')
+
+    def replay_spilled(self):
+        """Insert clicks from spill files, one transaction per file; each file is claimed by renaming it."""
+        _release_orphans()
+        for path in sorted(glob.glob(os.path.join(spill_dir(), '*' + SPILL_SUFFIX))):
+            claimed = f'{path}.{os.getpid()}.replaying'
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # Another process claimed it.
+            try:
+                with open(claimed) as f:
+                    clicks = [_deserialize(json.loads(line)) for line in f if line.strip()]
+                with transaction.atomic():
+                    for start in range(0, len(clicks), REPLAY_BATCH):
+                        WhatsAppOrderClick.objects.bulk_create(clicks[start:start + REPLAY_BATCH])
+            except DATABASE_ERRORS as e:
+                os.rename(claimed, path)
+                logger.warning("Replaying %s failed: %s", path, e)
+                return
+            except Exception as e:
+                # Unreadable, or refused for its data: retrying would fail the same way.
+                logger.error("Spill file %s set aside: %s", path, e)
+                os.rename(claimed, path + BAD_SUFFIX)
+            else:
+                self.counters['replayed'] += len(clicks)
+                os.remove(claimed)
+
+    def _run(self):
+        next_replay = 0
+        while not self.stopping:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                if self.flush() and time.monotonic() >= next_replay:
+                    next_replay = time.monotonic() + self.interval * 10
+                    self.replay_spilled()
+            except Exception:
+                logger.exception("Click buffer flush crashed")
+            finally:
+                connection.close()
+
+    def shutdown(self):
+        """Flush at interpreter exit, spilling rather than blocking on a dead DB."""
+        self.stopping = True
+        if self.pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception:
+            self._spill(self._drain_all())
+
+
+buffer = ClickBuffer()
+atexit.register(buffer.shutdown)
+
+
+def record_click(**fields):
+    """Queue a click for the next batch insert."""
+    fields.setdefault('clicked_at', timezone.now())
+    return buffer.add(WhatsAppOrderClick(**fields))
+
+
+def stats():
+    return buffer.stats()
@@ -0,0 +1,37 @@
+"""
+The site's ``CompanyInfo`` row, shared by views, templates and models.
+
+Views, the ``site_context`` context processor and the WhatsApp link
+builder all read it through ``get_company_info()``: it is loaded at most
+once per request (see ``request_values.py``) from a fragment cached for
+``COMPANY_INFO_TIMEOUT`` seconds, so a missing row is not queried for on
+every request either.
+"""
+
+from django.db import ProgrammingError, OperationalError
+
+from .fragments import get_or_compute
+from .models import CompanyInfo
+from .request_values import get_request_value, request_value
+
+
+COMPANY_INFO_TIMEOUT = 60 * 60
+
+
+@request_value('company_info')
+def load_company_info(request=None):
+    """Get company info with proper error handling - PRODUCTION SAFE"""
+    try:
+        # Cached for 1 hour; a missing row is cached too
+        return get_or_compute('company_info', CompanyInfo.objects.first, COMPANY_INFO_TIMEOUT)
+    except (ProgrammingError, OperationalError) as e:
+        print(f"Database error getting company info: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected error getting company info: {e}")
+        return None
+
+
+def get_company_info():
+    """Company info, loaded at most once per request"""
+    return get_request_value('company_info')
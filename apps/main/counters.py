@@ -0,0 +1,159 @@
+"""
+Write-behind counters for hot integer columns (e.g. ``BlogPost.views``).
+
+Incrementing a counter only adds to an in-process tally. A daemon thread
+writes the tallies every ``COUNTER_FLUSH_INTERVAL`` seconds (and at exit)
+as ``UPDATE ... SET field = field + n`` statements, one per distinct ``n``
+covering every row with that increment. Concurrent workers never lose each
+other's increments and a viral post costs one UPDATE per flush instead of
+one per view. Up to one interval of increments is lost if a worker is
+killed. With ``COUNTER_FLUSH_THREAD = False`` (the test settings) no
+thread is started and increments wait for ``flush()``; they are discarded
+at exit.
+
+``hit(request, key)`` counts at most once per visitor per
+``COUNTER_DEDUP_WINDOW`` seconds when the window is set. Visitors are
+recognized by their visitor key (see visitor.py) or, since anonymous
+visitors usually have no session, by IP address and user agent, using
+``cache.add`` in the shared cache so the window holds across workers.
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, DatabaseError
+from django.db.models import F
+
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = []
+
+
+def flush_interval():
+    return getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10)
+
+
+def flush_thread():
+    return getattr(settings, 'COUNTER_FLUSH_THREAD', True)
+
+
+def dedup_window():
+    return getattr(settings, 'COUNTER_DEDUP_WINDOW', 0)
+
+
+def visitor_fingerprint(request):
+    from .visitor import get_visitor_key
+
+    key = get_visitor_key(request) if hasattr(request, 'session') else None
+    if not key:
+        raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+        key = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return key
+
+
+class WriteBehindCounter:
+    """
+    Buffered ``F(field) + n`` increments of ``model`` rows found by ``lookup``.
+
+    ``model`` is an ``"app_label.Model"`` string so counters can be declared
+    in models.py; ``filters`` restrict which rows are updated.
+    """
+
+    def __init__(self, name, model, field, lookup='pk', filters=None):
+        self.name = name
+        self.model_label = model
+        self.field = field
+        self.lookup = lookup
+        self.filters = filters or {}
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        COUNTERS.append(self)
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def incr(self, key, n=1):
+        self._ensure_thread()
+        with self.lock:
+            self.pending[key] += n
+
+    def hit(self, request, key):
+        """Count a view of ``key`` unless this visitor was counted within the window."""
+        window = dedup_window()
+        if window and not cache.add(f'counter_seen:{self.name}:{key}:{visitor_fingerprint(request)}', 1, window):
+            return False
+        self.incr(key)
+        return True
+
+    def unflushed(self, key):
+        return self.pending.get(key, 0)
+
+    def flush(self):
+        """Write the pending increments; kept for the next flush if the database fails."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        if not pending:
+            return 0
+        by_amount = defaultdict(list)
+        for key, n in pending.items():
+            by_amount[n].append(key)
+        queryset = self.model._default_manager.filter(**self.filters)
+        written = Counter()
+        try:
+            for n, keys in by_amount.items():
+                queryset.filter(**{f'{self.lookup}__in': keys}).update(**{self.field: F(self.field) + n})
+                written.update({key: n for key in keys})
+        except DatabaseError as e:
+            logger.warning("Counter %s flush failed, keeping increments: %s", self.name, e)
+            with self.lock:
+                self.pending.update(pending - written)
+        return sum(written.values())
+
+    def _ensure_thread(self):
+        if not flush_thread():
+            return
+        # Checked by pid so a counter inherited through fork gets its own thread.
+        if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name=f'counter-{self.name}', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(flush_interval())
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Counter %s flush crashed", self.name)
+            finally:
+                connection.close()
+
+
+def flush_all():
+    return sum(counter.flush() for counter in COUNTERS)
+
+
+@atexit.register
+def _flush_at_exit():
+    for counter in COUNTERS:
+        if counter.pid == os.getpid():
+            try:
+                counter.flush()
+            except Exception:
+                logger.exception("Counter %s could not flush at exit", counter.name)
@@ -0,0 +1,6 @@
+"""
+Database backends with the circuit breaker from ``apps.main.db_circuit``.
+
+Each is Django's own backend with ``CircuitBreakerMixin`` added to its
+``DatabaseWrapper``; settings use them for the default database.
+"""
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from apps.main.db_circuit import CircuitBreakerMixin
+
+
+class DatabaseWrapper(CircuitBreakerMixin, base.DatabaseWrapper):
+    pass
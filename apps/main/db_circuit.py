@@ -0,0 +1,191 @@
+"""
+Database circuit breaker.
+
+During a database outage every request would otherwise wait for its own
+connection attempt to time out. ``DatabaseCircuit`` counts connection
+failures on the default database; after ``DB_CIRCUIT_FAILURES`` in a row
+it opens, and from then on new connections fail at once with
+``DatabaseUnavailable`` (an ``OperationalError``, so the views' existing
+handlers catch it) instead of reaching the server. A background thread
+probes the database every ``DB_CIRCUIT_PROBE_INTERVAL`` seconds and closes
+the circuit on the first successful ``SELECT 1``. The circuit is per
+process: each worker notices the outage and the recovery on its own.
+
+Failures are noticed by the database backends in ``apps.main.db_backends``,
+which settings select in place of Django's own for the default database
+(``DB_CIRCUIT_ENABLED``). Their ``DatabaseWrapper`` adds
+``CircuitBreakerMixin``: ``ensure_connection`` counts a failed connect, and
+``wrap_database_errors``, where Django turns driver errors into its own,
+counts an ``InterfaceError`` or an ``OperationalError`` that left the driver
+connection closed (the server going away mid-query). Nothing is patched:
+other databases, and the default one with the circuit disabled, use the
+stock backends.
+
+Deadlocks, lock timeouts and other errors on a live connection do not
+count; the connection is not queried to find out, since it may be inside
+an aborted transaction. Any statement that succeeds resets the count.
+
+``observe_database_errors()`` lets a caller learn whether the code it ran
+hit the database outage even when the views swallowed the error; the page
+cache uses it to avoid caching, and to replace, pages rendered without
+their data (see ``page_cache.py``).
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+from django.db.utils import DatabaseErrorWrapper
+from django.utils.functional import cached_property
+
+
+logger = logging.getLogger(__name__)
+
+DATABASE_ERRORS = (OperationalError, InterfaceError)
+
+_observed = contextvars.ContextVar('database_errors', default=None)
+_probing = threading.local()
+
+
+class DatabaseUnavailable(OperationalError):
+    """Raised instead of connecting while the circuit is open."""
+
+
+class DatabaseCircuit:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, 'DB_CIRCUIT_FAILURES', 3)
+
+    @property
+    def probe_interval(self):
+        return getattr(settings, 'DB_CIRCUIT_PROBE_INTERVAL', 5)
+
+    def is_open(self):
+        return self._opened_at is not None
+
+    def record_failure(self, error):
+        note_database_error()
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures < self.failure_threshold:
+                return
+        self.open(reason=error)
+
+    def record_success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def open(self, reason=None, probe=True):
+        with self._lock:
+            if self._opened_at is not None:
+                return
+            self._opened_at = time.monotonic()
+        logger.warning('Database circuit opened (%s failures in a row): %s', self._failures, reason)
+        if probe:
+            threading.Thread(target=self._probe, name='db-circuit-probe', daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            outage = time.monotonic() - self._opened_at
+            self._opened_at = None
+            self._failures = 0
+        logger.warning('Database circuit closed after %.1fs', outage)
+
+    def _probe(self):
+        while self.is_open():
+            time.sleep(self.probe_interval)
+            connection = connections[DEFAULT_DB_ALIAS]
+            _probing.active = True
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except Exception:
+                continue
+            finally:
+                _probing.active = False
+                connection.close()
+            self.close()
+
+
+database_circuit = DatabaseCircuit()
+
+
+def connection_lost(wrapper, error):
+    """Whether ``error`` means ``wrapper`` lost its connection, without querying it."""
+    if isinstance(error, InterfaceError):
+        return True
+    # psycopg2 sets ``closed`` (nonzero), psycopg 3 ``closed`` and ``broken``.
+    raw = wrapper.connection
+    return raw is None or bool(getattr(raw, 'closed', False)) or bool(getattr(raw, 'broken', False))
+
+
+def note_database_error():
+    errors = _observed.get()
+    if errors is not None:
+        errors.append(time.time())
+
+
+@contextmanager
+def observe_database_errors():
+    """Yields a list that gets an entry for every outage error raised inside the block."""
+    errors = []
+    token = _observed.set(errors)
+    try:
+        yield errors
+    finally:
+        _observed.reset(token)
+
+
+class CircuitErrorWrapper(DatabaseErrorWrapper):
+    """Django's error translation, reporting lost connections to the circuit."""
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wrapper = self.wrapper
+        if exc_type is None:
+            database_circuit.record_success()
+            return super().__exit__(exc_type, exc_value, traceback)
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        except DATABASE_ERRORS as e:
+            # Connect failures are counted by CircuitBreakerMixin.ensure_connection.
+            if (
+                wrapper.connection is not None and not getattr(_probing, 'active', False)
+                and connection_lost(wrapper, e)
+            ):
+                database_circuit.record_failure(e)
+            raise
+
+
+class CircuitBreakerMixin:
+    """``DatabaseWrapper`` mixin for the default database; see module docstring."""
+
+    def ensure_connection(self):
+        if self.connection is not None or self.alias != DEFAULT_DB_ALIAS or getattr(_probing, 'active', False):
+            return super().ensure_connection()
+        if database_circuit.is_open():
+            note_database_error()
+            raise DatabaseUnavailable('The database circuit is open; not connecting.')
+        try:
+            super().ensure_connection()
+        except DATABASE_ERRORS as e:
+            database_circuit.record_failure(e)
+            raise
+        database_circuit.record_success()
+
+    @cached_property
+    def wrap_database_errors(self):
+        if self.alias != DEFAULT_DB_ALIAS:
+            return super().wrap_database_errors
+        return CircuitErrorWrapper(self)
@@ -0,0 +1,209 @@
+"""
+Faceted filtering for the shop page.
+
+Facets are counted the usual "disjunctive" way: each facet's counts apply
+every active filter except its own, so ticking a second lens type never
+hides the first. That takes one grouped query per facet (six in total),
+and the result is cached under the current "catalog" cache tag version.
+Any product, category or feature change bumps that tag (see signals.py),
+which retires every cached facet set at once.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache_tags import get_tag_version
+from .models import Product
+from .search import search_products
+
+
+FACET_CACHE_TIMEOUT = 60 * 15
+
+# (key, label, min inclusive, max inclusive). None means unbounded.
+DEFAULT_PRICE_BUCKETS = [
+    ('low', 'Under $15', None, 14.99),
+    ('mid', '$15 – $25', 15, 25),
+    ('high', '$25+', 25.01, None),
+]
+
+def get_price_buckets():
+    return getattr(settings, 'SHOP_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+
+
+def parse_filters(params):
+    """Read the facet selections out of a QueryDict."""
+    bucket_keys = {bucket[0] for bucket in get_price_buckets()}
+    lens_types = dict(Product.LENS_TYPES)
+    return {
+        'category': sorted({v for v in params.getlist('category') if v}),
+        'lens_type': sorted({v for v in params.getlist('lens') if v in lens_types}),
+        'feature': sorted({v for v in params.getlist('feature') if v.isdigit()}, key=int),
+        'material': sorted({v for v in params.getlist('material') if v}),
+        'sale': params.get('sale') in ('1', 'true', 'on'),
+        'price': sorted({v for v in params.getlist('price') if v in bucket_keys}),
+    }
+
+
+def has_active_filters(filters):
+    return any(filters.values())
+
+
+def price_bucket_q(bucket):
+    key, label, low, high = bucket
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lte=high)
+    return condition
+
+
+def apply_filters(queryset, filters, exclude=None):
+    """Apply every selected facet to ``queryset`` except ``exclude``."""
+    if filters['category'] and exclude != 'category':
+        queryset = queryset.filter(category__slug__in=filters['category'])
+    if filters['lens_type'] and exclude != 'lens_type':
+        queryset = queryset.filter(lens_type__in=filters['lens_type'])
+    if filters['feature'] and exclude != 'feature':
+        # A subquery rather than a join, so multi-feature selections never
+        # duplicate product rows.
+        queryset = queryset.filter(id__in=Product.features.through.objects.filter(
+            feature_id__in=filters['feature']
+        ).values('product_id'))
+    if filters['material'] and exclude != 'material':
+        queryset = queryset.filter(frame_material__in=filters['material'])
+    if filters['sale'] and exclude != 'sale':
+        queryset = queryset.filter(is_on_sale=True)
+    if filters['price'] and exclude != 'price':
+        condition = Q()
+        for bucket in get_price_buckets():
+            if bucket[0] in filters['price']:
+                condition |= price_bucket_q(bucket)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def keep_selected(options, selected, labels=None):
+    """Keep selected values visible (with a zero count) so they can be unticked."""
+    present = {option['value'] for option in options}
+    labels = labels or {}
+    for value in selected:
+        if value not in present:
+            options.append({'value': value, 'label': labels.get(value, value), 'count': 0, 'selected': True})
+    return options
+
+
+def facet_base_queryset(search_query=''):
+    queryset = Product.objects.filter(is_active=True)
+    if search_query:
+        queryset = search_products(queryset, search_query, with_rank=False)
+    return queryset.order_by()
+
+
+def compute_facets(filters, search_query=''):
+    base = facet_base_queryset(search_query)
+
+    rows = (apply_filters(base, filters, exclude='category')
+            .filter(category__is_active=True)
+            .values('category__slug', 'category__name', 'category__order')
+            .annotate(count=Count('id')))
+    categories = [
+        {
+            'value': row['category__slug'],
+            'label': row['category__name'],
+            'count': row['count'],
+            'selected': row['category__slug'] in filters['category'],
+        }
+        for row in sorted(rows, key=lambda r: (r['category__order'], r['category__name']))
+    ]
+
+    rows = (apply_filters(base, filters, exclude='lens_type')
+            .exclude(lens_type='')
+            .values('lens_type')
+            .annotate(count=Count('id')))
+    counts = {row['lens_type']: row['count'] for row in rows}
+    lens_type_facet = [
+        {
+            'value': code,
+            'label': label,
+            'count': counts[code],
+            'selected': code in filters['lens_type'],
+        }
+        for code, label in Product.LENS_TYPES if code in counts
+    ]
+
+    rows = (Product.features.through.objects
+            .filter(product_id__in=apply_filters(base, filters, exclude='feature').values('id'),
+                    feature__is_active=True)
+            .values('feature_id', 'feature__name')
+            .annotate(count=Count('product_id'))
+            .order_by('feature__name'))
+    features = [
+        {
+            'value': str(row['feature_id']),
+            'label': row['feature__name'],
+            'count': row['count'],
+            'selected': str(row['feature_id']) in filters['feature'],
+        }
+        for row in rows
+    ]
+
+    rows = (apply_filters(base, filters, exclude='material')
+            .exclude(frame_material='')
+            .values('frame_material')
+            .annotate(count=Count('id'))
+            .order_by('frame_material'))
+    materials = [
+        {
+            'value': row['frame_material'],
+            'label': row['frame_material'],
+            'count': row['count'],
+            'selected': row['frame_material'] in filters['material'],
+        }
+        for row in rows
+    ]
+
+    sale_count = apply_filters(base, filters, exclude='sale').filter(is_on_sale=True).count()
+
+    buckets = get_price_buckets()
+    price_counts = apply_filters(base, filters, exclude='price').aggregate(**{
+        bucket[0]: Count('id', filter=price_bucket_q(bucket)) for bucket in buckets
+    })
+    prices = [
+        {
+            'value': key,
+            'label': label,
+            'count': price_counts[key],
+            'selected': key in filters['price'],
+        }
+        for key, label, low, high in buckets
+    ]
+
+    return {
+        'category': keep_selected(categories, filters['category']),
+        'lens_type': keep_selected(lens_type_facet, filters['lens_type'], dict(Product.LENS_TYPES)),
+        'feature': keep_selected(features, filters['feature']),
+        'material': keep_selected(materials, filters['material']),
+        'sale': {'count': sale_count, 'selected': filters['sale']},
+        'price': prices,
+    }
+
+
+def facet_cache_key(filters, search_query=''):
+    payload = json.dumps([filters, search_query.lower()], sort_keys=True)
+    digest = hashlib.md5(payload.encode('utf-8')).hexdigest()
+    return f'shop_facets:{get_tag_version("catalog")}:{digest}'
+
+
+def get_facets(filters, search_query=''):
+    """Return facet counts for the current selection, cached per catalog version."""
+    cache_key = facet_cache_key(filters, search_query)
+    facets = cache.get(cache_key)
+    if facets is None:
+        facets = compute_facets(filters, search_query)
+        cache.set(cache_key, facets, FACET_CACHE_TIMEOUT)
+    return facets
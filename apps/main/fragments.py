@@ -0,0 +1,144 @@
+"""
+Computed fragments: cached values that are expensive to rebuild.
+
+``get_or_compute(key, compute, timeout)`` returns the cached value of
+``compute()`` and guards the rebuild against stampedes:
+
+* Single flight. Only one caller per key recomputes. Threads of the same
+  process wait for it and share its result; other workers are held off by
+  a lock in the shared cache (``compute_lock:<key>``, taken with ``add``)
+  and poll for the value for up to ``WAIT_TIMEOUT`` seconds.
+* Stale-while-revalidate. An entry is fresh for ``timeout`` seconds and
+  kept for another ``stale`` seconds. A stale entry is returned right away
+  to everyone except the one caller that holds the lock and rebuilds it.
+* Negative caching. ``None`` is cached too, for ``negative_timeout``, so a
+  missing row (no ``CompanyInfo`` on a fresh install) is not queried on
+  every request.
+* Jitter. Fresh periods are spread by +/- ``jitter`` so entries written
+  together do not all expire in the same second.
+* Stale-if-error. Entries are kept ``STALE_IF_ERROR`` seconds past their
+  stale period. While the database circuit is open (see ``db_circuit.py``)
+  any entry is returned without recomputing, and when ``compute`` fails
+  with a connection error the last value is returned instead.
+
+With ``tags`` the key embeds the current versions of those cache tags, so
+a model save retires the fragment at once (and a retired fragment is never
+served stale). Other exceptions from ``compute``, and connection errors
+with no earlier value to fall back on, propagate to the caller and to the
+threads waiting on it; nothing is cached.
+"""
+
+import random
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .cache_tags import get_tag_versions
+from .db_circuit import DATABASE_ERRORS, database_circuit
+
+
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5.0
+POLL_INTERVAL = 0.05
+NEGATIVE_TIMEOUT = 60
+JITTER = 0.1
+STALE_IF_ERROR = 60 * 60 * 24
+
+_MISSING = object()
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+        self.error = None
+
+
+def fragment_key(key, tags=()):
+    if not tags:
+        return key
+    return f'{key}:' + ':'.join(str(version) for version in get_tag_versions(tags))
+
+
+def get_or_compute(key, compute, timeout, tags=(), stale=None, negative_timeout=NEGATIVE_TIMEOUT, jitter=JITTER):
+    """The cached ``compute()`` for ``key``; see module docstring."""
+    key = fragment_key(key, tags)
+    policy = (timeout, timeout if stale is None else stale, negative_timeout, jitter)
+    entry = cache.get(key)
+    # Other callers can be served this copy while one revalidates it.
+    revalidating = False
+    if entry is not None:
+        now = time.time()
+        if entry['fresh_until'] > now or database_circuit.is_open():
+            return entry['value']
+        revalidating = entry['stale_until'] > now
+    try:
+        value = _single_flight(key, compute, policy, wait=not revalidating)
+    except DATABASE_ERRORS:
+        if entry is None:
+            raise
+        return entry['value']
+    if value is _MISSING:
+        return entry['value'] if entry is not None else compute()
+    return value
+
+
+def _single_flight(key, compute, policy, wait):
+    """Run ``compute`` in one thread per process; _MISSING if it did not run here and ``wait`` is off."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        if not wait:
+            return _MISSING
+        flight.done.wait(WAIT_TIMEOUT)
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+    try:
+        flight.value = _compute_locked(key, compute, policy, wait)
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _compute_locked(key, compute, policy, wait):
+    lock_key = f'compute_lock:{key}'
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, LOCK_TIMEOUT):
+        if not wait:
+            return _MISSING
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry['fresh_until'] > time.time():
+                return entry['value']
+        # The holder is slow or died; compute without the lock.
+        return _store(key, compute(), policy)
+    try:
+        return _store(key, compute(), policy)
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _store(key, value, policy):
+    timeout, stale, negative_timeout, jitter = policy
+    fresh = (negative_timeout if value is None else timeout) * random.uniform(1 - jitter, 1 + jitter)
+    now = time.time()
+    cache.set(key, {
+        'value': value, 'fresh_until': now + fresh, 'stale_until': now + fresh + stale,
+    }, fresh + stale + STALE_IF_ERROR)
+    return value
@@ -0,0 +1,176 @@
+"""
+Product image derivatives.
+
+Every uploaded product, gallery, category and hero image gets resized
+copies at the ``IMAGE_DERIVATIVE_WIDTHS`` widths (card, detail, zoom) in
+WebP and JPEG, plus AVIF when ``IMAGE_DERIVATIVE_AVIF`` is on and Pillow
+can write it. Copies are never upscaled, and they are written through the
+image field's storage (``STORAGES["default"]``) under ``derivatives/``.
+
+An ``ImageDerivatives`` row per source image records its intrinsic size
+and the stored copies. The ``responsive_image`` template tag (see
+``templatetags/images.py``) reads that manifest, through the cache, to emit
+``<picture>`` markup with ``srcset``/``sizes`` and ``width``/``height``.
+Images without a manifest fall back to the original file.
+"""
+
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import ImageDerivatives
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_DIR = 'derivatives'
+MANIFEST_TIMEOUT = None
+
+DEFAULT_WIDTHS = {'card': 300, 'detail': 800, 'zoom': 1600}
+
+# Best format first; the last one is what <img src> falls back to.
+FORMATS = {
+    'avif': {'ext': 'avif', 'mime': 'image/avif', 'pil': 'AVIF', 'options': {'quality': 55}},
+    'webp': {'ext': 'webp', 'mime': 'image/webp', 'pil': 'WEBP', 'options': {'quality': 78, 'method': 4}},
+    'jpeg': {'ext': 'jpg', 'mime': 'image/jpeg', 'pil': 'JPEG', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+# Image fields that get derivatives, as (app label.model, field name).
+SOURCE_FIELDS = [
+    ('main.Product', 'image'),
+    ('main.ProductImage', 'image'),
+    ('main.Category', 'image'),
+    ('main.CompanyInfo', 'hero_image'),
+]
+
+
+def derivative_widths():
+    return getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS)
+
+
+def derivative_formats():
+    formats = ['webp', 'jpeg']
+    if getattr(settings, 'IMAGE_DERIVATIVE_AVIF', False) and '.avif' in Image.registered_extensions():
+        formats.insert(0, 'avif')
+    return formats
+
+
+def manifest_key(source):
+    return f'image_derivatives:{source}'
+
+
+def get_manifest(source):
+    """Return ``{'width', 'height', 'renditions'}`` for ``source``, or None."""
+    if not source:
+        return None
+    key = manifest_key(source)
+    manifest = cache.get(key)
+    if manifest is None:
+        row = ImageDerivatives.objects.filter(source=source).values('width', 'height', 'renditions').first()
+        # Cache misses too ({}), so images without derivatives cost no query.
+        manifest = row or {}
+        cache.set(key, manifest, MANIFEST_TIMEOUT)
+    return manifest or None
+
+
+def prime_manifests(sources):
+    """Load the manifests of a page of images: one cache read, at most one query."""
+    sources = {source for source in sources if source}
+    if not sources:
+        return
+    keys = {manifest_key(source): source for source in sources}
+    missing = [keys[key] for key in set(keys) - set(cache.get_many(list(keys)))]
+    if not missing:
+        return
+    found = {
+        row.pop('source'): row
+        for row in ImageDerivatives.objects.filter(source__in=missing).values('source', 'width', 'height', 'renditions')
+    }
+    cache.set_many({manifest_key(source): found.get(source, {}) for source in missing}, MANIFEST_TIMEOUT)
+
+
+def _encode(image, fmt):
+    spec = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, spec['pil'], **spec['options'])
+    return buffer.getvalue()
+
+
+def generate_derivatives(fieldfile, force=False):
+    """
+    Write the derivatives of ``fieldfile`` and record them. Does nothing if a
+    manifest already exists, unless ``force``. Returns the manifest row.
+    """
+    source = fieldfile.name
+    if not source:
+        return None
+    if not force:
+        existing = ImageDerivatives.objects.filter(source=source).first()
+        if existing is not None:
+            return existing
+
+    storage = fieldfile.storage
+    with storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    width, height = image.size
+
+    stem = os.path.splitext(source)[0]
+    renditions = {fmt: [] for fmt in derivative_formats()}
+    for target in sorted({min(w, width) for w in derivative_widths().values()}):
+        resized = image
+        if target < width:
+            resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+        for fmt in renditions:
+            name = f'{DERIVATIVE_DIR}/{stem}-{target}w.{FORMATS[fmt]["ext"]}'
+            if storage.exists(name):
+                storage.delete(name)
+            renditions[fmt].append([target, storage.save(name, ContentFile(_encode(resized, fmt)))])
+
+    row, created = ImageDerivatives.objects.update_or_create(
+        source=source,
+        defaults={'width': width, 'height': height, 'renditions': renditions},
+    )
+    cache.delete(manifest_key(source))
+    return row
+
+
+def generate_for_instance(instance, field_name, force=False):
+    """Signal/command helper: derivatives for one model field, errors logged."""
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile:
+        return None
+    try:
+        return generate_derivatives(fieldfile, force=force)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("Could not generate derivatives for %s: %s", fieldfile.name, e)
+        return None
+
+
+def srcset(manifest, fmt):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w' for width, name in manifest['renditions'].get(fmt, [])
+    )
+
+
+def best_rendition(manifest, width, fmt='jpeg'):
+    """Storage name of the smallest ``fmt`` copy at least ``width`` wide."""
+    candidates = manifest['renditions'].get(fmt) or []
+    for rendition_width, name in candidates:
+        if rendition_width >= width:
+            return name
+    return candidates[-1][1] if candidates else None
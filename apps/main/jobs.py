@@ -0,0 +1,203 @@
+"""
+Database-backed background jobs.
+
+Slow work (Pillow resizing, derivative generation, uploads to remote
+storage) is queued as ``Job`` rows instead of running inside the request.
+``python manage.py run_jobs`` polls the table and runs claimed jobs in a
+process pool, so CPU-bound Pillow work uses every core without blocking a
+web worker.
+
+* Handlers are registered with :func:`register_job` and take the job's
+  JSON payload as keyword arguments.
+* ``idempotency_key`` makes :func:`enqueue` a no-op for work that is
+  already queued, running or done; failed jobs with the same key are
+  re-armed.
+* A failing job is retried with exponential backoff up to
+  ``max_attempts`` times, then left ``failed`` with its traceback.
+* A job stuck ``running`` for longer than ``JOB_STALE_AFTER`` (its worker
+  died) is handed out again.
+
+With ``JOBS_EAGER = True`` (the default when DEBUG is on) jobs run inline
+right after the enqueuing transaction commits, so development needs no
+worker process.
+"""
+
+import datetime
+import logging
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+
+from django.conf import settings
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+JOB_STALE_AFTER = datetime.timedelta(minutes=15)
+RETRY_BASE_DELAY = 10
+
+
+def register_job(kind):
+    """Decorator registering ``func(**payload)`` as the handler for ``kind``."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def jobs_eager():
+    return getattr(settings, 'JOBS_EAGER', settings.DEBUG)
+
+
+def enqueue(kind, payload=None, idempotency_key=None, max_attempts=3, delay=0, using=DEFAULT_DB_ALIAS):
+    """Queue a job; it becomes visible to workers when the transaction commits."""
+    if kind not in HANDLERS:
+        raise KeyError(f'No job handler registered for {kind!r}')
+    fields = {
+        'kind': kind,
+        'payload': payload or {},
+        'max_attempts': max_attempts,
+        'run_after': timezone.now() + datetime.timedelta(seconds=delay),
+    }
+    if idempotency_key:
+        job, created = Job.objects.using(using).get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        if not created:
+            if job.status != Job.FAILED:
+                return job
+            Job.objects.using(using).filter(pk=job.pk, status=Job.FAILED).update(
+                status=Job.PENDING, attempts=0, last_error='', **fields,
+            )
+    else:
+        job = Job.objects.using(using).create(**fields)
+
+    if jobs_eager():
+        transaction.on_commit(lambda: run_now(job.pk, using=using), using=using)
+    return job
+
+
+def execute(kind, payload):
+    """Run one handler. Called in the worker's child processes."""
+    HANDLERS[kind](**payload)
+
+
+def claim(job_id, using=DEFAULT_DB_ALIAS):
+    """Mark a pending job running; False if another worker got there first."""
+    return bool(Job.objects.using(using).filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING, locked_at=timezone.now(), attempts=F('attempts') + 1,
+    ))
+
+
+def finish(job_id, error=None, using=DEFAULT_DB_ALIAS):
+    """Record the outcome of a run and schedule a retry if attempts remain."""
+    now = timezone.now()
+    jobs = Job.objects.using(using).filter(pk=job_id)
+    if error is None:
+        jobs.update(status=Job.DONE, finished_at=now, locked_at=None, last_error='')
+        return
+    job = jobs.first()
+    if job is None:
+        return
+    if job.attempts < job.max_attempts:
+        delay = RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+        jobs.update(status=Job.PENDING, locked_at=None, last_error=error,
+                    run_after=now + datetime.timedelta(seconds=delay))
+    else:
+        logger.error("Job %s (%s) failed after %s attempts: %s", job.pk, job.kind, job.attempts, error)
+        jobs.update(status=Job.FAILED, finished_at=now, locked_at=None, last_error=error)
+
+
+def run_now(job_id, using=DEFAULT_DB_ALIAS):
+    """Run a job in this process (eager mode and the admin "run now" action)."""
+    if not claim(job_id, using):
+        return
+    job = Job.objects.using(using).get(pk=job_id)
+    try:
+        execute(job.kind, job.payload)
+    except Exception:
+        finish(job_id, traceback.format_exc(), using)
+    else:
+        finish(job_id, using=using)
+
+
+def requeue_stale(using=DEFAULT_DB_ALIAS):
+    return Job.objects.using(using).filter(
+        status=Job.RUNNING, locked_at__lt=timezone.now() - JOB_STALE_AFTER,
+    ).update(status=Job.PENDING, locked_at=None)
+
+
+def due_jobs(limit, using=DEFAULT_DB_ALIAS):
+    return list(Job.objects.using(using).filter(
+        status=Job.PENDING, run_after__lte=timezone.now(),
+    ).order_by('run_after', 'id').values_list('pk', 'kind', 'payload')[:limit])
+
+
+def run_worker(processes=None, poll_interval=1.0, once=False, using=DEFAULT_DB_ALIAS):
+    """
+    Claim due jobs and run them in a process pool until interrupted.
+
+    With ``once`` the worker drains what is due right now and returns.
+    Returns the number of jobs run.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    # Children are spawned fresh and open their own database connections.
+    # django.setup is the initializer because unpickling anything from this
+    # module would import the models before the app registry is ready.
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup)
+    running = {}
+    total = 0
+    try:
+        while True:
+            requeue_stale(using)
+            for job_id, kind, payload in due_jobs(processes * 2 - len(running), using):
+                if claim(job_id, using):
+                    running[pool.submit(execute, kind, payload)] = job_id
+
+            if not running:
+                if once:
+                    return total
+                connections[using].close()
+                time.sleep(poll_interval)
+                continue
+
+            done, pending = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                _record(future, running.pop(future), using)
+                total += 1
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                for future, job_id in running.items():
+                    finish(job_id, 'Worker process died', using)
+                running.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future, job_id in running.items():
+            if future.cancelled():
+                # Never started: hand it back without using up an attempt.
+                Job.objects.using(using).filter(pk=job_id).update(
+                    status=Job.PENDING, locked_at=None, attempts=F('attempts') - 1,
+                )
+            else:
+                _record(future, job_id, using)
+
+
+def _record(future, job_id, using):
+    error = future.exception()
+    if error is None:
+        finish(job_id, using=using)
+    elif isinstance(error, BrokenProcessPool):
+        finish(job_id, 'Worker process died', using)
+    else:
+        finish(job_id, ''.join(traceback.format_exception(error)), using)
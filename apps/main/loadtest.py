@@ -0,0 +1,354 @@
+"""
+End-to-end load testing (``manage.py loadtest``).
+
+Virtual users replay weighted scenario mixes (``SCENARIOS``) against a
+running site over HTTP, each with its own cookie jar and CSRF token, the
+way a browser session would. Every request is recorded under its URL name
+with its latency, status and - from the ``Server-Timing`` header of
+``RequestMetricsMiddleware`` - its query count, and the run is summarized
+per endpoint as p50/p95/p99 latency, throughput, errors and queries.
+
+``boot_server`` starts gunicorn (or runserver) against the configured
+database with metrics sampling on every request; ``compare`` checks a
+summary against a stored baseline and lists the regressions.
+
+The virtual users are threads in one process, which is plenty to saturate
+one or two gunicorn workers. For more, run several ``loadtest --url``
+processes against the same server.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+
+QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+PERCENTILES = (50, 95, 99)
+# Latency changes smaller than this are noise, whatever the percentage.
+NOISE_MS = 5
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of the sorted list ``values``."""
+    if not values:
+        return None
+    return values[max(math.ceil(pct / 100 * len(values)), 1) - 1]
+
+
+class Recorder:
+    """Thread-safe per-endpoint samples."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: {'latency': [], 'queries': [], 'errors': 0})
+
+    def record(self, name, latency_ms, status, queries):
+        with self.lock:
+            sample = self.samples[name]
+            sample['latency'].append(latency_ms)
+            if queries is not None:
+                sample['queries'].append(queries)
+            if not 200 <= status < 400:
+                sample['errors'] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        everything = []
+        for name, sample in sorted(self.samples.items()):
+            latency = sorted(sample['latency'])
+            everything.extend(latency)
+            endpoints[name] = self.describe(latency, sample['errors'], elapsed, sample['queries'])
+        errors = sum(sample['errors'] for sample in self.samples.values())
+        return {'endpoints': endpoints, 'total': self.describe(sorted(everything), errors, elapsed, [])}
+
+    @staticmethod
+    def describe(latency, errors, elapsed, queries):
+        data = {
+            'requests': len(latency),
+            'errors': errors,
+            'rps': round(len(latency) / elapsed, 2) if elapsed else 0,
+        }
+        for pct in PERCENTILES:
+            value = percentile(latency, pct)
+            data[f'p{pct}_ms'] = round(value, 1) if value is not None else None
+        if queries:
+            data['queries_mean'] = round(sum(queries) / len(queries), 2)
+            data['queries_max'] = max(queries)
+        return data
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Report redirects (quick quote, share) instead of following them off-site."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """One browser session: cookies, a CSRF token and a random source."""
+
+    def __init__(self, base_url, recorder, rng):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect)
+        self.csrf_token = None
+
+    def request(self, path, data=None, json_body=None):
+        headers = {'User-Agent': 'eyedentity-loadtest'}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if body is not None and self.csrf_token:
+            headers['X-CSRFToken'] = self.csrf_token
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(Request(self.base_url + path, data=body, headers=headers), timeout=30) as response:
+                status, payload, timing = response.status, response.read(), response.headers.get('Server-Timing')
+        except HTTPError as e:
+            status, payload, timing = e.code, e.read(), e.headers.get('Server-Timing')
+        except (URLError, OSError):
+            status, payload, timing = 0, b'', None
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        match = QUERIES_RE.search(timing or '')
+        self.recorder.record(endpoint_name(path), latency_ms, status, int(match.group(1)) if match else None)
+        return status, payload
+
+    def get(self, path, **params):
+        return self.request(f'{path}?{urlencode(params)}' if params else path)
+
+    def post(self, path, data=None, json_body=None):
+        if self.csrf_token is None:
+            self.visitor_state()
+        if data is None and json_body is None:
+            data = {}
+        return self.request(path, data=data, json_body=json_body)
+
+    def visitor_state(self):
+        # What the cached pages call for the per-visitor bits and the token.
+        status, payload = self.get('/api/visitor/')
+        if status == 200:
+            self.csrf_token = json.loads(payload)['csrf_token']
+
+
+def endpoint_name(path):
+    try:
+        return resolve(path.split('?', 1)[0]).view_name
+    except Resolver404:
+        return path
+
+
+# Scenarios: one visit each, drawing pages from the sampled targets.
+
+def browse(user, targets):
+    """The order funnel: home, shop, category, product, WhatsApp click."""
+    rng = user.rng
+    user.get('/')
+    user.visitor_state()
+    user.get('/shop/', **rng.choice([{}, {'page': rng.randint(1, 20)}, {'order': 'price'}, {'lens_type': 'sunglasses'}]))
+    user.get(f'/category/{rng.choice(targets["categories"])}/')
+    product = rng.choice(targets['products'])
+    user.get(f'/product/{product["slug"]}/')
+    if rng.random() < 0.3:
+        user.post('/api/track-whatsapp-order/', json_body={
+            'product_id': product['id'], 'product_name': product['name'], 'price': product['price'],
+        })
+
+
+def search(user, targets):
+    rng = user.rng
+    term = rng.choice(targets['terms'])
+    user.get('/search/', q=term)
+    user.get('/shop/', search=term)
+    user.get(f'/product/{rng.choice(targets["products"])["slug"]}/')
+
+
+def blog(user, targets):
+    rng = user.rng
+    user.get('/blog/')
+    if targets['posts']:
+        user.get(f'/blog/{rng.choice(targets["posts"])}/')
+        user.get('/blog/api/popular/')
+    user.get('/blog/search/', q=rng.choice(targets['terms']))
+
+
+def wishlist(user, targets):
+    rng = user.rng
+    products = rng.sample(targets['products'], min(3, len(targets['products'])))
+    for product in products:
+        user.get(f'/product/{product["slug"]}/')
+        user.post(f'/wishlist/add/{product["id"]}/')
+    user.get('/wishlist/count/')
+    user.post(f'/wishlist/remove/{products[0]["id"]}/')
+
+
+def newsletter(user, targets):
+    user.get('/')
+    user.visitor_state()
+    user.post('/newsletter/signup/', json_body={'email': f'loadtest-{user.rng.getrandbits(48):x}@example.com'})
+
+
+SCENARIOS = {
+    'browse': (browse, 50),
+    'search': (search, 15),
+    'blog': (blog, 20),
+    'wishlist': (wishlist, 10),
+    'newsletter': (newsletter, 5),
+}
+
+
+def parse_mix(value):
+    """``"browse=60,blog=40"`` -> ``{'browse': 60, 'blog': 40}``; empty means the default weights."""
+    if not value:
+        return {name: weight for name, (scenario, weight) in SCENARIOS.items()}
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def sample_targets(seed, limit=500):
+    """Slugs and search terms to visit, picked from the database the server uses."""
+    from apps.blog.models import BlogPost
+    from .models import Category, Product
+
+    rng = random.Random(f'{seed}:targets')
+    ids = list(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+    ids = rng.sample(ids, min(limit, len(ids)))
+    products = [
+        {'id': pk, 'slug': slug, 'name': name, 'price': str(price)}
+        for pk, slug, name, price in Product.objects.filter(pk__in=ids).order_by('pk').values_list('pk', 'slug', 'name', 'price')
+    ]
+    words = sorted({word.lower() for product in products for word in product['name'].split() if word.isalpha()})
+    posts = list(BlogPost.objects.filter(is_published=True).values_list('slug', flat=True))
+    return {
+        'products': products,
+        'categories': list(Category.objects.filter(is_active=True).values_list('slug', flat=True)),
+        'posts': rng.sample(posts, min(limit, len(posts))),
+        'terms': rng.sample(words, min(50, len(words))) or ['frame'],
+    }
+
+
+def run_load(base_url, targets, mix, concurrency=8, duration=60, warmup=5, seed='loadtest'):
+    """Run ``concurrency`` virtual users for ``warmup`` + ``duration`` seconds; return the summary."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    recorder = Recorder()
+    discard = Recorder()
+    phase = {'recorder': discard}
+    deadline = time.monotonic() + warmup + duration
+
+    def worker(n):
+        rng = random.Random(f'{seed}:user:{n}')
+        while time.monotonic() < deadline:
+            # A fresh session per visit, as most shop traffic is.
+            user = VirtualUser(base_url, phase['recorder'], rng)
+            SCENARIOS[rng.choices(names, weights)[0]][0](user, targets)
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    phase['recorder'] = recorder
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    summary = recorder.summary(time.monotonic() - started)
+    summary['config'] = {
+        'concurrency': concurrency, 'duration': duration, 'warmup': warmup, 'mix': mix, 'seed': seed,
+    }
+    return summary
+
+
+def compare(summary, baseline, tolerance=0.2):
+    """Regressions of ``summary`` against ``baseline``, as human-readable strings."""
+    problems = []
+    base_total, total = baseline['total'], summary['total']
+    if total['rps'] < base_total['rps'] * (1 - tolerance):
+        problems.append(f'throughput {total["rps"]} req/s, baseline {base_total["rps"]}')
+    for name, current in summary['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if current[key] is not None and base[key] is not None and \
+                    current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > NOISE_MS:
+                problems.append(f'{name}: {key} {current[key]}, baseline {base[key]}')
+        if 'queries_mean' in current and 'queries_mean' in base and current['queries_mean'] > base['queries_mean'] + 0.5:
+            problems.append(f'{name}: {current["queries_mean"]} queries per request, baseline {base["queries_mean"]}')
+        if current['errors'] and not base['errors']:
+            problems.append(f'{name}: {current["errors"]} errors, baseline none')
+    return problems
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def boot_server(server='gunicorn', workers=1, port=None, timeout=30):
+    """Start the site on 127.0.0.1 with every request sampled; yield its base URL."""
+    port = port or free_port()
+    env = {**os.environ, 'REQUEST_METRICS_SAMPLE_RATE': '1.0', 'REQUEST_METRICS_PUBLIC': 'True'}
+    if server == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn', 'Eyedentity.wsgi', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--log-level', 'warning',
+        ]
+    else:
+        command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload', '--skip-checks']
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_until_ready(base_url, process, log, timeout)
+            yield base_url
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def wait_until_ready(base_url, process, log, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f'The server exited with {process.returncode}:\n{log.read().decode(errors="replace")[-2000:]}')
+        try:
+            with build_opener().open(f'{base_url}/api/visitor/', timeout=2):
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f'The server did not answer within {timeout}s')
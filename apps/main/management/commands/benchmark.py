@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from apps.main.benchmarks import compare_results, run_benchmarks, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = 'Time model properties and templates on hot paths (µs/call and queries/call)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50,
+                            help='Objects per round, and products/posts in the fixtures (default: 50)')
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Timed rounds per benchmark; the best and the median are reported (default: 5)')
+        parser.add_argument('--only', default=None,
+                            help='Run only the benchmarks whose name contains this, e.g. "memory:" or "template"')
+        parser.add_argument('--output', default=None,
+                            help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', default=None,
+                            help='Compare against results written by an earlier --output')
+
+    def handle(self, *args, **options):
+        if options['size'] < 1 or options['rounds'] < 1:
+            raise CommandError('--size and --rounds must be at least 1.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+
+        # A throwaway database, as the test runner makes, with DEBUG off and
+        # the in-memory email backend; the configured database is untouched.
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed_benchmark_data(options['size'])
+            results = run_benchmarks(options['size'], options['rounds'], options['only'])
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        self.print_results(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'size': options['size'], 'rounds': options['rounds'], 'results': results}, f, indent=2)
+
+    def print_results(self, results, baseline):
+        changes = {name: ratio for name, before, after, ratio in compare_results(results, baseline or {})}
+        width = max((len(name) for name in results), default=0)
+        header = f'{"benchmark":<{width}}  {"us/call":>10}  {"median":>10}  {"queries":>8}'
+        self.stdout.write(header + (f'  {"vs base":>8}' if baseline else ''))
+        for name, result in results.items():
+            values = [result['us_per_call'], result['median_us'], result['queries_per_call']]
+            line = f'{name:<{width}}  ' + '  '.join(
+                f'{"-" if value is None else value:>{w}}' for value, w in zip(values, (10, 10, 8))
+            )
+            if baseline:
+                line += f'  {f"{changes[name]:.2f}x" if name in changes else "-":>8}'
+            self.stdout.write(line)
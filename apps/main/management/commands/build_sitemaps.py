@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.static_sitemaps import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Write the gzipped sitemap shards and sitemap index, rewriting only what changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Rewrite every shard, ignoring the previous build')
+
+    def handle(self, *args, **options):
+        stats = build_sitemaps(force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['written']} sitemap shards; {stats['unchanged']} unchanged, {stats['removed']} removed."
+        ))
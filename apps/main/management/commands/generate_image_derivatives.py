@@ -0,0 +1,25 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from apps.main.cache_tags import bump_tags
+from apps.main.images import SOURCE_FIELDS, generate_for_instance
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG derivatives for product, gallery, category and hero images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        total = failed = 0
+        for label, field_name in SOURCE_FIELDS:
+            model = apps.get_model(label)
+            for instance in model.objects.exclude(**{field_name: ''}).iterator():
+                if generate_for_instance(instance, field_name, force=options['force']) is None:
+                    failed += 1
+                else:
+                    total += 1
+        bump_tags('catalog', 'company')
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} images ({failed} failed).'))
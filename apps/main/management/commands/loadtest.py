@@ -0,0 +1,80 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.loadtest import PERCENTILES, boot_server, compare, parse_mix, run_load, sample_targets
+
+
+class Command(BaseCommand):
+    help = 'Replay weighted browse/search/blog/wishlist/newsletter visits and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None,
+                            help='Load an already running site instead of booting one')
+        parser.add_argument('--server', choices=['gunicorn', 'runserver'], default='gunicorn',
+                            help='Server to boot when --url is not given (default: gunicorn)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='gunicorn workers to boot (default: 1)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Virtual users (default: 8)')
+        parser.add_argument('--duration', type=int, default=60,
+                            help='Measured seconds (default: 60)')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured seconds first, to fill the caches (default: 5)')
+        parser.add_argument('--mix', default='',
+                            help='Scenario weights, e.g. "browse=50,search=15,blog=20,wishlist=10,newsletter=5"')
+        parser.add_argument('--seed', default='loadtest',
+                            help='Seed for the pages each virtual user visits (default: loadtest)')
+        parser.add_argument('--output', default=None,
+                            help='Write the summary as JSON to this file')
+        parser.add_argument('--baseline', default=None,
+                            help='Compare against a summary written by an earlier --output; fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown against the baseline, as a fraction (default: 0.2)')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(e)
+        targets = sample_targets(options['seed'])
+        if not targets['products'] or not targets['categories']:
+            raise CommandError('No active products to visit; seed the database first (manage.py seed_scale).')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        if options['url']:
+            server = nullcontext(options['url'])
+        else:
+            server = boot_server(options['server'], workers=options['workers'])
+        try:
+            with server as base_url:
+                self.stdout.write(f'Loading {base_url} with {options["concurrency"]} users for {options["duration"]}s...')
+                summary = run_load(
+                    base_url, targets, mix, concurrency=options['concurrency'], duration=options['duration'],
+                    warmup=options['warmup'], seed=options['seed'],
+                )
+        except RuntimeError as e:
+            raise CommandError(e)
+
+        self.print_summary(summary)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(summary, f, indent=2)
+        if baseline is not None:
+            problems = compare(summary, baseline, options['tolerance'])
+            if problems:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(problems))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def print_summary(self, summary):
+        columns = ['requests', 'rps', 'errors'] + [f'p{pct}_ms' for pct in PERCENTILES] + ['queries_mean']
+        rows = [(name, data) for name, data in summary['endpoints'].items()] + [('TOTAL', summary['total'])]
+        width = max(len(name) for name, data in rows)
+        self.stdout.write(f'{"endpoint":<{width}}  ' + '  '.join(f'{column:>12}' for column in columns))
+        for name, data in rows:
+            values = ('-' if data.get(column) is None else str(data[column]) for column in columns)
+            self.stdout.write(f'{name:<{width}}  ' + '  '.join(f'{value:>12}' for value in values))
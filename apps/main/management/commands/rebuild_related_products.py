@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.cache_tags import bump_tags
+from apps.main.related import rebuild_related, neighbor_count
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed related-products lists for every active product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=None,
+                            help='Neighbors stored per product (default: RELATED_PRODUCTS_K or 8)')
+        parser.add_argument('--database', default='default',
+                            help='Database alias to rebuild (default: default)')
+
+    def handle(self, *args, **options):
+        k = options['k'] or neighbor_count()
+        total = rebuild_related(using=options['database'], k=k)
+        bump_tags('catalog')
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored up to {k} related products for {total} products.'
+        ))
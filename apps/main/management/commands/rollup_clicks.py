@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.rollups import rollup_clicks, rebuild_rollups, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Fold new WhatsApp order clicks into the hourly/daily click rollups (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-delay', action='store_true',
+                            help='Roll up to the newest click instead of the newest one seen by the previous run '
+                                 '(safe only while no clicks are being written)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the rollups and recompute them from every click')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Clicks folded per transaction (default: {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            processed = rebuild_rollups()
+        else:
+            processed = rollup_clicks(delay=not options['no_delay'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {processed} clicks.'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from apps.main.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (image resizing, derivatives, uploads) in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: one per CPU)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between polls when the queue is empty (default: 1)')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due now, then exit')
+        parser.add_argument('--database', default='default',
+                            help='Database alias holding the job table (default: default)')
+
+    def handle(self, *args, **options):
+        try:
+            total = run_worker(
+                processes=options['processes'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+                using=options['database'],
+            )
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} jobs.'))
@@ -0,0 +1,107 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.main.cache_tags import bump_tags
+from apps.main.models import Product
+from apps.main.scale_data import SEED_PREFIX, create_activity, create_blog, create_catalog, placeholder_images
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with deterministic production-scale data for performance work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', default='eyedentity',
+                            help='Seed the data is derived from (default: eyedentity)')
+        parser.add_argument('--products', type=int, default=20000,
+                            help='Products to create (default: 20000)')
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Blog posts to create (default: 2000)')
+        parser.add_argument('--comments', type=float, default=4,
+                            help='Average comment threads per post (default: 4)')
+        parser.add_argument('--clicks', type=int, default=1000000,
+                            help='WhatsApp order clicks to create (default: 1000000)')
+        parser.add_argument('--wishlists', type=int, default=250000,
+                            help='Wishlists to create, with 1-8 items each (default: 250000)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Days of click history before --until (default: 365)')
+        parser.add_argument('--until', type=datetime.date.fromisoformat, default=None,
+                            help='Date the history ends on, YYYY-MM-DD (default: today)')
+        parser.add_argument('--images', type=int, default=24,
+                            help='Placeholder images written to the default storage and shared by '
+                                 'products, categories and posts; 0 leaves image fields empty (default: 24)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes inserting clicks and wishlists; ignored on SQLite (default: 1)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows per INSERT (default: 2000)')
+        parser.add_argument('--skip-indexes', action='store_true',
+                            help='Do not rebuild the product and blog search indexes afterwards')
+        parser.add_argument('--related', action='store_true',
+                            help='Also recompute related products (slow on large catalogs)')
+        parser.add_argument('--rollups', action='store_true',
+                            help='Also roll up the clicks (slow: a full backfill of --days of history)')
+        parser.add_argument('--flush', action='store_true',
+                            help='Empty the whole database first')
+        parser.add_argument('--force', action='store_true',
+                            help='Run even with DEBUG off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off; this looks like production. Pass --force to seed anyway.')
+        if options['flush']:
+            call_command('flush', interactive=False, verbosity=0)
+        elif Product.objects.filter(slug__startswith=SEED_PREFIX).exists():
+            raise CommandError('This database is already seeded. Pass --flush to start from an empty one.')
+
+        self.verbosity = options['verbosity']
+        seed = options['seed']
+        batch_size = options['batch_size']
+        until = options['until'] or timezone.localdate()
+        until = timezone.make_aware(datetime.datetime.combine(until, datetime.time.min))
+        self.started = time.monotonic()
+
+        images = placeholder_images(options['images'], seed) if options['images'] else []
+        self.report(f'{len(images)} placeholder images')
+        catalog = create_catalog(seed, options['products'], images, batch_size)
+        self.report(f'{len(catalog)} products')
+        posts, comments = create_blog(seed, options['posts'], options['comments'], images, until, batch_size)
+        self.report(f'{posts} blog posts, {comments} comments')
+
+        totals = {'clicks': 0, 'wishlists': 0}
+        for table, rows in create_activity(
+            seed, catalog, options['clicks'], options['wishlists'], until, options['days'],
+            options['workers'], batch_size,
+        ):
+            totals[table] += rows
+            self.report(f'{totals[table]} {table} rows', verbosity=2)
+        self.report(f'{totals["clicks"]} clicks, {totals["wishlists"]} wishlist and wishlist item rows')
+
+        self.derive(not options['skip_indexes'], options['related'], options['rollups'])
+        bump_tags('catalog', 'company', 'blog')
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {time.monotonic() - self.started:.0f}s. Run build_sitemaps and '
+            f'generate_image_derivatives to finish.'
+        ))
+
+    def derive(self, indexes, related, rollups):
+        from apps.blog.models import BlogPost
+        from apps.blog.search import rebuild_index as rebuild_blog_index
+        from apps.main.related import rebuild_related
+        from apps.main.rollups import rollup_clicks
+        from apps.main.search import rebuild_index as rebuild_product_index
+
+        if indexes:
+            self.report(f'indexed {rebuild_product_index(Product.objects.all())} products')
+            self.report(f'indexed {rebuild_blog_index(BlogPost.objects.all())} posts')
+        if rollups:
+            self.report(f'rolled up {rollup_clicks(delay=False)} clicks')
+        if related:
+            self.report(f'related products for {rebuild_related()} products')
+
+    def report(self, message, verbosity=1):
+        if self.verbosity >= verbosity:
+            self.stdout.write(f'[{time.monotonic() - self.started:7.1f}s] {message}')
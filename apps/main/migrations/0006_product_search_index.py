@@ -0,0 +1,110 @@
+# Migration creating the full-text product search index (see apps/main/search.py)
+
+from django.db import migrations
+
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS main_productsearch (
+        product_id bigint PRIMARY KEY REFERENCES main_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS main_productsearch_document_gin ON main_productsearch USING gin (document)",
+]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS main_productsearch USING fts5(
+        name, category, keywords, description,
+        tokenize = 'porter unicode61'
+    )
+    """,
+]
+
+
+BATCH_SIZE = 500
+
+# The indexing code is frozen here, as it stood at this migration, so later
+# changes to apps/main/search.py or Product cannot break it. Run
+# rebuild_search_index to re-index with the current code.
+LENS_TYPE_TOKENS = {
+    'prescription': 'prescription',
+    'reading': 'reading',
+    'sunglasses': 'sunglasses',
+    'blue_light': 'bluelight',
+    'photochromic': 'photochromic',
+    'polarized': 'polarized',
+}
+
+POSTGRES_INSERT = (
+    "INSERT INTO main_productsearch (product_id, document) VALUES (%s, "
+    "setweight(to_tsvector('english', %s), 'A') || "
+    "setweight(to_tsvector('english', %s), 'B') || "
+    "setweight(to_tsvector('english', %s), 'C') || "
+    "setweight(to_tsvector('english', %s), 'D')) "
+    "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+)
+
+SQLITE_INSERT = "INSERT INTO main_productsearch (rowid, name, category, keywords, description) VALUES (%s, %s, %s, %s, %s)"
+
+
+def build_document(product):
+    lens_labels = dict(product._meta.get_field('lens_type').flatchoices)
+    keywords = []
+    if product.lens_type:
+        keywords.append(LENS_TYPE_TOKENS.get(product.lens_type, product.lens_type))
+        keywords.append(lens_labels.get(product.lens_type, ''))
+    keywords.extend(feature.name for feature in product.features.all())
+    keywords.extend([
+        product.frame_material, product.lens_material,
+        product.uv_protection, product.product_code or '',
+    ])
+    return (
+        product.pk,
+        product.name,
+        product.category.name if product.category_id else '',
+        ' '.join(k for k in keywords if k),
+        product.description,
+    )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_CREATE
+    elif vendor == 'sqlite':
+        statements = SQLITE_CREATE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+    Product = apps.get_model('main', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).select_related('category').prefetch_related('features')
+    insert = POSTGRES_INSERT if vendor == 'postgresql' else SQLITE_INSERT
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for product in products.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+            rows.append(build_document(product))
+            if len(rows) >= BATCH_SIZE:
+                cursor.executemany(insert, rows)
+                rows = []
+        if rows:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute("DROP TABLE IF EXISTS main_productsearch")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_alter_companyinfo_description'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-16 20:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='whatsapporderclick',
+            name='clicked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
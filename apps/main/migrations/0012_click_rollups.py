@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-16 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_click_time_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('total', 'All clicks')], max_length=10)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('label', models.CharField(blank=True, max_length=200)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('unique_sessions', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Click Report',
+                'verbose_name_plural': 'Click Reports',
+                'ordering': ['-period_start', '-clicks'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water', models.BigIntegerField(default=0)),
+                ('next_high_water', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='whatsapporderclick',
+            index=models.Index(fields=['session_key', 'clicked_at'], name='click_session_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='clickrollup',
+            unique_together={('period', 'dimension', 'period_start', 'key')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_click_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'category', 'lens_type', 'price'], name='product_related_block_idx'),
+        ),
+    ]
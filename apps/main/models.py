@@ -1,10 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
-from PIL import Image
-import urllib.parse
 
 
 class AboutGlasses(models.Model):
@@ -93,6 +93,15 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_active', 'category'], name='product_active_category_idx'),
+            models.Index(fields=['is_active', 'lens_type'], name='product_active_lens_idx'),
+            models.Index(fields=['is_active', 'frame_material'], name='product_active_material_idx'),
+            models.Index(fields=['is_active', 'is_on_sale'], name='product_active_sale_idx'),
+            models.Index(fields=['is_active', 'price'], name='product_active_price_idx'),
+            # Related-product candidates; see related.py.
+            models.Index(fields=['is_active', 'category', 'lens_type', 'price'], name='product_related_block_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -113,105 +122,24 @@ class Product(models.Model):
             return round(discount)
         return 0
 
-    @property
+    @cached_property
     def whatsapp_link(self):
-        from django.db import ProgrammingError
-        try:
-            company_info = CompanyInfo.objects.first()
-            whatsapp_number = company_info.whatsapp.replace(' ', '').replace('-', '') if company_info else '263784342632'
-        except (ProgrammingError, Exception):
-            whatsapp_number = '263784342632'
-        if self.whatsapp_message:
-            message = self.whatsapp_message
-        else:
-            message_parts = [
-                "🛒 *ORDER REQUEST*",
-                "",
-                f"📦 Product: {self.name}",
-            ]
-            if self.product_code:
-                message_parts.append(f"🔢 Code: {self.product_code}")
-            message_parts.append(f"💰 Price: ${self.price}")
-            if self.old_price and self.old_price > self.price:
-                savings = float(self.old_price) - float(self.price)
-                message_parts.append(f"💸 You Save: ${savings:.2f}")
-            if self.stock_quantity <= 5 and self.stock_quantity > 0:
-                message_parts.append(f"⚠️ Only {self.stock_quantity} left in stock!")
-            message_parts.extend([
-                "",
-                f"📱 View product: {self.get_full_url()}",
-                "",
-                "Hi! I'd like to order this product. Please confirm availability and delivery options.",
-            ])
-            message = "\n".join(message_parts)
-        encoded_message = urllib.parse.quote(message)
-        return f"https://wa.me/{whatsapp_number}?text={encoded_message}"
+        from .whatsapp import order_link
+        return order_link(self)
 
     def get_full_url(self):
-        from django.contrib.sites.models import Site
-        try:
-            current_site = Site.objects.get_current()
-            domain = current_site.domain
-            protocol = 'https' if not domain.startswith('localhost') else 'http'
-            return f"{protocol}://{domain}{self.get_absolute_url()}"
-        except:
-            return f"https://eyedentity-gx20.onrender.com{self.get_absolute_url()}"
+        from .whatsapp import product_url
+        return product_url(self)
 
-    @property
+    @cached_property
     def whatsapp_quick_quote(self):
-        from django.db import ProgrammingError
-        try:
-            company_info = CompanyInfo.objects.first()
-            whatsapp_number = company_info.whatsapp.replace(' ', '').replace('-', '') if company_info else '263784342632'
-        except (ProgrammingError, Exception):
-            whatsapp_number = '263784342632'
-        message_parts = [f"Hi! I'd like a quote for {self.name}"]
-        if self.product_code:
-            message_parts[0] += f" (Code: {self.product_code})"
-        message_parts.extend([
-            ". Please provide:",
-            "- Availability",
-            "- Delivery cost to my location",
-            "- Payment options",
-            "- Total price"
-        ])
-        message = "\n".join(message_parts)
-        encoded_message = urllib.parse.quote(message)
-        return f"https://wa.me/{whatsapp_number}?text={encoded_message}"
+        from .whatsapp import quick_quote_link
+        return quick_quote_link(self)
 
-    @property
+    @cached_property
     def whatsapp_share_link(self):
-        from django.db import ProgrammingError
-        if self.whatsapp_share_message:
-            message = self.whatsapp_share_message.format(
-                product_name=self.name,
-                product_code=self.product_code if self.product_code else 'N/A',
-                price=self.price,
-                url=self.get_full_url()
-            )
-        else:
-            message_parts = [
-                f"👓 Check out this eyewear! 👓",
-                "",
-                f"*{self.name}*",
-            ]
-            if self.product_code:
-                message_parts.append(f"Code: {self.product_code}")
-            message_parts.append(f"Price: ${self.price}")
-            if self.old_price and self.old_price > self.price:
-                message_parts.append(f"🔥 Save {self.discount_percentage}% (Was ${self.old_price})")
-            if self.features.exists():
-                features_list = ", ".join([f.name for f in self.features.all()[:3]])
-                message_parts.append(f"✨ Features: {features_list}")
-            message_parts.extend([
-                "",
-                f"View details: {self.get_full_url()}",
-                "",
-                "🛒 Shop premium eyewear at Eyedentity!",
-            ])
-            message = "\n".join(message_parts)
-        encoded_message = urllib.parse.quote(message)
-        return f"https://wa.me/?text={encoded_message}"
+        from .whatsapp import share_link
+        return share_link(self)
 
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'slug': self.slug})
@@ -232,38 +160,8 @@ class Wishlist(models.Model):
 
     @property
     def whatsapp_order_link(self):
-        from django.db import ProgrammingError
-        try:
-            company_info = CompanyInfo.objects.first()
-            whatsapp_number = company_info.whatsapp.replace(' ', '').replace('-', '') if company_info else '263784342632'
-        except (ProgrammingError, Exception):
-            whatsapp_number = '263784342632'
-        message_parts = [
-            "🛒 *MULTIPLE ITEMS ORDER*",
-            "",
-            "I'm interested in ordering the following items:",
-            "",
-        ]
-        for item in self.items.select_related('product__category').all():
-            product = item.product
-            message_parts.append(
-                f"📦 {product.name}\n"
-                f"   Code: {product.product_code}\n"
-                f"   Price: ${product.price}"
-            )
-            message_parts.append("")
-        message_parts.extend([
-            f"💰 *Total: ${self.total_price:.2f}*",
-            "",
-            "Please confirm:",
-            "- Availability of all items",
-            "- Total delivery cost to my location",
-            "- Payment options",
-            "- Estimated delivery time",
-        ])
-        message = "\n".join(message_parts)
-        encoded_message = urllib.parse.quote(message)
-        return f"https://wa.me/{whatsapp_number}?text={encoded_message}"
+        from .whatsapp import wishlist_order_link
+        return wishlist_order_link(self.items.select_related('product__category').all())
 
 
 class WishlistItem(models.Model):
@@ -286,10 +184,15 @@ class WhatsAppOrderClick(models.Model):
     session_key = models.CharField(max_length=40, blank=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True)
-    clicked_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: clicks are inserted in batches after the fact.
+    clicked_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-clicked_at']
+        indexes = [
+            # Unique-session lookups of the click rollup (see rollups.py).
+            models.Index(fields=['session_key', 'clicked_at'], name='click_session_time_idx'),
+        ]
         verbose_name = "WhatsApp Order Click"
         verbose_name_plural = "WhatsApp Order Clicks"
 
@@ -319,6 +222,123 @@ class ProductImage(models.Model):
         return super().clean()
 
 
+class RelatedProduct(models.Model):
+    """Precomputed "related products" neighbor list entry; see related.py"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'related']
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='related_product_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.2f})"
+
+
+class ImageDerivatives(models.Model):
+    """Resized WebP/JPEG (and optionally AVIF) copies of an uploaded image; see images.py"""
+    source = models.CharField(max_length=255, unique=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    renditions = models.JSONField(default=dict, help_text="{format: [[width, storage name], ...]}")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Image Derivatives"
+        verbose_name_plural = "Image Derivatives"
+
+    def __str__(self):
+        return self.source
+
+
+class Job(models.Model):
+    """Background job run by the ``run_jobs`` worker; see jobs.py"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class ClickRollup(models.Model):
+    """Hourly/daily WhatsApp order click counts; maintained by rollups.py"""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+    TOTAL = 'total'
+    DIMENSION_CHOICES = [
+        (PRODUCT, 'Product'),
+        (CATEGORY, 'Category'),
+        (TOTAL, 'All clicks'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=100, blank=True)
+    label = models.CharField(max_length=200, blank=True)
+    clicks = models.PositiveIntegerField(default=0)
+    unique_sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-period_start', '-clicks']
+        unique_together = ['period', 'dimension', 'period_start', 'key']
+        verbose_name = "Click Report"
+        verbose_name_plural = "Click Reports"
+
+    def __str__(self):
+        return f"{self.get_dimension_display()} {self.label or self.key} @ {self.period_start:%Y-%m-%d %H:%M}: {self.clicks}"
+
+
+class RollupState(models.Model):
+    """High-water mark of a rollup: the last source row id folded in"""
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.BigIntegerField(default=0)
+    # Max id seen by the previous run; rows up to it are rolled up next time,
+    # once any transaction still holding a lower id has committed.
+    next_high_water = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water}"
+
+
 class Testimonial(models.Model):
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=100, blank=True)
@@ -412,11 +432,6 @@ class UserProfile(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         if self.avatar:
-            try:
-                img = Image.open(self.avatar.path)
-                if img.height > 300 or img.width > 300:
-                    output_size = (300, 300)
-                    img.thumbnail(output_size)
-                    img.save(self.avatar.path)
-            except Exception:
-                pass
\ No newline at end of file
+            # Resized by the background worker (see tasks.resize_avatar).
+            from .jobs import enqueue
+            enqueue('resize_avatar', {'profile_id': self.pk}, idempotency_key=f'resize_avatar:{self.avatar.name}')
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Full-page cache for anonymous visitors.
+
+Catalog and blog pages look the same for every anonymous visitor, so the
+rendered HTML is cached per host, path, normalized query string and device
+class. Each view declares the cache tags its output depends on, and the
+signal handlers bump those tags on model saves/deletes (see
+``apps.main.signals`` and ``apps.blog.signals``), so edits show up on the
+next request.
+
+Only the HTML is stored, and only when the view produced nothing
+visitor-specific: status 200, no cookies or session changes made by the
+view, no CSRF token rendered, and not marked private. Anything personal is
+filled in client-side from the ``visitor_state`` endpoint.
+
+Stale-if-error: every page stored is also kept as the last good copy for
+its URL and device class (``page_stale:``, not tied to the tag versions,
+for ``PAGE_STALE_TIMEOUT``). That copy is served, marked with
+``X-Page-Cache: STALE`` and a ``Warning`` header, when the database is
+down: straight away while the database circuit is open (see
+``db_circuit.py``), or when the view hit a connection error, whether it
+raised it or swallowed it and rendered an empty page. Pages rendered
+during an outage are never cached.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .cache_tags import get_tag_versions
+from .db_circuit import DATABASE_ERRORS, database_circuit, observe_database_errors
+
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_STALE_TIMEOUT = 60 * 60 * 24
+
+# Marketing/click-tracking parameters never change the page content.
+IGNORED_QUERY_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'fbclid', 'gclid', 'msclkid', '_ga',
+}
+
+MOBILE_MARKERS = ('mobi', 'iphone', 'ipod', 'android', 'opera mini', 'blackberry', 'windows phone')
+TABLET_MARKERS = ('ipad', 'tablet', 'kindle', 'silk', 'playbook')
+
+
+def page_cache_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', not settings.DEBUG)
+
+
+def device_class(request):
+    user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+    if any(marker in user_agent for marker in TABLET_MARKERS):
+        return 'tablet'
+    if any(marker in user_agent for marker in MOBILE_MARKERS):
+        return 'mobile'
+    return 'desktop'
+
+
+def normalized_query(request):
+    """Sorted, de-duplicated query string without tracking or empty params."""
+    pairs = sorted({
+        (key, value)
+        for key, values in request.GET.lists()
+        if key not in IGNORED_QUERY_PARAMS
+        for value in values
+        if value != ''
+    })
+    return '&'.join(f'{key}={value}' for key, value in pairs)
+
+
+def page_identity(request):
+    return [request.get_host(), request.path, normalized_query(request), device_class(request)]
+
+
+def page_cache_key(request, tags):
+    versions = get_tag_versions(tags)
+    raw = '|'.join(page_identity(request) + [','.join(str(version) for version in versions)])
+    return 'page_cache:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def stale_page_key(request):
+    raw = '|'.join(page_identity(request))
+    return 'page_stale:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def cached_response(cached, status):
+    response = HttpResponse(cached['content'], content_type=cached['content_type'])
+    response['X-Page-Cache'] = status
+    patch_vary_headers(response, ('User-Agent',))
+    return response
+
+
+def stale_response(request):
+    """The last good copy of the page, or None."""
+    cached = cache.get(stale_page_key(request))
+    if cached is None:
+        return None
+    response = cached_response(cached, 'STALE')
+    response['Warning'] = '111 - "Revalidation Failed"'
+    patch_cache_control(response, max_age=0)
+    return response
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return False
+    # Pending flash messages would be baked into the page.
+    if len(get_messages(request)):
+        return False
+    return True
+
+
+def session_modified(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.modified
+
+
+def is_cacheable_response(request, response, session_was_modified=False):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # Session and CSRF cookies are only attached by middleware after the
+    # view returns, so check whether the view itself asked for them.
+    if session_modified(request) and not session_was_modified:
+        return False
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    cache_control = response.get('Cache-Control', '')
+    return 'private' not in cache_control and 'no-store' not in cache_control
+
+
+def cache_anonymous_page(*tags, timeout=None, on_request=None):
+    """
+    Cache the decorated view's output for anonymous visitors.
+
+    ``tags`` lists what the page is built from; "company" is always added
+    because every page renders the company details in the base template.
+    ``on_request(request, *args, **kwargs)`` runs on every GET, hit or miss,
+    for side effects that must not be skipped by the cache (view counters,
+    recently viewed products).
+    """
+    tags = tuple(dict.fromkeys(tags + ('company',)))
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if on_request is not None and request.method == 'GET':
+                on_request(request, *args, **kwargs)
+
+            if not page_cache_enabled() or request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            # Checked before the session is touched: it lives in the database too.
+            # Everyone, signed in or not, gets the anonymous copy during an outage.
+            if database_circuit.is_open():
+                response = stale_response(request)
+                if response is not None:
+                    return response
+
+            cacheable = is_cacheable_request(request)
+            if cacheable:
+                cache_key = page_cache_key(request, tags)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached_response(cached, 'HIT')
+
+            session_was_modified = session_modified(request)
+            with observe_database_errors() as errors:
+                try:
+                    response = view_func(request, *args, **kwargs)
+                    if hasattr(response, 'render') and callable(response.render):
+                        response = response.render()
+                except DATABASE_ERRORS:
+                    response = stale_response(request)
+                    if response is None:
+                        raise
+                    return response
+            if errors:
+                return stale_response(request) or response
+            if cacheable and is_cacheable_response(request, response, session_was_modified):
+                cached = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                }
+                cache.set(cache_key, cached, timeout if timeout is not None else getattr(settings, 'PAGE_CACHE_TIMEOUT', PAGE_CACHE_TIMEOUT))
+                cache.set(stale_page_key(request), cached, getattr(settings, 'PAGE_STALE_TIMEOUT', PAGE_STALE_TIMEOUT))
+                response['X-Page-Cache'] = 'MISS'
+                patch_vary_headers(response, ('User-Agent',))
+            return response
+        return wrapper
+    return decorator
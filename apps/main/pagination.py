@@ -0,0 +1,276 @@
+"""
+Listing pagination shared by the shop and blog views.
+
+By default this is plain ``Paginator`` behaviour. Setting
+``CURSOR_PAGINATION = True`` switches listings to keyset pagination:
+
+* ``?page=1`` .. ``?page=CURSOR_PAGINATION_OFFSET_PAGES`` still work as
+  before, so existing links and bookmarks keep resolving.
+* Past that, pages are addressed by an opaque, signed ``?cursor=`` token
+  holding the sort key of the last (or first) row shown. The next page is a
+  ``WHERE (sort key) < (cursor)`` lookup on the listing's ordering, so deep
+  pages cost the same as page one instead of an ever-growing OFFSET.
+* ``?page=`` numbers beyond the offset window return 404.
+
+``PAGINATION_ESTIMATE_COUNT = True`` additionally replaces the exact
+``COUNT(*)`` with the planner's row estimate on PostgreSQL when that
+estimate is large.
+
+Listings ordered by something other than plain model fields (search
+relevance) always use offset pagination.
+"""
+
+import datetime
+import decimal
+import json
+import uuid
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+CURSOR_SALT = 'apps.main.pagination.cursor'
+ESTIMATE_THRESHOLD = 1000
+
+
+def cursor_pagination_enabled():
+    return getattr(settings, 'CURSOR_PAGINATION', False)
+
+
+def offset_page_limit():
+    return getattr(settings, 'CURSOR_PAGINATION_OFFSET_PAGES', 5)
+
+
+def estimate_count(queryset):
+    """
+    Return the planner's row estimate for ``queryset`` on PostgreSQL, or an
+    exact count when the estimate is small or unavailable.
+    """
+    connection = connections[queryset.db]
+    if getattr(settings, 'PAGINATION_ESTIMATE_COUNT', False) and connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+        except Exception:
+            estimate = 0
+        if estimate >= ESTIMATE_THRESHOLD:
+            return estimate
+    return queryset.count()
+
+
+class ListingPaginator(Paginator):
+    """``Paginator`` whose count may come from :func:`estimate_count`."""
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return estimate_count(self.object_list)
+        return super().count
+
+
+class KeysetOrdering:
+    """A listing ordering expressed as model fields, with ``pk`` as tiebreaker."""
+
+    def __init__(self, model, ordering):
+        self.model = model
+        self.fields = []
+        for item in ordering:
+            if not isinstance(item, str) or '__' in item or item.lstrip('-') in ('?', ''):
+                raise ValueError(f'Unsupported keyset ordering: {item!r}')
+            name = item.lstrip('-')
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            self.fields.append((field, item.startswith('-')))
+        if not any(field.primary_key for field, desc in self.fields):
+            self.fields.append((model._meta.pk, True))
+
+    @classmethod
+    def for_queryset(cls, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        try:
+            return cls(queryset.model, ordering)
+        except (ValueError, LookupError):
+            return None
+
+    def order_by(self, reverse=False):
+        """Forward order puts NULLs last; the reverse walk mirrors it exactly."""
+        expressions = []
+        for field, desc in self.fields:
+            nulls = {}
+            if field.null:
+                nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+            expression = F(field.attname)
+            expressions.append(expression.desc(**nulls) if desc != reverse else expression.asc(**nulls))
+        return expressions
+
+    def values(self, obj):
+        return [field.value_from_object(obj) for field, desc in self.fields]
+
+    def _beyond(self, field, desc, value, reverse):
+        """Rows strictly past ``value`` in traversal order (NULLs sort last)."""
+        name = field.attname
+        if not reverse:
+            if value is None:
+                return Q(pk__in=[])
+            condition = Q(**{f'{name}__lt' if desc else f'{name}__gt': value})
+            if field.null:
+                condition |= Q(**{f'{name}__isnull': True})
+            return condition
+        if value is None:
+            return Q(**{f'{name}__isnull': False})
+        return Q(**{f'{name}__gt' if desc else f'{name}__lt': value})
+
+    def seek(self, values, reverse=False):
+        """Q for rows after (or, with ``reverse``, before) the row with ``values``."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (field, desc), value in zip(self.fields, values):
+            condition |= equal & self._beyond(field, desc, value, reverse)
+            equal &= Q(**{f'{field.attname}__isnull': True}) if value is None else Q(**{field.attname: value})
+        return condition
+
+    def encode(self, values, reverse=False):
+        return signing.dumps(
+            {'v': values, 'r': reverse},
+            salt=CURSOR_SALT, serializer=CursorSerializer, compress=True,
+        )
+
+    def decode(self, token):
+        try:
+            payload = signing.loads(token, salt=CURSOR_SALT, serializer=CursorSerializer)
+            raw_values = payload['v']
+            if len(raw_values) != len(self.fields):
+                raise ValueError
+            values = [
+                None if raw is None else field.to_python(raw)
+                for (field, desc), raw in zip(self.fields, raw_values)
+            ]
+            return values, bool(payload.get('r'))
+        except (signing.BadSignature, ValueError, TypeError, KeyError):
+            raise Http404('Invalid page cursor')
+
+
+def _cursor_default(value):
+    # Unlike DjangoJSONEncoder, keep full microsecond precision: keyset
+    # equality on created_at depends on it.
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f'Cannot encode {type(value).__name__} in a page cursor')
+
+
+class CursorSerializer:
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), default=_cursor_default).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class CursorPage(Sequence):
+    """A page addressed by cursor; quacks like ``django.core.paginator.Page``."""
+
+    number = None
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+def _link(request, page_param, cursor_param, page=None, cursor=None):
+    params = request.GET.copy()
+    params.pop(page_param, None)
+    params.pop(cursor_param, None)
+    if page is not None and page != 1:
+        params[page_param] = page
+    if cursor is not None:
+        params[cursor_param] = cursor
+    query = params.urlencode()
+    return f'?{query}' if query else request.path
+
+
+def paginate(request, queryset, per_page, page_param='page', cursor_param='cursor'):
+    """
+    Return the requested page of ``queryset``.
+
+    The page carries ``next_link``, ``previous_link`` and ``page_links``
+    (``(number, link)`` pairs) so templates never build pagination URLs
+    themselves.
+    """
+    ordering = KeysetOrdering.for_queryset(queryset) if cursor_pagination_enabled() else None
+    token = request.GET.get(cursor_param)
+
+    if ordering is not None and token:
+        values, reverse = ordering.decode(token)
+        rows = list(queryset.filter(ordering.seek(values, reverse)).order_by(*ordering.order_by(reverse))[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if reverse:
+            rows.reverse()
+        page = CursorPage(rows, ListingPaginator(queryset, per_page), has_next=more or reverse, has_previous=more or not reverse)
+        if page.has_next() and rows:
+            page.next_link = _link(request, page_param, cursor_param, cursor=ordering.encode(ordering.values(rows[-1])))
+        if page.has_previous() and rows:
+            page.previous_link = _link(request, page_param, cursor_param, cursor=ordering.encode(ordering.values(rows[0]), reverse=True))
+        if not rows:
+            page._has_next = page._has_previous = False
+        page.page_links = []
+        return page
+
+    if ordering is not None:
+        queryset = queryset.order_by(*ordering.order_by())
+    paginator = ListingPaginator(queryset, per_page)
+    limit = offset_page_limit() if ordering is not None else None
+    try:
+        number = int(request.GET.get(page_param, 1))
+    except (TypeError, ValueError):
+        number = 1
+    if limit is not None and number > limit:
+        raise Http404('Use the cursor links to browse past this page')
+    try:
+        page = paginator.page(number)
+    except (PageNotAnInteger, EmptyPage):
+        page = paginator.page(paginator.num_pages if paginator.num_pages > 0 else 1)
+
+    page_numbers = paginator.page_range
+    if limit is not None:
+        page_numbers = range(1, min(paginator.num_pages, limit) + 1)
+    page.page_links = [(num, _link(request, page_param, cursor_param, page=num)) for num in page_numbers]
+    if page.has_previous():
+        page.previous_link = _link(request, page_param, cursor_param, page=page.previous_page_number())
+    if page.has_next():
+        if limit is not None and page.number >= limit:
+            page.object_list = list(page.object_list)
+            last = page.object_list[-1]
+            page.next_link = _link(request, page_param, cursor_param, cursor=ordering.encode(ordering.values(last)))
+        else:
+            page.next_link = _link(request, page_param, cursor_param, page=page.next_page_number())
+    return page
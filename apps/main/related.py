@@ -0,0 +1,230 @@
+"""
+Related-products engine.
+
+Every active product gets a precomputed list of its ``RELATED_PRODUCTS_K``
+most similar active products, stored as ``RelatedProduct`` rows, so the
+product page reads its related products with one indexed lookup on
+``(product_id, rank)``.
+
+Similarity adds up weighted signals (see ``WEIGHTS``): same category, same
+lens type, overlap of features, same frame material and price proximity.
+Candidates are blocked on category plus lens type - the two strongest
+signals - and capped at the ``RELATED_PRODUCTS_CANDIDATES`` nearest in
+price, with the rest of the category topped up when the block is smaller
+than K. Finding them is one indexed query per product, so neither a
+rebuild nor a refresh compares every pair in the catalog. Additional
+signals (co-views, say) slot in as another term in :func:`similarity` and
+a key in ``WEIGHTS``.
+
+When products change, ``refresh_related`` runs as a background job
+(queued from ``signals.py``) and loads only the rows it needs: the changed
+products' lists are rebuilt from their candidates, and the lists of those
+candidates and of products that listed them are patched in place,
+recomputed only when a changed product dropped out of them (its score
+fell, or it was deactivated or deleted).
+"""
+
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Abs
+
+from .models import Product, RelatedProduct
+
+
+WEIGHTS = {
+    'category': 3.0,
+    'lens_type': 2.0,
+    'features': 3.0,
+    'material': 1.0,
+    'price': 2.0,
+}
+
+
+def neighbor_count():
+    return getattr(settings, 'RELATED_PRODUCTS_K', 8)
+
+
+def candidate_limit():
+    return getattr(settings, 'RELATED_PRODUCTS_CANDIDATES', 200)
+
+
+def _active(using):
+    return Product.objects.using(using).filter(is_active=True)
+
+
+def load_vectors(product_ids, using=DEFAULT_DB_ALIAS):
+    """Similarity vectors of the active products among ``product_ids`` (all of them if None)."""
+    products = _active(using)
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    vectors = {
+        pk: {
+            'category': category_id,
+            'lens_type': lens_type,
+            'material': frame_material.strip().lower(),
+            'price': price,
+            'features': set(),
+        }
+        for pk, category_id, lens_type, frame_material, price in products.values_list(
+            'id', 'category_id', 'lens_type', 'frame_material', 'price',
+        )
+    }
+    through = Product.features.through.objects.using(using)
+    if product_ids is not None:
+        through = through.filter(product_id__in=list(vectors))
+    for product_id, feature_id in through.values_list('product_id', 'feature_id'):
+        if product_id in vectors:
+            vectors[product_id]['features'].add(feature_id)
+    return vectors
+
+
+def _nearest_in_price(products, price, limit):
+    distance = ExpressionWrapper(
+        Abs(F('price') - Value(Decimal(price))), output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    return list(products.annotate(distance=distance).order_by('distance', 'pk').values_list('pk', flat=True)[:limit])
+
+
+def find_candidates(pk, vector, using=DEFAULT_DB_ALIAS, k=None, limit=None):
+    """Same category and lens type, nearest in price first; topped up from the category below ``k``."""
+    k = k or neighbor_count()
+    limit = max(limit or candidate_limit(), k)
+    category = _active(using).filter(category_id=vector['category']).exclude(pk=pk)
+    found = _nearest_in_price(category.filter(lens_type=vector['lens_type']), vector['price'], limit)
+    if len(found) < k:
+        others = category.exclude(lens_type=vector['lens_type'])
+        found += _nearest_in_price(others, vector['price'], k - len(found))
+    return found
+
+
+def similarity(a, b):
+    score = 0.0
+    if a['category'] == b['category']:
+        score += WEIGHTS['category']
+    if a['lens_type'] and a['lens_type'] == b['lens_type']:
+        score += WEIGHTS['lens_type']
+    if a['features'] and b['features']:
+        score += WEIGHTS['features'] * len(a['features'] & b['features']) / len(a['features'] | b['features'])
+    if a['material'] and a['material'] == b['material']:
+        score += WEIGHTS['material']
+    high = float(max(a['price'], b['price']))
+    if high > 0:
+        score += WEIGHTS['price'] * (1 - abs(float(a['price']) - float(b['price'])) / high)
+    return score
+
+
+def _ranked(neighbors, k):
+    """Sort (score, pk) pairs best first; ties go to the older product."""
+    return heapq.nsmallest(k, neighbors, key=lambda item: (-item[0], item[1]))
+
+
+def top_neighbors(pk, vectors, candidates, k, using=DEFAULT_DB_ALIAS):
+    """Rank ``candidates`` for ``pk``, loading any vectors missing from ``vectors``."""
+    missing = [other for other in candidates if other not in vectors]
+    if missing:
+        vectors.update(load_vectors(missing, using))
+    vector = vectors[pk]
+    return _ranked(((similarity(vector, vectors[other]), other) for other in candidates if other in vectors), k)
+
+
+def _save_lists(lists, using):
+    """Replace the stored neighbor lists of every product in ``lists``."""
+    with transaction.atomic(using=using):
+        RelatedProduct.objects.using(using).filter(product_id__in=list(lists)).delete()
+        RelatedProduct.objects.using(using).bulk_create([
+            RelatedProduct(product_id=pk, related_id=other, score=score, rank=rank)
+            for pk, neighbors in lists.items()
+            for rank, (score, other) in enumerate(neighbors)
+        ], batch_size=1000)
+
+
+def rebuild_related(using=DEFAULT_DB_ALIAS, k=None):
+    """Recompute every neighbor list. Returns the number of products processed."""
+    k = k or neighbor_count()
+    vectors = load_vectors(None, using)
+    lists = {
+        pk: top_neighbors(pk, vectors, find_candidates(pk, vector, using, k), k, using)
+        for pk, vector in vectors.items()
+    }
+    with transaction.atomic(using=using):
+        RelatedProduct.objects.using(using).exclude(product_id__in=list(lists)).delete()
+        _save_lists(lists, using)
+    return len(lists)
+
+
+def refresh_related(product_ids, using=DEFAULT_DB_ALIAS, k=None):
+    """Update the neighbor lists affected by changes to ``product_ids``."""
+    k = k or neighbor_count()
+    changed = set(product_ids)
+    if not changed:
+        return
+    vectors = load_vectors(changed, using)
+    candidates = {pk: find_candidates(pk, vectors[pk], using, k) for pk in changed if pk in vectors}
+
+    # Lists the changed products may now enter, and lists that already held them.
+    affected = {other for found in candidates.values() for other in found}
+    affected |= set(RelatedProduct.objects.using(using).filter(
+        related_id__in=changed,
+    ).values_list('product_id', flat=True))
+    affected -= changed
+    vectors.update(load_vectors(affected - set(vectors), using))
+
+    current = defaultdict(list)
+    for pk, other, score in RelatedProduct.objects.using(using).filter(
+        product_id__in=affected,
+    ).values_list('product_id', 'related_id', 'score'):
+        current[pk].append((score, other))
+
+    lists = {pk: top_neighbors(pk, vectors, found, k, using) for pk, found in candidates.items()}
+    for pk in affected:
+        if pk not in vectors:
+            continue
+        neighbors = current[pk]
+        kept = [(score, other) for score, other in neighbors if other not in changed]
+        # A short list may have room for products outside the changed set.
+        needs_full = len(neighbors) < k
+        for other in changed:
+            old = next((score for score, o in neighbors if o == other), None)
+            new = None
+            if other in vectors and vectors[other]['category'] == vectors[pk]['category']:
+                new = similarity(vectors[pk], vectors[other])
+            if old is not None and (new is None or new < old):
+                # Something outside the stored list may now outrank it.
+                needs_full = True
+                break
+            if new is not None:
+                kept.append((new, other))
+        if needs_full:
+            lists[pk] = top_neighbors(pk, vectors, find_candidates(pk, vectors[pk], using, k), k, using)
+        else:
+            ranked = _ranked(kept, k)
+            if ranked != _ranked(neighbors, k):
+                lists[pk] = ranked
+
+    stale = changed - set(vectors)
+    with transaction.atomic(using=using):
+        RelatedProduct.objects.using(using).filter(product_id__in=stale).delete()
+        if lists:
+            _save_lists(lists, using)
+
+
+def get_related_products(product, limit=4):
+    """Return up to ``limit`` related active products, best first."""
+    related = list(
+        Product.objects.filter(related_from__product=product, is_active=True)
+        .select_related('category')
+        .order_by('related_from__rank')[:limit]
+    )
+    if related:
+        return related
+    # Neighbor lists not built yet (fresh install, or a brand new product).
+    return list(
+        Product.objects.filter(category_id=product.category_id, is_active=True)
+        .select_related('category')
+        .exclude(id=product.id)[:limit]
+    )
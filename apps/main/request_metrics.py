@@ -0,0 +1,195 @@
+"""
+Per-request performance metrics.
+
+``RequestMetricsMiddleware`` times every request and, for a sample of them
+(``REQUEST_METRICS_SAMPLE_RATE``), also records:
+
+* SQL: query count and total time on every connection, through
+  ``connection.execute_wrapper`` (works with DEBUG off), plus repeated
+  query fingerprints - the same statement with the literals stripped, the
+  shape of an N+1 loop;
+* template render time of the outermost ``render()``/``render_to_string``;
+* cache hits and misses, reported by ``TwoTierCache``.
+
+The numbers go out as a ``Server-Timing`` header (to staff only unless
+``REQUEST_METRICS_PUBLIC``), which browser devtools show next to the
+request, and as one JSON log line on ``apps.main.request_metrics``.
+Requests slower than ``REQUEST_METRICS_SLOW_MS``, or the per-URL-name
+override in ``REQUEST_METRICS_SLOW_VIEWS``, are logged as warnings whether
+sampled or not.
+"""
+
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+REPEATED_REPORTED = 5
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SELECT_LIST_RE = re.compile(r'^SELECT .*? FROM ', re.IGNORECASE | re.DOTALL)
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """The statement with its column list, literals and IN-list lengths normalized away."""
+    sql = SELECT_LIST_RE.sub('SELECT ... FROM ', sql, count=1)
+    sql = LITERAL_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self):
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+
+def record_cache(hits=0, misses=0):
+    """Called by the cache backend; a no-op outside a sampled request."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def install_template_timer():
+    """Wrap the Django template backend's render() to time outermost renders."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'request_metrics', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None or metrics.template_depth:
+            return render(self, context, request)
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.template_depth -= 1
+
+    timed_render.request_metrics = True
+    Template.render = timed_render
+
+
+def slow_threshold(request):
+    match = getattr(request, 'resolver_match', None)
+    per_view = getattr(settings, 'REQUEST_METRICS_SLOW_VIEWS', {})
+    if match is not None and match.view_name in per_view:
+        return per_view[match.view_name]
+    return getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500)
+
+
+def server_timing(total_ms, metrics):
+    parts = [f'app;dur={total_ms:.1f}']
+    if metrics is not None:
+        parts.append(f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"')
+        repeated = metrics.repeated()
+        if repeated:
+            parts.append(f'dup;desc="{sum(n for _, n in repeated)} repeated in {len(repeated)} shapes"')
+        parts.append(f'tpl;dur={metrics.template_time * 1000:.1f}')
+        parts.append(f'cache;desc="{metrics.cache_hits} hit / {metrics.cache_misses} miss"')
+    return ', '.join(parts)
+
+
+class RequestMetricsMiddleware:
+    """Time requests; sample SQL, template and cache counts. See module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.1)
+        self.public = getattr(settings, 'REQUEST_METRICS_PUBLIC', settings.DEBUG)
+        if self.enabled:
+            install_template_timer()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        metrics = RequestMetrics() if random.random() < self.sample_rate else None
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                if metrics is not None:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+        slow = total_ms >= slow_threshold(request)
+        if metrics is not None or slow:
+            self.log(request, response, total_ms, metrics, slow)
+        if metrics is not None and self.show_header(request):
+            timing = server_timing(total_ms, metrics)
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+        return response
+
+    def show_header(self, request):
+        if self.public:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
+
+    def log(self, request, response, total_ms, metrics, slow):
+        match = getattr(request, 'resolver_match', None)
+        data = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match is not None else None,
+            'status': response.status_code,
+            'ms': round(total_ms, 1),
+            'sampled': metrics is not None,
+        }
+        if metrics is not None:
+            data.update({
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'template_ms': round(metrics.template_time * 1000, 1),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+                'repeated': [
+                    {'sql': sql[:300], 'count': n}
+                    for sql, n in metrics.repeated()[:REPEATED_REPORTED]
+                ],
+            })
+        message = 'request_metrics %s'
+        if slow:
+            logger.warning(message, json.dumps(data))
+        else:
+            logger.info(message, json.dumps(data))
@@ -0,0 +1,79 @@
+"""
+Per-request values shared by views, context processors and models.
+
+A value is registered once with a loader (``@request_value('company_info')``)
+and read with ``get_request_value(name)``: the loader runs the first time
+the value is asked for during a request and the result is reused for the
+rest of it. ``RequestValuesMiddleware`` opens the per-request store; model
+code such as the WhatsApp link builder, which has no request to hand, reads
+the same store through a context variable. Outside a request (management
+commands, shell) a value is memoized on the request passed in, or, without
+one, loaded on every call.
+
+``lazy_request_value`` wraps a value for a template context: nothing is
+loaded unless the template touches it, so pages that never show the
+categories menu or the wishlist count never query for them.
+"""
+
+import contextvars
+
+from django.utils.functional import SimpleLazyObject
+
+
+_loaders = {}
+_current = contextvars.ContextVar('request_values', default=None)
+
+
+class RequestValues:
+    def __init__(self, request):
+        self.request = request
+        self.values = {}
+
+
+def request_value(name):
+    """Register ``loader(request)`` as the source of ``name``; ``request`` may be None."""
+    def register(loader):
+        _loaders[name] = loader
+        return loader
+    return register
+
+
+def _store(request):
+    scope = _current.get()
+    if scope is not None and (request is None or scope.request is request):
+        return scope
+    if request is not None:
+        scope = request.__dict__.get('_request_values')
+        if scope is None:
+            scope = request._request_values = RequestValues(request)
+        return scope
+    return None
+
+
+def get_request_value(name, request=None):
+    """``name`` for the current request, loaded at most once per request."""
+    loader = _loaders[name]
+    scope = _store(request)
+    if scope is None:
+        return loader(None)
+    if name not in scope.values:
+        scope.values[name] = loader(scope.request)
+    return scope.values[name]
+
+
+def lazy_request_value(name, request=None):
+    return SimpleLazyObject(lambda: get_request_value(name, request))
+
+
+class RequestValuesMiddleware:
+    """Give every request its own store of values; see module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current.set(RequestValues(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
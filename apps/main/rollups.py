@@ -0,0 +1,219 @@
+"""
+Incremental rollups of WhatsApp order clicks.
+
+``ClickRollup`` holds click and unique-session counts per hour and per day,
+for each product, each category and all clicks together. ``rollup_clicks``
+(``python manage.py rollup_clicks``, run from cron) folds in only the click
+rows above the ``RollupState`` high-water mark, so each run costs as much as
+the clicks since the previous one, not the size of the click table.
+
+Click ids are handed out before their transaction commits, so a row with a
+lower id can become visible after a higher one. A run therefore only rolls up
+to the highest id the *previous* run saw; ``delay=False`` skips that for
+one-off catch-ups when no clicks are being written.
+
+Unique sessions are counted by checking each new session against the
+already-rolled-up clicks of the same period (``click_session_time_idx``).
+Clicks without a session are counted but never unique.
+
+The admin dashboard (``click_report``) reads only from the rollup table.
+"""
+
+import datetime
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import ClickRollup, RollupState, WhatsAppOrderClick, Product
+
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'whatsapp_clicks'
+CHUNK_SIZE = 20000
+SESSION_BATCH = 500
+PERIODS = (ClickRollup.HOUR, ClickRollup.DAY)
+UNKNOWN_CATEGORY = 'Unknown'
+
+
+def bucket(period, moment):
+    """Start of the hour or day (in TIME_ZONE) containing ``moment``."""
+    local = timezone.localtime(moment)
+    if period == ClickRollup.DAY:
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def _categories(product_ids):
+    """Map click product ids (strings) to (category slug, category name)."""
+    pks = {pid for pid in product_ids if pid.isdigit()}
+    return {
+        str(pk): (slug, name)
+        for pk, slug, name in Product.objects.filter(pk__in=pks).values_list('pk', 'category__slug', 'category__name')
+    }
+
+
+def _cells(product_id, product_name, clicked_at, categories):
+    """Every (period, period_start, dimension, key, label) a click counts towards."""
+    slug, category_name = categories.get(product_id) or ('', UNKNOWN_CATEGORY)
+    dimensions = [
+        (ClickRollup.PRODUCT, product_id, product_name),
+        (ClickRollup.CATEGORY, slug or '', category_name or UNKNOWN_CATEGORY),
+        (ClickRollup.TOTAL, '', ''),
+    ]
+    for period in PERIODS:
+        start = bucket(period, clicked_at)
+        for dimension, key, label in dimensions:
+            yield period, start, dimension, key, label
+
+
+def _seen_sessions(sessions, before_id, since, until, categories):
+    """(cell, session) pairs already counted by rows with id <= ``before_id``."""
+    seen = set()
+    sessions = list(sessions)
+    for start in range(0, len(sessions), SESSION_BATCH):
+        rows = list(WhatsAppOrderClick.objects.filter(
+            pk__lte=before_id, session_key__in=sessions[start:start + SESSION_BATCH],
+            clicked_at__gte=since, clicked_at__lt=until,
+        ).values_list('product_id', 'product_name', 'clicked_at', 'session_key'))
+        categories.update(_categories({row[0] for row in rows} - set(categories)))
+        for product_id, product_name, clicked_at, session_key in rows:
+            for period, period_start, dimension, key, label in _cells(product_id, product_name, clicked_at, categories):
+                seen.add((period, period_start, dimension, key, session_key))
+    return seen
+
+
+def _fold(rows, before_id):
+    """Aggregate click rows into {cell: [label, clicks, unique_sessions]}."""
+    categories = _categories({row[0] for row in rows})
+    since = min(bucket(ClickRollup.DAY, row[2]) for row in rows)
+    until = max(bucket(ClickRollup.DAY, row[2]) for row in rows) + datetime.timedelta(days=2)
+    sessions = {row[3] for row in rows if row[3]}
+    seen = _seen_sessions(sessions, before_id, since, until, categories) if sessions else set()
+
+    cells = {}
+    for product_id, product_name, clicked_at, session_key in rows:
+        for period, period_start, dimension, key, label in _cells(product_id, product_name, clicked_at, categories):
+            cell = (period, period_start, dimension, key)
+            entry = cells.setdefault(cell, [label, 0, 0])
+            entry[0] = label or entry[0]
+            entry[1] += 1
+            if session_key and cell + (session_key,) not in seen:
+                seen.add(cell + (session_key,))
+                entry[2] += 1
+    return cells
+
+
+def _apply(cells):
+    """Add folded counts to the rollup rows, creating missing ones."""
+    by_group = defaultdict(dict)
+    for (period, period_start, dimension, key), entry in cells.items():
+        by_group[period, dimension][period_start, key] = entry
+
+    for (period, dimension), group in by_group.items():
+        starts = {start for start, key in group}
+        existing = ClickRollup.objects.filter(
+            period=period, dimension=dimension,
+            period_start__gte=min(starts), period_start__lte=max(starts),
+            key__in={key for start, key in group},
+        )
+        to_update = []
+        for rollup in existing:
+            entry = group.pop((rollup.period_start, rollup.key), None)
+            if entry is None:
+                continue
+            rollup.label = entry[0] or rollup.label
+            rollup.clicks += entry[1]
+            rollup.unique_sessions += entry[2]
+            to_update.append(rollup)
+        ClickRollup.objects.bulk_update(to_update, ['label', 'clicks', 'unique_sessions'], batch_size=500)
+        ClickRollup.objects.bulk_create([
+            ClickRollup(
+                period=period, period_start=start, dimension=dimension, key=key,
+                label=label, clicks=clicks, unique_sessions=unique,
+            )
+            for (start, key), (label, clicks, unique) in group.items()
+        ], batch_size=500)
+
+
+def rollup_clicks(delay=True, chunk_size=CHUNK_SIZE):
+    """Fold clicks above the high-water mark into the rollups; returns rows processed."""
+    state, _ = RollupState.objects.get_or_create(name=ROLLUP_NAME)
+    latest = WhatsAppOrderClick.objects.aggregate(latest=Max('pk'))['latest'] or 0
+    upper = min(state.next_high_water, latest) if delay else latest
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            # Locked so overlapping runs cannot fold the same rows twice.
+            state = RollupState.objects.select_for_update().get(pk=state.pk)
+            if state.high_water >= upper:
+                break
+            rows = list(WhatsAppOrderClick.objects.filter(
+                pk__gt=state.high_water, pk__lte=upper,
+            ).order_by('pk').values_list('pk', 'product_id', 'product_name', 'clicked_at', 'session_key')[:chunk_size])
+            if rows:
+                _apply(_fold([row[1:] for row in rows], state.high_water))
+                processed += len(rows)
+            state.high_water = rows[-1][0] if len(rows) == chunk_size else upper
+            state.save(update_fields=['high_water', 'updated_at'])
+
+    RollupState.objects.filter(pk=state.pk).update(next_high_water=latest, updated_at=timezone.now())
+    logger.info("Rolled up %s clicks (high-water mark %s)", processed, upper)
+    return processed
+
+
+def rebuild_rollups():
+    """Drop all rollups and fold in every click again."""
+    with transaction.atomic():
+        ClickRollup.objects.all().delete()
+        RollupState.objects.filter(name=ROLLUP_NAME).delete()
+    return rollup_clicks(delay=False)
+
+
+def _top(dimension, since, limit):
+    return list(
+        ClickRollup.objects.filter(period=ClickRollup.DAY, dimension=dimension, period_start__gte=since)
+        .values('key')
+        .annotate(label=Max('label'), clicks=Sum('clicks'), unique_sessions=Sum('unique_sessions'))
+        .order_by('-clicks')[:limit]
+    )
+
+
+def _with_share(rows):
+    peak = max((row['clicks'] for row in rows), default=0) or 1
+    for row in rows:
+        row['share'] = round(100 * row['clicks'] / peak)
+    return rows
+
+
+def click_report(days=30, top=15):
+    """Dashboard data for the last ``days`` days, read from the rollups only."""
+    now = timezone.now()
+    since = bucket(ClickRollup.DAY, now) - datetime.timedelta(days=days - 1)
+    daily = list(
+        ClickRollup.objects.filter(period=ClickRollup.DAY, dimension=ClickRollup.TOTAL, period_start__gte=since)
+        .order_by('period_start').values('period_start', 'clicks', 'unique_sessions')
+    )
+    hourly = list(
+        ClickRollup.objects.filter(
+            period=ClickRollup.HOUR, dimension=ClickRollup.TOTAL,
+            period_start__gte=bucket(ClickRollup.HOUR, now) - datetime.timedelta(hours=47),
+        ).order_by('period_start').values('period_start', 'clicks', 'unique_sessions')
+    )
+    state = RollupState.objects.filter(name=ROLLUP_NAME).first()
+    return {
+        'days': days,
+        'since': since,
+        'total_clicks': sum(row['clicks'] for row in daily),
+        # Daily uniques summed: a visitor returning on two days counts twice.
+        'visitor_days': sum(row['unique_sessions'] for row in daily),
+        'daily': _with_share(daily),
+        'hourly': _with_share(hourly),
+        'top_products': _with_share(_top(ClickRollup.PRODUCT, since, top)),
+        'top_categories': _with_share(_top(ClickRollup.CATEGORY, since, top)),
+        'rollup_state': state,
+    }
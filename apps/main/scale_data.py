@@ -0,0 +1,344 @@
+"""
+Production-sized data for local performance work (``manage.py seed_scale``).
+
+Generates a catalog (products with features, gallery images and
+placeholder pictures), a blog (posts with tags and threaded comments),
+WhatsApp order clicks and wishlists. Everything is drawn from
+``random.Random`` instances derived from one seed, and timestamps count
+back from a fixed ``until``, so the same arguments give the same data.
+
+Rows go in with ``bulk_create`` in batches, one transaction per chunk.
+Clicks and wishlists - the millions of rows - are split into chunks that
+each have their own generator (``{seed}:{table}:{chunk}``), so they can be
+spread over forked worker processes and still produce the same rows (only
+the primary keys depend on the order the chunks finish in). SQLite takes
+one writer at a time, so there the chunks always run in this process.
+
+Seeded rows are recognisable by ``SEED_PREFIX`` in their slugs, codes and
+session keys.
+"""
+
+import datetime
+import io
+import multiprocessing
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+
+from .models import Category, CompanyInfo, Feature, Product, ProductImage, WhatsAppOrderClick, Wishlist, WishlistItem
+
+
+SEED_PREFIX = 'seed-'
+CHUNK_SIZE = 20000
+PLACEHOLDER_SIZE = (480, 360)
+
+CATEGORIES = [
+    'Aviator', 'Round', 'Cat Eye', 'Rectangle', 'Square', 'Oval', 'Browline', 'Wayfarer',
+    'Rimless', 'Sports', 'Kids', 'Oversized',
+]
+FEATURES = [
+    'UV400', 'Anti-glare', 'Scratch resistant', 'Lightweight', 'Spring hinges', 'Blue light filter',
+    'Polarized lenses', 'Hypoallergenic', 'Adjustable nose pads', 'Water repellent', 'Flexible frame',
+    'Anti-fog',
+]
+MATERIALS = ['Acetate', 'Titanium', 'Stainless steel', 'TR90', 'Aluminium', 'Wood', 'Carbon fibre']
+COLOURS = ['Black', 'Tortoise', 'Gold', 'Silver', 'Crystal', 'Navy', 'Rose', 'Olive', 'Burgundy']
+LENS_TYPES = [value for value, label in Product.LENS_TYPES]
+USER_AGENTS = [
+    'Mozilla/5.0 (Linux; Android 14; SM-A155F) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Version/17.5 Mobile Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/126.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 Version/17.5 Safari/605.1.15',
+    'Mozilla/5.0 (Linux; Android 13; TECNO KI5k) AppleWebKit/537.36 Chrome/125.0 Mobile Safari/537.36',
+]
+WORDS = (
+    'frame lens vision glasses style comfort light colour shape face clear sharp bright daily reading '
+    'screen eyes protection fashion fit bridge temple hinge coating glare sun outdoor office classic '
+    'modern bold thin durable choose care clean wear test prescription optician focus distance'
+).split()
+
+# State handed to forked chunk workers; see run_chunks().
+_shared = {}
+
+
+def _sentence(rng, low=6, high=16):
+    words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+    return words.capitalize() + '.'
+
+
+def _paragraph(rng, low=3, high=7):
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(low, high)))
+
+
+def _skewed(rng, items, power=3):
+    """A random item, heavily favouring the start of ``items`` (a long tail)."""
+    return items[int(len(items) * rng.random() ** power)]
+
+
+def _ago(rng, until, days):
+    """A moment in the ``days`` before ``until``, more likely recent than old."""
+    return until - datetime.timedelta(seconds=days * 86400 * (1 - rng.random() ** 0.5))
+
+
+def placeholder_images(count, seed):
+    """Write ``count`` small solid-colour JPEGs to the default storage; return their names."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(f'{seed}:images')
+    names = []
+    for n in range(count):
+        name = f'{SEED_PREFIX}images/placeholder-{n}.jpg'
+        colour = tuple(rng.randrange(80, 230) for _ in range(3))
+        if not default_storage.exists(name):
+            image = Image.new('RGB', PLACEHOLDER_SIZE, colour)
+            width, height = PLACEHOLDER_SIZE
+            # A pair of "lenses", so the pictures are not completely flat.
+            draw = ImageDraw.Draw(image)
+            for left in (width // 8, width * 9 // 16):
+                draw.ellipse((left, height // 3, left + width * 5 // 16, height * 2 // 3), outline=(30, 30, 30), width=8)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=70)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        names.append(name)
+    return names
+
+
+def create_catalog(seed, products, images, batch_size):
+    """Categories, features and ``products`` products. Returns ``[(pk, name, price), ...]``."""
+    rng = random.Random(f'{seed}:catalog')
+    if not CompanyInfo.objects.exists():
+        CompanyInfo.objects.create(
+            description='<p>Eyewear for every face.</p>', address='Harare', phone='0771000000',
+            whatsapp='263771000000', opening_hours='Mon-Sat 9-5',
+        )
+    for name in FEATURES:
+        Feature.objects.get_or_create(name=name)
+    feature_ids = list(Feature.objects.filter(name__in=FEATURES).order_by('pk').values_list('pk', flat=True))
+    Category.objects.bulk_create([
+        Category(
+            name=name, slug=f'{SEED_PREFIX}{n}', order=n, description=_sentence(rng),
+            image=images[n % len(images)] if images else '',
+        )
+        for n, name in enumerate(CATEGORIES)
+    ])
+    category_ids = list(
+        Category.objects.filter(slug__startswith=SEED_PREFIX).order_by('pk').values_list('pk', flat=True)
+    )
+
+    for start in range(0, products, CHUNK_SIZE):
+        rows = []
+        for n in range(start, min(start + CHUNK_SIZE, products)):
+            material = rng.choice(MATERIALS)
+            price = Decimal(rng.randrange(2500, 45000)) / 100
+            on_sale = rng.random() < 0.15
+            rows.append(Product(
+                name=f'{rng.choice(COLOURS)} {material} {rng.choice(CATEGORIES)} {n}',
+                slug=f'{SEED_PREFIX}frame-{n}',
+                product_code=f'{SEED_PREFIX}{n:07d}',
+                category_id=_skewed(rng, category_ids, power=1.5),
+                description=_paragraph(rng),
+                price=price,
+                old_price=(price * Decimal('1.25')).quantize(Decimal('0.01')) if on_sale else None,
+                is_on_sale=on_sale,
+                is_featured=rng.random() < 0.02,
+                is_active=rng.random() < 0.97,
+                image=images[n % len(images)] if images else '',
+                lens_type=rng.choice(LENS_TYPES),
+                frame_material=material,
+                uv_protection=rng.choice(['', 'UV400', 'UV380']),
+                stock_quantity=rng.randrange(0, 40),
+            ))
+        with transaction.atomic():
+            Product.objects.bulk_create(rows, batch_size=batch_size)
+
+    catalog = list(
+        Product.objects.filter(slug__startswith=SEED_PREFIX).order_by('pk').values_list('pk', 'name', 'price')
+    )
+    Through = Product.features.through
+    for start in range(0, len(catalog), CHUNK_SIZE):
+        chunk = catalog[start:start + CHUNK_SIZE]
+        links = []
+        gallery = []
+        for pk, name, price in chunk:
+            links.extend(
+                Through(product_id=pk, feature_id=feature_id)
+                for feature_id in rng.sample(feature_ids, rng.randint(1, 4))
+            )
+            if images:
+                gallery.extend(
+                    ProductImage(product_id=pk, image=images[rng.randrange(len(images))], alt_text=name, is_primary=i == 0)
+                    for i in range(rng.randint(0, 4))
+                )
+        with transaction.atomic():
+            Through.objects.bulk_create(links, batch_size=batch_size)
+            ProductImage.objects.bulk_create(gallery, batch_size=batch_size)
+    return catalog
+
+
+def create_blog(seed, posts, comments, images, until, batch_size):
+    """``posts`` published posts with tags and threads averaging ``comments`` comments."""
+    from apps.blog.content import process_content
+    from apps.blog.models import BlogCategory, BlogComment, BlogPost, Tag
+
+    rng = random.Random(f'{seed}:blog')
+    author, _ = User.objects.get_or_create(
+        username=f'{SEED_PREFIX}author', defaults={'first_name': 'Seed', 'last_name': 'Author'},
+    )
+    BlogCategory.objects.bulk_create([
+        BlogCategory(name=f'{name} guides', slug=f'{SEED_PREFIX}{n}', description=_sentence(rng))
+        for n, name in enumerate(['Frame', 'Lens', 'Eye care', 'Style', 'News'])
+    ])
+    category_ids = list(
+        BlogCategory.objects.filter(slug__startswith=SEED_PREFIX).order_by('pk').values_list('pk', flat=True)
+    )
+    Tag.objects.bulk_create([Tag(name=f'{SEED_PREFIX}{word}', slug=f'{SEED_PREFIX}{word}') for word in WORDS[:40]],
+                            ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(slug__startswith=SEED_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+    # Plan each post's threads first so comment_count is right on insert:
+    # (approved, [replies]) trees, where a reply is the same shape.
+    def thread(depth):
+        approved = rng.random() > 0.05
+        replies = [thread(depth + 1) for _ in range(rng.randint(0, 2))] if approved and depth < 2 and rng.random() < 0.4 else []
+        return approved, replies
+
+    def visible(node):
+        approved, replies = node
+        return approved + sum(visible(reply) for reply in replies) if approved else 0
+
+    plans = []
+    rows = []
+    for n in range(posts):
+        content = ''.join(
+            f'<h2>{_sentence(rng, 2, 5)[:-1]}</h2>' + ''.join(f'<p>{_paragraph(rng)}</p>' for _ in range(rng.randint(1, 4)))
+            for _ in range(rng.randint(2, 6))
+        )
+        processed = process_content(content)
+        threads = [thread(0) for _ in range(int(rng.expovariate(1 / comments)) if comments else 0)]
+        plans.append(threads)
+        rows.append(BlogPost(
+            title=_sentence(rng, 3, 8)[:-1],
+            slug=f'{SEED_PREFIX}post-{n}',
+            author=author,
+            category_id=rng.choice(category_ids),
+            content=content,
+            excerpt=_sentence(rng, 12, 24),
+            featured_image=images[n % len(images)] if images else '',
+            is_published=rng.random() < 0.95,
+            is_featured=rng.random() < 0.05,
+            published_at=_ago(rng, until, 3 * 365),
+            views=int(rng.paretovariate(1.2) * 20),
+            comment_count=sum(visible(node) for node in threads),
+            read_time=processed.read_time,
+            word_count=processed.word_count,
+            plain_text=processed.plain_text,
+            rendered_html=processed.rendered_html,
+            toc=processed.toc,
+        ))
+    with transaction.atomic():
+        BlogPost.objects.bulk_create(rows, batch_size=batch_size)
+    post_ids = list(BlogPost.objects.filter(slug__startswith=SEED_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+    Through = BlogPost.tags.through
+    with transaction.atomic():
+        Through.objects.bulk_create([
+            Through(blogpost_id=pk, tag_id=tag_id)
+            for pk in post_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 4))
+        ], batch_size=batch_size)
+
+    # One bulk insert per nesting level; each level's pks parent the next.
+    level = [(post_id, None, node) for post_id, threads in zip(post_ids, plans) for node in threads]
+    total = 0
+    while level:
+        comments_ = [
+            BlogComment(
+                post_id=post_id, parent_id=parent_id, name=f'Reader {rng.randrange(10000)}',
+                email='reader@example.com', content=_paragraph(rng, 1, 3), is_approved=approved,
+            )
+            for post_id, parent_id, (approved, replies) in level
+        ]
+        with transaction.atomic():
+            BlogComment.objects.bulk_create(comments_, batch_size=batch_size)
+        total += len(comments_)
+        level = [
+            (post_id, comment.pk, reply)
+            for (post_id, parent_id, (approved, replies)), comment in zip(level, comments_)
+            for reply in replies
+        ]
+    return len(post_ids), total
+
+
+def run_chunks(func, total, workers=1):
+    """
+    Call ``func((chunk, start, stop))`` for every CHUNK_SIZE slice of
+    ``range(total)`` and yield the results, in forked worker processes when
+    ``workers`` > 1 and the database takes concurrent writers.
+    """
+    chunks = [(n, start, min(start + CHUNK_SIZE, total)) for n, start in enumerate(range(0, total, CHUNK_SIZE))]
+    if workers > 1 and connection.vendor != 'sqlite' and 'fork' in multiprocessing.get_all_start_methods():
+        # Each child must open its own connection.
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            yield from pool.imap_unordered(func, chunks)
+    else:
+        for chunk in chunks:
+            yield func(chunk)
+
+
+def insert_clicks(chunk):
+    n, start, stop = chunk
+    rng = random.Random(f'{_shared["seed"]}:clicks:{n}')
+    catalog = _shared['catalog']
+    sessions = _shared['sessions']
+    rows = []
+    for _ in range(start, stop):
+        pk, name, price = _skewed(rng, catalog)
+        visitor = int(sessions * rng.random() ** 2)
+        rows.append(WhatsAppOrderClick(
+            product_id=str(pk),
+            product_name=name,
+            price=price,
+            session_key=f'{SEED_PREFIX}{visitor:035x}',
+            ip_address=f'10.{visitor >> 16 & 255}.{visitor >> 8 & 255}.{visitor & 255}',
+            user_agent=USER_AGENTS[visitor % len(USER_AGENTS)],
+            clicked_at=_ago(rng, _shared['until'], _shared['days']),
+        ))
+    with transaction.atomic():
+        WhatsAppOrderClick.objects.bulk_create(rows, batch_size=_shared['batch_size'])
+    return len(rows)
+
+
+def insert_wishlists(chunk):
+    n, start, stop = chunk
+    rng = random.Random(f'{_shared["seed"]}:wishlists:{n}')
+    catalog = _shared['catalog']
+    wishlists = [
+        Wishlist(session_key=f'{SEED_PREFIX}w{number:034x}', email='' if rng.random() < 0.9 else f'shopper{number}@example.com')
+        for number in range(start, stop)
+    ]
+    with transaction.atomic():
+        Wishlist.objects.bulk_create(wishlists, batch_size=_shared['batch_size'])
+        items = []
+        for wishlist in wishlists:
+            picked = {_skewed(rng, catalog)[0] for _ in range(min(1 + int(rng.expovariate(0.6)), 8))}
+            items.extend(WishlistItem(wishlist_id=wishlist.pk, product_id=pk) for pk in sorted(picked))
+        WishlistItem.objects.bulk_create(items, batch_size=_shared['batch_size'])
+    return len(wishlists) + len(items)
+
+
+def create_activity(seed, catalog, clicks, wishlists, until, days, workers, batch_size):
+    """Clicks over the ``days`` before ``until`` and wishlists. Yields ``(table, rows)`` per chunk."""
+    _shared.update({
+        'seed': seed, 'catalog': catalog, 'until': until, 'days': days, 'batch_size': batch_size,
+        # Roughly four clicks per visitor, most of them from a few regulars.
+        'sessions': max(clicks // 4, 1),
+    })
+    for rows in run_chunks(insert_clicks, clicks, workers):
+        yield 'clicks', rows
+    for rows in run_chunks(insert_wishlists, wishlists, workers):
+        yield 'wishlists', rows
@@ -0,0 +1,348 @@
+"""
+Full-text product search.
+
+Products are indexed into a ``main_productsearch`` table that the 0006
+migration creates per database vendor:
+
+* PostgreSQL: a weighted ``tsvector`` column with a GIN index, ranked with
+  ``ts_rank``.
+* SQLite: an FTS5 virtual table with the porter tokenizer, ranked with
+  ``bm25``.
+
+Any other database, or ``PRODUCT_SEARCH_BACKEND = 'basic'``, falls back to
+the old ``icontains`` search. Queries go through the same synonym expansion
+on every backend, so "shades" finds sunglasses and "blue light" finds
+``blue_light`` lenses. Synonym phrases are matched on word boundaries and
+become single tokens ("anti-glare" -> ``antiglare``); ``build_document``
+indexes the same tokens for the phrases in a product's own text, and the
+basic backend looks for the phrases themselves.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_TABLE = 'main_productsearch'
+
+# Lens types are indexed as single tokens ("bluelight") so that multi-word
+# phrases in the query can be mapped onto them unambiguously.
+LENS_TYPE_TOKENS = {
+    'prescription': 'prescription',
+    'reading': 'reading',
+    'sunglasses': 'sunglasses',
+    'blue_light': 'bluelight',
+    'photochromic': 'photochromic',
+    'polarized': 'polarized',
+}
+
+PHRASE_SYNONYMS = {
+    'blue light': 'bluelight',
+    'blue-light': 'bluelight',
+    'blue_light': 'bluelight',
+    'blue blocker': 'bluelight',
+    'blue blockers': 'bluelight',
+    'computer glasses': 'bluelight',
+    'anti glare': 'antiglare',
+    'anti-glare': 'antiglare',
+    'sun glasses': 'sunglasses',
+    'reading glasses': 'reading',
+}
+
+TERM_SYNONYMS = {
+    'shades': ['sunglasses'],
+    'sunnies': ['sunglasses'],
+    'sunglass': ['sunglasses'],
+    'readers': ['reading'],
+    'specs': ['glasses', 'spectacles'],
+    'spectacles': ['glasses'],
+    'eyeglasses': ['glasses'],
+    'frames': ['frame'],
+    'polarised': ['polarized'],
+    'transition': ['photochromic'],
+    'transitions': ['photochromic'],
+    'photochromatic': ['photochromic'],
+}
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Longest first, so "blue blockers" wins over "blue blocker".
+PHRASE_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(phrase) for phrase in sorted(PHRASE_SYNONYMS, key=len, reverse=True)) + r')\b'
+)
+
+PHRASES_BY_TOKEN = {}
+for _phrase, _token in PHRASE_SYNONYMS.items():
+    PHRASES_BY_TOKEN.setdefault(_token, []).append(_phrase)
+
+
+def phrase_tokens(text):
+    """The synonym tokens of the phrases that occur in ``text``."""
+    return list(dict.fromkeys(PHRASE_SYNONYMS[phrase] for phrase in PHRASE_RE.findall(text.lower())))
+
+
+def parse_query(query, phrases=True):
+    """
+    Turn a raw search string into a list of term groups.
+
+    Every group must match (AND); any term inside a group may match (OR).
+    Terms only ever contain ``[a-z0-9]`` so they are safe to splice into
+    backend query syntax. ``phrases=False`` leaves synonym phrases as their
+    words, for indexes that do not carry the phrase tokens.
+    """
+    text = query.lower()
+    if phrases:
+        text = PHRASE_RE.sub(lambda match: f' {PHRASE_SYNONYMS[match.group(1)]} ', text)
+
+    groups = []
+    for term in TOKEN_RE.findall(text):
+        alternatives = [term]
+        for synonym in TERM_SYNONYMS.get(term, []):
+            alternatives.extend(TOKEN_RE.findall(synonym))
+        group = list(dict.fromkeys(alternatives))
+        if group not in groups:
+            groups.append(group)
+    return groups
+
+
+def build_document(product):
+    """Return the (name, category, keywords, description) fields to index."""
+    lens_labels = dict(product._meta.get_field('lens_type').flatchoices)
+    keywords = []
+    if product.lens_type:
+        keywords.append(LENS_TYPE_TOKENS.get(product.lens_type, product.lens_type))
+        keywords.append(lens_labels.get(product.lens_type, ''))
+    keywords.extend(feature.name for feature in product.features.all())
+    keywords.extend([
+        product.frame_material, product.lens_material,
+        product.uv_protection, product.product_code or '',
+    ])
+    # Queries turn "anti-glare" into "antiglare"; index it wherever the phrase occurs.
+    text = ' '.join([product.name, product.description or '', *(k for k in keywords if k)])
+    keywords.extend(token for token in phrase_tokens(text) if token not in keywords)
+    return (
+        product.name,
+        product.category.name if product.category_id else '',
+        ' '.join(k for k in keywords if k),
+        product.description,
+    )
+
+
+class BasicProductSearch:
+    """``icontains`` search, used where no full-text index is available."""
+
+    name = 'basic'
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def search(self, queryset, query, with_rank=True):
+        from .models import Product
+
+        groups = parse_query(query)
+        if not groups:
+            return queryset.none()
+        for group in groups:
+            condition = Q()
+            for term in group:
+                condition |= (
+                    Q(name__icontains=term) |
+                    Q(description__icontains=term) |
+                    Q(category__name__icontains=term)
+                )
+                for phrase in PHRASES_BY_TOKEN.get(term, []):
+                    # Features go through a subquery so the result needs no DISTINCT.
+                    featured = Product.features.through.objects.filter(feature__name__icontains=phrase).values('product_id')
+                    condition |= (
+                        Q(name__icontains=phrase) |
+                        Q(description__icontains=phrase) |
+                        Q(pk__in=featured)
+                    )
+                lens_types = [code for code, token in LENS_TYPE_TOKENS.items() if term in (code, token)]
+                if lens_types:
+                    condition |= Q(lens_type__in=lens_types)
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def order_by_rank(self, queryset):
+        if 'search_rank' in queryset.query.annotations:
+            return queryset.order_by(F('search_rank').desc(nulls_last=True), '-is_featured', '-created_at')
+        return queryset
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+
+class PostgresProductSearch(BasicProductSearch):
+    """Weighted ``tsvector`` search ranked with ``ts_rank``."""
+
+    name = 'postgres'
+    config = 'english'
+
+    def to_tsquery(self, groups):
+        return ' & '.join(
+            '(' + ' | '.join(f'{term}:*' for term in group) + ')'
+            for group in groups
+        )
+
+    def search(self, queryset, query, with_rank=True):
+        groups = parse_query(query)
+        if not groups:
+            return queryset.none()
+        tsquery = self.to_tsquery(groups)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f"SELECT product_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('{self.config}', %s)",
+            [tsquery],
+        )
+        rank = RawSQL(
+            f"SELECT ts_rank(s.document, to_tsquery('{self.config}', %s)) "
+            f"FROM {SEARCH_TABLE} s WHERE s.product_id = {table}.id",
+            [tsquery],
+        )
+        queryset = queryset.filter(id__in=matches)
+        return queryset.annotate(search_rank=rank) if with_rank else queryset
+
+    def index_products(self, products):
+        rows = [(product.pk, *build_document(product)) for product in products]
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'C') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'D')) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)", [product_ids])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+class SQLiteProductSearch(BasicProductSearch):
+    """FTS5 search ranked with ``bm25`` (name > category > keywords > description)."""
+
+    name = 'sqlite'
+    weights = '10.0, 4.0, 2.0, 1.0'
+
+    def to_match(self, groups):
+        return ' AND '.join(
+            '(' + ' OR '.join(f'"{term}"*' for term in group) + ')'
+            for group in groups
+        )
+
+    def search(self, queryset, query, with_rank=True):
+        groups = parse_query(query)
+        if not groups:
+            return queryset.none()
+        match = self.to_match(groups)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [match],
+        )
+        # bm25() is lower-is-better; negate it so every backend sorts descending.
+        rank = RawSQL(
+            f"SELECT -bm25({SEARCH_TABLE}, {self.weights}) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+            [match],
+        )
+        queryset = queryset.filter(id__in=matches)
+        return queryset.annotate(search_rank=rank) if with_rank else queryset
+
+    def index_products(self, products):
+        rows = [(product.pk, *build_document(product)) for product in products]
+        if not rows:
+            return
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, category, keywords, description) "
+                f"VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with connections[self.using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+BACKENDS = {
+    'basic': BasicProductSearch,
+    'postgresql': PostgresProductSearch,
+    'postgres': PostgresProductSearch,
+    'sqlite': SQLiteProductSearch,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """Return the search backend for ``using``, honouring PRODUCT_SEARCH_BACKEND."""
+    name = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None) or connections[using].vendor
+    return BACKENDS.get(name, BasicProductSearch)(using=using)
+
+
+def search_products(queryset, query, with_rank=True):
+    """Filter ``queryset`` by ``query`` and annotate ``search_rank`` where supported."""
+    return get_search_backend(queryset.db).search(queryset, query, with_rank=with_rank)
+
+
+def order_by_relevance(queryset):
+    return get_search_backend(queryset.db).order_by_rank(queryset)
+
+
+def indexable_products(queryset):
+    return queryset.select_related('category').prefetch_related('features')
+
+
+def reindex_products(product_ids, using=DEFAULT_DB_ALIAS):
+    """Refresh the index rows for ``product_ids``, dropping any that no longer exist."""
+    from .models import Product
+
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    backend = get_search_backend(using)
+    products = list(indexable_products(Product.objects.using(using).filter(pk__in=product_ids)))
+    backend.index_products(products)
+    backend.remove_products(product_ids - {product.pk for product in products})
+
+
+def rebuild_index(queryset, batch_size=500):
+    """Clear the index and re-add every product in ``queryset``. Returns the count."""
+    backend = get_search_backend(queryset.db)
+    backend.clear()
+    total = 0
+    batch = []
+    for product in indexable_products(queryset).order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            backend.index_products(batch)
+            total += len(batch)
+            batch = []
+    backend.index_products(batch)
+    return total + len(batch)
@@ -1,7 +1,26 @@
-from django.db.models.signals import post_save
+import logging
+import threading
+
+from django.db import transaction, DatabaseError
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.core.cache import cache
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.contrib.sites.models import Site
+from django.apps import apps
+from .models import (
+    UserProfile, CompanyInfo, Product, ProductImage, Category, Feature, Testimonial, AboutGlasses,
+    RelatedProduct,
+)
+from .cache_tags import bump_tags
+from .search import reindex_products
+from .images import SOURCE_FIELDS
+from .jobs import enqueue
+from .static_sitemaps import schedule_sitemap_build
+from . import tasks  # registers the job handlers
+from .whatsapp import invalidate_link_config
+
+logger = logging.getLogger(__name__)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -19,4 +38,157 @@ def save_user_profile(sender, instance, **kwargs):
     else:
         # Only create if not already exists
         if not UserProfile.objects.filter(user=instance).exists():
-            UserProfile.objects.create(user=instance)
\ No newline at end of file
+            UserProfile.objects.create(user=instance)
+
+@receiver(post_save, sender=CompanyInfo)
+@receiver(post_delete, sender=CompanyInfo)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def refresh_whatsapp_link_config(sender, **kwargs):
+    """Rebuild the cached WhatsApp number/domain on the next link"""
+    invalidate_link_config()
+    cache.delete('company_info')
+
+
+def schedule_search_reindex(product_ids, using):
+    """Refresh the search index rows for ``product_ids`` once the transaction commits"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    def reindex():
+        try:
+            reindex_products(product_ids, using=using)
+        except DatabaseError as e:
+            logger.warning("Could not update product search index: %s", e)
+
+    transaction.on_commit(reindex, using=using)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_product_search_index(sender, instance, using, **kwargs):
+    """Keep the product's search document in sync with the row"""
+    schedule_search_reindex([instance.pk], using)
+
+@receiver(m2m_changed, sender=Product.features.through)
+def update_product_features_search_index(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Re-index products whose feature list changed"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_search_reindex([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._search_cleared_products = list(instance.product_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        schedule_search_reindex(instance.__dict__.pop('_search_cleared_products', []), using)
+    elif action in ('post_add', 'post_remove'):
+        schedule_search_reindex(pk_set or [], using)
+
+_pending_related = threading.local()
+
+def schedule_related_refresh(product_ids, using):
+    """Queue a related-products refresh when the transaction commits"""
+    # Saves in one transaction (product form, then its features) share the
+    # first callback; later callbacks find nothing pending.
+    _pending_related.__dict__.setdefault(using, set()).update(product_ids)
+
+    def refresh():
+        product_ids = _pending_related.__dict__.pop(using, set())
+        if not product_ids:
+            return
+        try:
+            enqueue('refresh_related', {'product_ids': sorted(product_ids), 'using': using}, using=using)
+        except DatabaseError as e:
+            logger.warning("Could not queue a related products refresh: %s", e)
+
+    transaction.on_commit(refresh, using=using)
+
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, using, **kwargs):
+    """Re-rank the neighborhoods the saved product belongs to"""
+    schedule_related_refresh([instance.pk], using)
+
+@receiver(pre_delete, sender=Product)
+def update_related_products_on_delete(sender, instance, using, **kwargs):
+    """Lists that included the product lose a row to the cascade; rebuild them"""
+    schedule_related_refresh(
+        [instance.pk, *RelatedProduct.objects.using(using).filter(related=instance).values_list('product_id', flat=True)],
+        using,
+    )
+
+@receiver(m2m_changed, sender=Product.features.through)
+def update_related_products_features(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Shared features feed the similarity score"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_related_refresh([instance.pk], using)
+    elif action == 'pre_clear':
+        instance._related_cleared_products = list(instance.product_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        schedule_related_refresh(instance.__dict__.pop('_related_cleared_products', []), using)
+    elif action in ('post_add', 'post_remove'):
+        schedule_related_refresh(pk_set or [], using)
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, using, **kwargs):
+    """Category names are part of each product's search document"""
+    if not created:
+        schedule_search_reindex(instance.products.values_list('pk', flat=True), using)
+
+@receiver(post_save, sender=Feature)
+def update_feature_search_index(sender, instance, created, using, **kwargs):
+    """Feature names are part of each product's search document"""
+    if not created:
+        schedule_search_reindex(instance.product_set.values_list('pk', flat=True), using)
+
+# Cache tags retired when each model changes; see cache_tags.py and page_cache.py.
+CACHE_TAGS = {
+    Product: ['catalog'],
+    Product.features.through: ['catalog'],
+    ProductImage: ['catalog'],
+    Category: ['catalog'],
+    Feature: ['catalog'],
+    CompanyInfo: ['company'],
+    Site: ['company'],
+    Testimonial: ['testimonials'],
+    AboutGlasses: ['about'],
+}
+
+def bump_model_cache_tags(sender, **kwargs):
+    """Retire cached pages and facet counts built from the changed model"""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        tags = CACHE_TAGS[sender]
+        transaction.on_commit(lambda: bump_tags(*tags), using=kwargs.get('using'))
+
+for model in CACHE_TAGS:
+    if model is Product.features.through:
+        m2m_changed.connect(bump_model_cache_tags, sender=model, dispatch_uid=f'cache_tags_m2m_{model._meta.label}')
+    else:
+        post_save.connect(bump_model_cache_tags, sender=model, dispatch_uid=f'cache_tags_save_{model._meta.label}')
+        post_delete.connect(bump_model_cache_tags, sender=model, dispatch_uid=f'cache_tags_delete_{model._meta.label}')
+
+def generate_image_derivatives(sender, instance, using, **kwargs):
+    """Queue resizing of a newly uploaded image; the save returns right away"""
+    field_name = IMAGE_FIELDS[sender]
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile:
+        return
+    enqueue(
+        'generate_image_derivatives',
+        {'model': sender._meta.label, 'pk': instance.pk, 'field': field_name, 'tags': CACHE_TAGS[sender]},
+        idempotency_key=f'image_derivatives:{fieldfile.name}',
+        using=using,
+    )
+
+IMAGE_FIELDS = {apps.get_model(label): field_name for label, field_name in SOURCE_FIELDS}
+
+for model in IMAGE_FIELDS:
+    post_save.connect(generate_image_derivatives, sender=model, dispatch_uid=f'image_derivatives_{model._meta.label}')
+
+
+def sitemap_content_changed(sender, using, **kwargs):
+    """Queue a debounced rebuild of the prebuilt sitemaps"""
+    schedule_sitemap_build(using=using)
+
+for model in (Product, Category):
+    post_save.connect(sitemap_content_changed, sender=model, dispatch_uid=f'sitemap_save_{model._meta.label}')
+    post_delete.connect(sitemap_content_changed, sender=model, dispatch_uid=f'sitemap_delete_{model._meta.label}')
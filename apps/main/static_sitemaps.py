@@ -0,0 +1,194 @@
+"""
+Prebuilt sitemaps.
+
+Instead of rendering every product and post on each crawler hit,
+``build_sitemaps`` writes the sections in ``settings.SITEMAPS`` to the
+``sitemaps`` storage as gzipped shards plus a ``sitemap.xml`` index, and
+``views.serve_sitemap`` serves those files with ``Last-Modified``.
+
+* Model sections are sharded by primary-key range
+  (``SITEMAP_SHARD_SIZE`` ids per shard), so a new or deleted object only
+  changes the shard its id falls in.
+* One aggregate query per section gives each shard's count, id sum and
+  latest ``updated_at``. With the protocol and site domain, which every
+  ``<loc>`` embeds, these make the shard's signature; only shards whose
+  signature differs from the last build are rendered and rewritten. Other sections (the static pages) are
+  rendered and rewritten when their bytes change.
+* ``sitemap-manifest.json`` records what each shard was built from.
+
+Builds run from ``build_sitemaps`` (cron) and from a debounced
+``build_sitemaps`` job queued when catalog or blog content changes. Until
+the first build, ``/sitemap.xml`` falls back to the live sitemap view.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.sitemaps.views import SitemapIndexItem
+from django.contrib.sites.models import Site
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db.models import Count, F, Max, QuerySet, Sum
+from django.template import loader
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'sitemap.xml'
+MANIFEST_NAME = 'sitemap-manifest.json'
+LASTMOD_FIELD = 'updated_at'
+
+
+def get_storage():
+    return storages['sitemaps']
+
+
+def get_sitemaps():
+    """``settings.SITEMAPS`` with the dotted paths imported."""
+    return {section: import_string(path) for section, path in settings.SITEMAPS.items()}
+
+
+def shard_size():
+    return getattr(settings, 'SITEMAP_SHARD_SIZE', 5000)
+
+
+def shard_name(section, shard):
+    return f'sitemap-{section}-{shard}.xml.gz'
+
+
+def write_file(storage, name, data):
+    """Replace ``name`` atomically where the storage is on local disk."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(data))
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_manifest(storage):
+    if not storage.exists(MANIFEST_NAME):
+        return {}
+    try:
+        with storage.open(MANIFEST_NAME, 'rb') as f:
+            return json.loads(f.read())
+    except ValueError:
+        logger.warning('Ignoring unreadable %s', MANIFEST_NAME)
+        return {}
+
+
+def render_urlset(sitemap, items, site, protocol):
+    # get_urls() paginates self.items(); point it at this shard's items.
+    sitemap.items = lambda: items
+    urls = sitemap.get_urls(site=site, protocol=protocol)
+    return loader.render_to_string('sitemap.xml', {'urlset': urls}).encode()
+
+
+def model_shards(sitemap, queryset):
+    """``(shard, signature, lastmod, items)`` for each non-empty id range."""
+    size = min(shard_size(), sitemap.limit)
+    has_lastmod = any(f.name == LASTMOD_FIELD for f in queryset.model._meta.concrete_fields)
+    aggregates = {'count': Count('pk'), 'pk_sum': Sum('pk')}
+    if has_lastmod:
+        aggregates['lastmod'] = Max(LASTMOD_FIELD)
+    rows = (
+        queryset.order_by()
+        .annotate(shard=F('pk') / size)
+        .values('shard')
+        .annotate(**aggregates)
+        .order_by('shard')
+    )
+    for row in rows:
+        shard = row['shard']
+        lastmod = row['lastmod'].isoformat() if row.get('lastmod') else None
+        items = queryset.filter(pk__gte=shard * size, pk__lt=(shard + 1) * size).order_by('pk')
+        yield shard, [row['count'], row['pk_sum'], lastmod], lastmod, items
+
+
+def build_sitemaps(force=False):
+    """Rewrite the shards and index that changed. Returns a stats dict."""
+    storage = get_storage()
+    manifest = load_manifest(storage)
+    built = manifest.get('shards', {})
+    site = Site.objects.get_current()
+    protocol = getattr(settings, 'SITEMAP_PROTOCOL', 'https')
+    base_url = f'{protocol}://{site.domain}'
+    shards = {}
+    stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+    for section, sitemap_class in get_sitemaps().items():
+        sitemap = sitemap_class()
+        items = sitemap.items()
+        if isinstance(items, QuerySet):
+            candidates = model_shards(sitemap, items)
+        else:
+            candidates = [(0, None, None, list(items))]
+        for shard, signature, lastmod, shard_items in candidates:
+            name = shard_name(section, shard)
+            if signature is not None:
+                signature = [*signature, base_url]
+            previous = None if force else built.get(name)
+            if signature is not None and previous and previous['signature'] == signature and storage.exists(name):
+                shards[name] = previous
+                stats['unchanged'] += 1
+                continue
+            xml = render_urlset(sitemap, shard_items, site, protocol)
+            if signature is None:
+                signature = hashlib.sha1(xml).hexdigest()
+                if previous and previous['signature'] == signature and storage.exists(name):
+                    shards[name] = previous
+                    stats['unchanged'] += 1
+                    continue
+            # mtime=0 keeps the bytes identical for identical content.
+            write_file(storage, name, gzip.compress(xml, mtime=0))
+            shards[name] = {'signature': signature, 'lastmod': lastmod}
+            stats['written'] += 1
+
+    index = loader.render_to_string('sitemap_index.xml', {'sitemaps': [
+        SitemapIndexItem(
+            f'{base_url}{reverse("sitemap_shard", args=[name])}',
+            datetime.fromisoformat(entry['lastmod']) if entry['lastmod'] else None,
+        )
+        for name, entry in shards.items()
+    ]}).encode()
+    index_digest = hashlib.sha1(index).hexdigest()
+    if force or index_digest != manifest.get('index') or not storage.exists(INDEX_NAME):
+        write_file(storage, INDEX_NAME, index)
+    write_file(storage, MANIFEST_NAME, json.dumps({'index': index_digest, 'shards': shards}).encode())
+
+    # Shards that dropped out of the index (emptied id ranges, removed sections).
+    for name in set(built) - set(shards):
+        if storage.exists(name):
+            storage.delete(name)
+        stats['removed'] += 1
+    return stats
+
+
+def schedule_sitemap_build(using=None):
+    """Queue a ``build_sitemaps`` job for the end of the current SITEMAP_REBUILD_DELAY window."""
+    from .jobs import enqueue, jobs_eager
+
+    kwargs = {'using': using} if using else {}
+    delay = getattr(settings, 'SITEMAP_REBUILD_DELAY', 300)
+    if jobs_eager() or not delay:
+        enqueue('build_sitemaps', **kwargs)
+        return
+    # Every change in a window shares one job, which runs after the window
+    # closes and so sees all of them.
+    now = time.time()
+    window = int(now // delay)
+    enqueue('build_sitemaps', idempotency_key=f'build_sitemaps:{window}', delay=(window + 1) * delay - now, **kwargs)
@@ -0,0 +1,79 @@
+"""
+Upload staging for remote media storage.
+
+``QueuedUploadStorage`` wraps the real (remote) default storage. Saving an
+upload writes it to a local staging directory and queues a
+``storage_upload`` job; the request returns without waiting on S3. Reads go
+to the staged copy until the job has pushed it to the remote storage and
+removed it. URLs always point at the remote storage, where the file shows
+up as soon as the job has run.
+
+Enable it with ``QUEUED_UPLOADS=True``; settings.py then moves the remote
+backend into this storage's ``remote`` option. The ``run_jobs`` worker must
+see the same ``MEDIA_STAGING_ROOT`` as the web processes.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.files.storage import Storage, FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+@deconstructible
+class QueuedUploadStorage(Storage):
+    def __init__(self, remote=None, staging_location=None):
+        remote = remote or {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+        self.remote = import_string(remote['BACKEND'])(**remote.get('OPTIONS', {}))
+        self.staging = FileSystemStorage(
+            location=staging_location or settings.MEDIA_STAGING_ROOT,
+        )
+
+    def _open(self, name, mode='rb'):
+        if self.staging.exists(name):
+            return self.staging.open(name, mode)
+        return self.remote.open(name, mode)
+
+    def _save(self, name, content):
+        from .jobs import enqueue
+
+        name = self.staging.save(name, content)
+        enqueue('storage_upload', {'name': name}, idempotency_key=f'storage_upload:{name}', max_attempts=5)
+        return name
+
+    def upload_staged(self, name):
+        """Copy a staged file to the remote storage, then drop the local copy."""
+        if not self.staging.exists(name):
+            return
+        with self.staging.open(name, 'rb') as content:
+            saved = self.remote.save(name, content)
+        if saved != name:
+            logger.warning("Remote storage renamed %s to %s", name, saved)
+        self.staging.delete(name)
+
+    def exists(self, name):
+        return self.staging.exists(name) or self.remote.exists(name)
+
+    def delete(self, name):
+        self.staging.delete(name)
+        self.remote.delete(name)
+
+    def size(self, name):
+        if self.staging.exists(name):
+            return self.staging.size(name)
+        return self.remote.size(name)
+
+    def url(self, name):
+        return self.remote.url(name)
+
+    def listdir(self, path):
+        return self.remote.listdir(path)
+
+    def get_modified_time(self, name):
+        if self.staging.exists(name):
+            return self.staging.get_modified_time(name)
+        return self.remote.get_modified_time(name)
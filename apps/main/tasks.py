@@ -0,0 +1,77 @@
+"""
+Background job handlers; queued through ``jobs.enqueue``.
+"""
+
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .cache_tags import bump_tags
+from .images import generate_derivatives
+from .jobs import register_job
+from .related import refresh_related
+from .static_sitemaps import build_sitemaps
+
+
+AVATAR_SIZE = (300, 300)
+
+
+@register_job('resize_avatar')
+def resize_avatar(profile_id):
+    """Shrink a profile avatar to at most 300x300, in place"""
+    from .models import UserProfile
+
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.avatar:
+        return
+    storage = profile.avatar.storage
+    name = profile.avatar.name
+    with storage.open(name, 'rb') as f:
+        img = Image.open(f)
+        img.load()
+    if img.height <= AVATAR_SIZE[1] and img.width <= AVATAR_SIZE[0]:
+        return
+    fmt = img.format or 'PNG'
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail(AVATAR_SIZE)
+    buffer = BytesIO()
+    img.save(buffer, fmt)
+    storage.delete(name)
+    saved = storage.save(name, ContentFile(buffer.getvalue()))
+    if saved != name:
+        UserProfile.objects.filter(pk=profile_id).update(avatar=saved)
+
+
+@register_job('generate_image_derivatives')
+def generate_image_derivatives(model, pk, field, tags=()):
+    """Resized copies of one uploaded image; retried by the runner on failure"""
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field):
+        return
+    generate_derivatives(getattr(instance, field))
+    if tags:
+        # Pages rendered before the derivatives existed point at the original.
+        bump_tags(*tags)
+
+
+@register_job('storage_upload')
+def storage_upload(name):
+    """Push a staged upload to remote storage; see storage.QueuedUploadStorage"""
+    upload = getattr(default_storage, 'upload_staged', None)
+    if upload is not None:
+        upload(name)
+
+
+@register_job('refresh_related')
+def refresh_related_products(product_ids, using='default'):
+    """Re-rank the neighbor lists around products that were saved or deleted"""
+    refresh_related(product_ids, using=using)
+
+
+@register_job('build_sitemaps')
+def rebuild_sitemaps():
+    """Rewrite the sitemap shards whose objects changed"""
+    build_sitemaps()
@@ -0,0 +1,77 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from apps.main.images import get_manifest, srcset, best_rendition, derivative_widths, FORMATS
+
+register = template.Library()
+
+# ``sizes`` for each place an image is shown.
+SIZES = {
+    'card': '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 300px',
+    'thumb': '100px',
+    'detail': '(max-width: 768px) 100vw, 50vw',
+    'zoom': '100vw',
+    'hero': '100vw',
+}
+
+# Width of the <img src> fallback for browsers without srcset.
+FALLBACK_WIDTH = {
+    'card': 'card',
+    'thumb': 'card',
+    'detail': 'detail',
+    'zoom': 'zoom',
+    'hero': 'zoom',
+}
+
+
+def _file_url(image):
+    try:
+        return image.url
+    except ValueError:
+        return ''
+
+
+@register.simple_tag
+def responsive_image(image, usage='card', **attrs):
+    """
+    ``<picture>`` with WebP/AVIF sources, a JPEG ``<img>`` and intrinsic size::
+
+        {% responsive_image product.image 'card' alt=product.name class="product-img" loading="lazy" %}
+
+    Falls back to a plain ``<img>`` of the original upload when the image has
+    no derivatives yet.
+    """
+    if not image:
+        return ''
+    manifest = get_manifest(image.name)
+    if manifest is None:
+        return format_html('<img src="{}"{}>', _file_url(image), flatatt(attrs))
+
+    sizes = SIZES.get(usage, SIZES['card'])
+    fallback_width = derivative_widths().get(FALLBACK_WIDTH.get(usage, 'card'), 800)
+    formats = list(manifest['renditions'])
+    img_attrs = {
+        'src': default_storage.url(best_rendition(manifest, fallback_width, formats[-1])),
+        'srcset': srcset(manifest, formats[-1]),
+        'sizes': sizes,
+        'width': manifest['width'],
+        'height': manifest['height'],
+        **attrs,
+    }
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((FORMATS[fmt]['mime'], srcset(manifest, fmt), sizes) for fmt in formats[:-1]),
+    )
+    return format_html('<picture>{}<img{}></picture>', sources, flatatt(img_attrs))
+
+
+@register.simple_tag
+def image_url(image, usage='detail', fmt='jpeg'):
+    """URL of the ``fmt`` derivative sized for ``usage``, or the original."""
+    if not image:
+        return ''
+    manifest = get_manifest(image.name)
+    name = manifest and best_rendition(manifest, derivative_widths().get(FALLBACK_WIDTH.get(usage, usage), 800), fmt)
+    return default_storage.url(name) if name else _file_url(image)
@@ -0,0 +1,204 @@
+"""
+Test helpers: realistic fixtures at any size and query budgets.
+
+``seed_catalog`` and ``seed_blog`` build a store and a blog with
+``bulk_create`` (so a 10,000-row fixture takes seconds), fill the search
+indexes and precomputed related-product lists, and return the objects the
+tests navigate from.
+
+``QueryBudgetMixin.assertQueryBudget`` requests a URL and fails when it
+runs more queries than its budget, listing the repeated query shapes
+(an N+1 shows up as one statement run once per row) followed by every
+query that ran.
+"""
+
+import datetime
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import (
+    AboutGlasses, Category, CompanyInfo, Feature, Product, ProductImage, RelatedProduct, Testimonial,
+)
+from .request_metrics import fingerprint
+from .search import rebuild_index as rebuild_product_index
+
+
+LENS_TYPES = [value for value, label in Product.LENS_TYPES]
+MATERIALS = ['Acetate', 'Titanium', 'Metal', 'TR90']
+FEATURES = ['UV400', 'Anti-glare', 'Scratch resistant', 'Lightweight', 'Spring hinges', 'Blue light filter']
+
+
+def seed_catalog(products=10, categories=6, related=4):
+    """A catalog of ``products`` active products spread over ``categories``."""
+    CompanyInfo.objects.create(
+        description='<p>Eyewear</p>', address='Harare', phone='0771000000',
+        whatsapp='263771000000', opening_hours='Mon-Sat 9-5',
+    )
+    AboutGlasses.objects.bulk_create([AboutGlasses(title=f'About {i}', content='Lenses') for i in range(3)])
+    Testimonial.objects.bulk_create([
+        Testimonial(name=f'Customer {i}', text='Great frames', is_featured=i == 0) for i in range(6)
+    ])
+    Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}', order=i) for i in range(categories)
+    ])
+    category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+    Feature.objects.bulk_create([Feature(name=name) for name in FEATURES])
+    feature_ids = list(Feature.objects.order_by('pk').values_list('pk', flat=True))
+
+    Product.objects.bulk_create([
+        Product(
+            name=f'Frame {i}',
+            slug=f'frame-{i}',
+            product_code=f'EYE-{i:06d}',
+            category_id=category_ids[i % len(category_ids)],
+            description=f'Frame {i} in {MATERIALS[i % len(MATERIALS)].lower()}',
+            price=Decimal(40 + i % 160),
+            old_price=Decimal(60 + i % 160) if i % 3 == 0 else None,
+            is_on_sale=i % 3 == 0,
+            is_featured=i % 5 == 0,
+            image=f'products/frame-{i % 20}.jpg',
+            lens_type=LENS_TYPES[i % len(LENS_TYPES)],
+            frame_material=MATERIALS[i % len(MATERIALS)],
+            stock_quantity=i % 12,
+        )
+        for i in range(products)
+    ], batch_size=1000)
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+
+    Through = Product.features.through
+    Through.objects.bulk_create([
+        Through(product_id=pk, feature_id=feature_ids[(n + offset) % len(feature_ids)])
+        for n, pk in enumerate(product_ids)
+        for offset in (0, 2)
+    ], batch_size=2000)
+    ProductImage.objects.bulk_create([
+        ProductImage(product_id=pk, image=f'products/gallery/frame-{n % 20}-{i}.jpg', is_primary=i == 0)
+        for n, pk in enumerate(product_ids)
+        for i in range(2)
+    ], batch_size=2000)
+    # Neighbors in the same category, instead of running the related engine
+    # (quadratic on a catalog where every product shares a feature).
+    by_category = {}
+    for n, pk in enumerate(product_ids):
+        by_category.setdefault(category_ids[n % len(category_ids)], []).append(pk)
+    RelatedProduct.objects.bulk_create([
+        RelatedProduct(product_id=pk, related_id=members[(i + step) % len(members)], score=1.0 / step, rank=step - 1)
+        for members in by_category.values()
+        for i, pk in enumerate(members)
+        for step in range(1, min(related, len(members) - 1) + 1)
+    ], batch_size=2000)
+    rebuild_product_index(Product.objects.all())
+    return {
+        'product': Product.objects.get(pk=product_ids[0]),
+        'category': Category.objects.get(pk=category_ids[0]),
+    }
+
+
+def seed_blog(posts=10, categories=3, tags=8, comments=3):
+    """``posts`` published posts with tags and ``comments`` threads (one reply each) apiece."""
+    from apps.blog.content import process_content
+    from apps.blog.models import BlogCategory, BlogComment, BlogPost, Tag
+    from apps.blog.search import rebuild_index
+
+    now = timezone.now()
+    author = User.objects.create(username='author', first_name='Ama', last_name='Writer')
+    BlogCategory.objects.bulk_create([
+        BlogCategory(name=f'Topic {i}', slug=f'topic-{i}') for i in range(categories)
+    ])
+    category_ids = list(BlogCategory.objects.order_by('pk').values_list('pk', flat=True))
+    Tag.objects.bulk_create([Tag(name=f'tag {i}', slug=f'tag-{i}') for i in range(tags)])
+    tag_ids = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    content = '<h2>Choosing frames</h2><p>' + 'Lenses and frames for every face. ' * 60 + '</p><h2>Care</h2><p>Clean daily.</p>'
+    processed = process_content(content)
+    BlogPost.objects.bulk_create([
+        BlogPost(
+            title=f'Eyewear guide {i}',
+            slug=f'eyewear-guide-{i}',
+            author=author,
+            category_id=category_ids[i % len(category_ids)],
+            content=content,
+            excerpt=f'Guide number {i} to picking glasses',
+            featured_image=f'blog/post-{i % 10}.jpg',
+            is_published=True,
+            # bulk_create skips save(), which would set this.
+            published_at=now - datetime.timedelta(hours=i),
+            is_featured=i % 7 == 0,
+            views=i,
+            comment_count=comments * 2,
+            read_time=processed.read_time,
+            word_count=processed.word_count,
+            plain_text=processed.plain_text,
+            rendered_html=processed.rendered_html,
+            toc=processed.toc,
+        )
+        for i in range(posts)
+    ], batch_size=1000)
+    post_ids = list(BlogPost.objects.order_by('pk').values_list('pk', flat=True))
+
+    Through = BlogPost.tags.through
+    Through.objects.bulk_create([
+        Through(blogpost_id=pk, tag_id=tag_ids[(n + offset) % len(tag_ids)])
+        for n, pk in enumerate(post_ids)
+        for offset in (0, 3)
+    ], batch_size=2000)
+    BlogComment.objects.bulk_create([
+        BlogComment(post_id=pk, name=f'Reader {i}', email='reader@example.com', content='Helpful, thanks', is_approved=True)
+        for pk in post_ids
+        for i in range(comments)
+    ], batch_size=2000)
+    BlogComment.objects.bulk_create([
+        BlogComment(post_id=post_id, parent_id=pk, name='Author', email='author@example.com', content='Glad it helped', is_approved=True)
+        for pk, post_id in BlogComment.objects.values_list('pk', 'post_id')
+    ], batch_size=2000)
+    rebuild_index(BlogPost.objects.all())
+    return {
+        'post': BlogPost.objects.get(pk=post_ids[0]),
+        'category': BlogCategory.objects.get(pk=category_ids[0]),
+        'tag': Tag.objects.get(pk=tag_ids[0]),
+    }
+
+
+class QueryBudgetMixin:
+    """``assertQueryBudget`` for ``TestCase`` classes."""
+
+    def assertQueryBudget(self, budget, path, method='get', data=None, status=200, **extra):
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(path, data, **extra)
+        self.assertEqual(
+            response.status_code, status,
+            f'{method.upper()} {path} returned {response.status_code}, expected {status}',
+        )
+        if len(captured) > budget:
+            self.fail(budget_report(method, path, budget, captured.captured_queries))
+        return response
+
+
+def budget_report(method, path, budget, queries):
+    shapes = {}
+    for query in queries:
+        shapes.setdefault(fingerprint(query['sql']), []).append(query['sql'])
+    repeated = sorted(((len(sqls), shape) for shape, sqls in shapes.items() if len(sqls) > 1), reverse=True)
+    lines = [f'{method.upper()} {path} ran {len(queries)} queries; the budget is {budget}.']
+    if repeated:
+        lines.append('Repeated query shapes:')
+        lines.extend(f'  {count}x {shape}' for count, shape in repeated)
+    lines.append('All queries:')
+    lines.extend(f'  {n}. {query["sql"]}' for n, query in enumerate(queries, 1))
+    return '\n'.join(lines)
+
+
+def requires_template(name):
+    """Skip a view's budget test while the view's template is missing from the tree."""
+    try:
+        get_template(name)
+    except TemplateDoesNotExist:
+        return unittest.skip(f'{name} does not exist')
+    return lambda test: test
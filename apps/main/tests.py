@@ -1,3 +1,610 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core import signing
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection, connections
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .cache_backends import LOG_KEY, SEQ_KEY, TwoTierCache
+from .cache_tags import bump_tags
+from .clicks import BAD_SUFFIX, SPILL_SUFFIX, ClickBuffer, buffer as click_buffer, clean_price
+from .company import get_company_info
+from .db_circuit import CircuitBreakerMixin, database_circuit
+from .fragments import get_or_compute
+from .jobs import run_now
+from .models import ClickRollup, CompanyInfo, Job, Product, RelatedProduct, WhatsAppOrderClick
+from .pagination import paginate
+from .related import rebuild_related, refresh_related
+from .rollups import rebuild_rollups, rollup_clicks
+from .search import parse_query, search_products
+from .static_sitemaps import build_sitemaps, get_storage as get_sitemap_storage
+from .testing import QueryBudgetMixin, requires_template, seed_catalog, seed_blog
+
+
+SITEMAP_ROOT = tempfile.mkdtemp(prefix='eyedentity-sitemaps-')
+CLICK_SPILL_ROOT = tempfile.mkdtemp(prefix='eyedentity-clicks-')
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'apps.main.cache_backends.TwoTierCache',
+        'OPTIONS': {'L2': 'shared'},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'query-budget-tests',
+    },
+}
+
+QUERY_BUDGET_SETTINGS = {
+    'ALLOWED_HOSTS': ['*'],
+    'CACHES': TEST_CACHES,
+    'PAGE_CACHE_ENABLED': False,
+    'JOBS_EAGER': False,
+    # No write-behind threads against the test database; nothing is spilled into the repo.
+    'CLICK_BUFFER_THREAD': False,
+    'CLICK_SPILL_DIR': CLICK_SPILL_ROOT,
+    'COUNTER_FLUSH_THREAD': False,
+    'REQUEST_METRICS_ENABLED': False,
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        'sitemaps': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': SITEMAP_ROOT, 'base_url': '/'},
+        },
+    },
+}
+
+
+def tearDownModule():
+    shutil.rmtree(SITEMAP_ROOT, ignore_errors=True)
+    shutil.rmtree(CLICK_SPILL_ROOT, ignore_errors=True)
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class CatalogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Every URL in apps/main/urls.py against a cold cache. The budgets are the
+    same for every catalog size: a view whose query count grows with the
+    data fails in LargeCatalogQueryBudgetTests.
+    """
+
+    rows = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_catalog(products=cls.rows)
+        cls.product = seeded['product']
+        cls.category = seeded['category']
+        seed_blog(posts=10)
+        cls.staff = User.objects.create(username='staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def add_to_wishlist(self):
+        self.client.post(f'/wishlist/add/{self.product.pk}/')
+        cache.clear()
+
+    def test_home(self):
+        self.assertQueryBudget(12, '/')
+
+    def test_about(self):
+        self.assertQueryBudget(3, '/about/')
+
+    @requires_template('main/about_glasses.html')
+    def test_about_glasses(self):
+        self.assertQueryBudget(3, '/about-glasses/')
+
+    def test_not_found(self):
+        # Company info only; the lazy context values are never touched.
+        self.assertQueryBudget(1, '/no-such-page/', status=404)
+
+    def test_contact(self):
+        self.assertQueryBudget(2, '/contact/')
+
+    def test_categories(self):
+        self.assertQueryBudget(4, '/categories/')
+
+    def test_category_detail(self):
+        self.assertQueryBudget(8, f'/category/{self.category.slug}/')
+
+    def test_shop(self):
+        self.assertQueryBudget(14, '/shop/')
+
+    def test_shop_search(self):
+        self.assertQueryBudget(14, '/shop/', data={'search': 'frame'})
+
+    def test_shop_filtered(self):
+        self.assertQueryBudget(14, '/shop/', data={'category': self.category.slug, 'lens_type': 'reading', 'order': 'price'})
+
+    def test_shop_last_page(self):
+        self.assertQueryBudget(14, '/shop/', data={'page': 'last'})
+
+    def test_product_detail(self):
+        self.assertQueryBudget(14, f'/product/{self.product.slug}/')
+
+    def test_search(self):
+        self.assertQueryBudget(9, '/search/', data={'q': 'frame'})
+
+    @requires_template('main/add_product.html')
+    def test_add_product(self):
+        self.assertQueryBudget(3, '/product/add/')
+
+    def test_newsletter_signup(self):
+        self.assertQueryBudget(
+            5, '/newsletter/signup/', method='post',
+            data=json.dumps({'email': 'reader@example.com'}), content_type='application/json',
+        )
+
+    def test_product_variants(self):
+        self.assertQueryBudget(3, f'/api/product/{self.product.pk}/variants/')
+
+    def test_category_products(self):
+        self.assertQueryBudget(3, f'/api/category/{self.category.slug}/products/')
+
+    @requires_template('main/wishlist.html')
+    def test_wishlist(self):
+        self.add_to_wishlist()
+        self.assertQueryBudget(6, '/wishlist/')
+
+    def test_add_to_wishlist(self):
+        self.assertQueryBudget(14, f'/wishlist/add/{self.product.pk}/', method='post')
+
+    def test_remove_from_wishlist(self):
+        self.add_to_wishlist()
+        self.assertQueryBudget(7, f'/wishlist/remove/{self.product.pk}/', method='post')
+
+    def test_wishlist_count(self):
+        self.add_to_wishlist()
+        self.assertQueryBudget(3, '/wishlist/count/')
+
+    def test_visitor_state(self):
+        self.add_to_wishlist()
+        self.assertQueryBudget(3, '/api/visitor/')
+
+    def test_quick_quote(self):
+        self.assertQueryBudget(3, f'/product/{self.product.pk}/quick-quote/', status=302)
+
+    def test_share_product(self):
+        self.assertQueryBudget(4, f'/product/{self.product.pk}/share/', status=302)
+
+    def test_track_whatsapp_order(self):
+        self.assertQueryBudget(
+            1, '/api/track-whatsapp-order/', method='post',
+            data=json.dumps({'product_id': self.product.pk, 'product_name': 'Frame 0', 'price': '40'}),
+            content_type='application/json', status=204,
+        )
+
+    def test_click_buffer_stats(self):
+        self.client.force_login(self.staff)
+        self.assertQueryBudget(2, '/api/track-whatsapp-order/stats/')
+
+    def test_sitemap_before_first_build(self):
+        shutil.rmtree(SITEMAP_ROOT, ignore_errors=True)
+        # The live fallback: one page of each section plus the context processors.
+        self.assertQueryBudget(10, '/sitemap.xml')
+
+    def test_prebuilt_sitemap(self):
+        build_sitemaps(force=True)
+        self.assertQueryBudget(0, '/sitemap.xml')
+        self.assertQueryBudget(0, '/sitemap-products-0.xml.gz')
+
+    def test_sitemap_rebuilt_for_new_base_url(self):
+        # Site.objects caches across tests; the rollback does not clear it.
+        self.addCleanup(Site.objects.clear_cache)
+        build_sitemaps(force=True)
+        self.assertEqual(build_sitemaps()['written'], 0)
+        Site.objects.update(domain='shop.example.com')
+        Site.objects.clear_cache()
+        self.assertEqual(build_sitemaps()['unchanged'], 0)
+        with self.settings(SITEMAP_PROTOCOL='https'):
+            self.assertEqual(build_sitemaps()['unchanged'], 0)
+        with get_sitemap_storage().open('sitemap-products-0.xml.gz') as f:
+            self.assertIn(b'<loc>https://shop.example.com/', gzip.decompress(f.read()))
+
+
+class LargeCatalogQueryBudgetTests(CatalogQueryBudgetTests):
+    rows = 10000
+
+
+@override_settings(**{**QUERY_BUDGET_SETTINGS, 'PAGE_CACHE_ENABLED': True})
+class CachedPageQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Repeat anonymous views are answered from the page cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_catalog(products=10)
+        cls.product = seeded['product']
+        cls.category = seeded['category']
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCachedBudget(self, budget, path):
+        self.client.get(path)
+        self.assertQueryBudget(budget, path)
+
+    def test_home(self):
+        self.assertCachedBudget(0, '/')
+
+    def test_shop(self):
+        self.assertCachedBudget(0, '/shop/')
+
+    def test_category_detail(self):
+        self.assertCachedBudget(0, f'/category/{self.category.slug}/')
+
+    def test_product_detail(self):
+        # The recently-viewed tracker (product id and session) runs on cached hits too.
+        self.assertCachedBudget(2, f'/product/{self.product.slug}/')
+
+    def test_stale_page_while_circuit_open(self):
+        self.client.get('/shop/')
+        # An edit retires the fresh copy; the database then goes down.
+        bump_tags('catalog')
+        database_circuit.open(probe=False)
+        self.addCleanup(database_circuit.close)
+        response = self.assertQueryBudget(0, '/shop/')
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertEqual(response.content, self.client.get('/shop/').content)
+
+
+class ParseQueryTests(SimpleTestCase):
+    """Synonym phrases are matched on word boundaries."""
+
+    def test_phrases(self):
+        self.assertEqual(parse_query('Anti-Glare frames'), [['antiglare'], ['frames', 'frame']])
+        self.assertEqual(parse_query('anti glare'), [['antiglare']])
+        self.assertEqual(parse_query('blue blockers'), [['bluelight']])
+
+    def test_phrase_inside_words(self):
+        self.assertEqual(parse_query('blue lightweight'), [['blue'], ['lightweight']])
+        self.assertEqual(parse_query('navy blue light'), [['navy'], ['bluelight']])
+
+    def test_term_synonyms_keep_the_term(self):
+        self.assertEqual(parse_query('shades'), [['shades', 'sunglasses']])
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class ProductSearchTests(TestCase):
+    """Products are found by the synonym token of a phrase in their own text."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=12)
+        cls.anti_glare = set(Product.objects.filter(features__name='Anti-glare').values_list('pk', flat=True))
+
+    def assertFinds(self, query, expected):
+        for backend in ['sqlite', 'basic']:
+            with self.subTest(query=query, backend=backend), self.settings(PRODUCT_SEARCH_BACKEND=backend):
+                found = search_products(Product.objects.all(), query, with_rank=False)
+                self.assertEqual(set(found.values_list('pk', flat=True)), expected)
+
+    def test_phrase_synonym(self):
+        self.assertTrue(self.anti_glare)
+        self.assertFinds('anti-glare', self.anti_glare)
+        self.assertFinds('anti glare', self.anti_glare)
+
+
+TWO_TIER_L2 = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'two-tier-tests',
+}
+
+
+@override_settings(CACHES={**TEST_CACHES, 'two_tier_l2': TWO_TIER_L2})
+class TwoTierCacheTests(SimpleTestCase):
+    """Two workers' TwoTierCache instances sharing one L2."""
+
+    sync_interval = 0.05
+
+    def setUp(self):
+        self.l2 = caches['two_tier_l2']
+        self.l2.clear()
+        self.a = self.worker()
+        self.b = self.worker()
+
+    def worker(self):
+        return TwoTierCache('', {'OPTIONS': {
+            'L2': 'two_tier_l2', 'SYNC_INTERVAL': self.sync_interval,
+            'NAMESPACES': {'exact_': {'l1_timeout': 0}},
+        }})
+
+    def wait_for_sync(self):
+        time.sleep(self.sync_interval * 2)
+
+    def test_write_evicts_other_workers_l1(self):
+        self.a.set('menu', 'old')
+        self.assertEqual(self.b.get('menu'), 'old')
+        self.a.set('menu', 'new')
+        # Within SYNC_INTERVAL the other worker still serves its L1 copy.
+        self.assertEqual(self.b.get('menu'), 'old')
+        self.wait_for_sync()
+        self.assertEqual(self.b.get('menu'), 'new')
+
+    def test_own_writes_not_evicted(self):
+        self.a.set('menu', 'mine')
+        # Written behind the log's back: only an L1 eviction would reveal it.
+        self.l2.set('menu', 'elsewhere')
+        self.wait_for_sync()
+        self.assertEqual(self.a.get('menu'), 'mine')
+
+    def test_l2_flush_clears_l1(self):
+        self.a.set('menu', 'old')
+        self.assertEqual(self.b.get('menu'), 'old')
+        self.l2.clear()
+        self.wait_for_sync()
+        self.assertIsNone(self.b.get('menu'))
+
+    def test_log_gap_clears_l1(self):
+        self.a.set('menu', 'old')
+        self.assertEqual(self.b.get('menu'), 'old')
+        self.a.set('other', 1)
+        self.l2.delete(LOG_KEY.format(self.l2.get(SEQ_KEY)))
+        self.l2.set('menu', 'new')
+        self.wait_for_sync()
+        self.assertEqual(self.b.get('menu'), 'new')
+
+    def test_l1_timeout_zero_skips_l1(self):
+        self.a.set('exact_count', 1)
+        self.l2.set('exact_count', 2)
+        self.assertEqual(self.a.get('exact_count'), 2)
+        self.assertFalse(self.a._l1.get('exact_'))
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS, CURSOR_PAGINATION=True, CURSOR_PAGINATION_OFFSET_PAGES=1)
+class CursorPaginationTests(TestCase):
+    """Signed keyset cursors past the offset window."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=12)
+        # Equal timestamps exercise the pk tiebreaker.
+        Product.objects.filter(pk__lte=6).update(created_at=timezone.now())
+
+    def setUp(self):
+        self.queryset = Product.objects.order_by('-created_at')
+        self.factory = RequestFactory()
+
+    def page(self, link='/shop/'):
+        return paginate(self.factory.get(link if link.startswith('/') else '/shop/' + link), self.queryset, 5)
+
+    def test_cursors_walk_every_row_once(self):
+        page = self.page()
+        seen = [product.pk for product in page]
+        while page.has_next():
+            page = self.page(page.next_link)
+            seen.extend(product.pk for product in page)
+        self.assertEqual(seen, list(self.queryset.order_by('-created_at', '-pk').values_list('pk', flat=True)))
+        back = [product.pk for product in page]
+        while page.has_previous():
+            page = self.page(page.previous_link)
+            back[:0] = [product.pk for product in page]
+        self.assertEqual(back, seen)
+
+    def test_tampered_cursor_rejected(self):
+        token = self.page().next_link.split('cursor=')[1]
+        for bad in [token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB'), 'garbage', signing.dumps({'v': [1, 2], 'r': False})]:
+            with self.subTest(cursor=bad), self.assertRaises(Http404):
+                self.page(f'?cursor={bad}')
+
+    def test_page_numbers_past_window_rejected(self):
+        with self.assertRaises(Http404):
+            self.page('?page=2')
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class RelatedProductsTests(TestCase):
+    """Product edits refresh related lists in a job, from a blocked candidate set."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = seed_catalog(products=60, categories=2)['product']
+
+    def test_save_queues_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        job = Job.objects.get(kind='refresh_related')
+        self.assertEqual(job.payload['product_ids'], [self.product.pk])
+        # Seeded lists mix lens types; nothing changed before the job ran.
+        self.assertEqual(RelatedProduct.objects.filter(product=self.product).exclude(related__lens_type=self.product.lens_type).count(), 3)
+        run_now(job.pk)
+        related = Product.objects.filter(related_from__product=self.product)
+        self.assertEqual(set(related.values_list('category_id', 'lens_type')), {(self.product.category_id, self.product.lens_type)})
+
+    def test_refresh_stays_within_the_block(self):
+        rebuild_related()
+        # The same count for any catalog size: one candidate query per list touched.
+        with self.assertNumQueries(13):
+            refresh_related([self.product.pk])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FragmentTests(TestCase):
+    """get_or_compute: single flight, stale-while-revalidate, negative caching."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_company_info_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_company_info())
+            self.assertIsNone(get_company_info())
+
+    def test_one_thread_computes(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_or_compute('slow', compute, 60))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_served_while_another_worker_revalidates(self):
+        cache.set('menu', {'value': 'old', 'fresh_until': time.time() - 1, 'stale_until': time.time() + 60}, 60)
+        cache.add('compute_lock:menu', 'other-worker', 30)
+        self.assertEqual(get_or_compute('menu', lambda: 'new', 60), 'old')
+        cache.delete('compute_lock:menu')
+        self.assertEqual(get_or_compute('menu', lambda: 'new', 60), 'new')
+        self.assertEqual(get_or_compute('menu', lambda: 'newer', 60), 'new')
+
+    def test_last_value_served_while_circuit_open(self):
+        cache.set('menu', {'value': 'old', 'fresh_until': time.time() - 120, 'stale_until': time.time() - 60}, 60)
+        database_circuit.open(probe=False)
+        self.addCleanup(database_circuit.close)
+        self.assertEqual(get_or_compute('menu', lambda: 'new', 60), 'old')
+
+
+class DatabaseCircuitTests(TestCase):
+    """Only lost connections count toward opening the circuit, and only in a row."""
+
+    def setUp(self):
+        self.addCleanup(setattr, database_circuit, '_failures', 0)
+
+    def test_error_on_live_connection_not_counted(self):
+        with self.assertRaises(OperationalError), connection.cursor() as cursor:
+            cursor.execute('SELECT * FROM no_such_table')
+        self.assertEqual(database_circuit._failures, 0)
+
+    def test_failed_connect_counted(self):
+        settings_dict = {**connection.settings_dict, 'NAME': '/nonexistent/eyedentity.sqlite3'}
+        wrapper = type(connections['default'])(settings_dict, alias='default')
+        self.assertIsInstance(wrapper, CircuitBreakerMixin)
+        with self.assertRaises(OperationalError):
+            wrapper.ensure_connection()
+        self.assertEqual(database_circuit._failures, 1)
+
+    def test_success_resets_failures(self):
+        database_circuit._failures = database_circuit.failure_threshold - 1
+        CompanyInfo.objects.exists()
+        self.assertEqual(database_circuit._failures, 0)
+        self.assertFalse(database_circuit.is_open())
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class ClickRollupTests(TestCase):
+    """Runs fold each click in once; unique sessions are not counted twice."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = seed_catalog(products=5, categories=1)['product']
+        cls.noon = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0) - datetime.timedelta(days=1)
+
+    def click(self, session_key, minutes=0):
+        return WhatsAppOrderClick.objects.create(
+            product_id=str(self.product.pk), product_name=self.product.name, price=Decimal('10.00'),
+            session_key=session_key, clicked_at=self.noon + datetime.timedelta(minutes=minutes),
+        )
+
+    def totals(self):
+        return dict(
+            ((rollup.period, rollup.dimension), (rollup.clicks, rollup.unique_sessions))
+            for rollup in ClickRollup.objects.all()
+        )
+
+    def test_second_run_adds_nothing(self):
+        for session_key in ['a', 'a', 'b', '']:
+            self.click(session_key)
+        self.assertEqual(rollup_clicks(delay=False), 4)
+        totals = self.totals()
+        self.assertEqual(totals['day', ClickRollup.TOTAL], (4, 2))
+        self.assertEqual(totals['hour', ClickRollup.PRODUCT], (4, 2))
+        self.assertEqual(rollup_clicks(delay=False), 0)
+        self.assertEqual(self.totals(), totals)
+
+    def test_incremental_runs_match_rebuild(self):
+        self.click('a')
+        self.click('b', minutes=5)
+        rollup_clicks(delay=False)
+        # 'a' was counted by the first run; only 'c' is a new session.
+        self.click('a', minutes=10)
+        self.click('c', minutes=15)
+        self.assertEqual(rollup_clicks(delay=False, chunk_size=1), 2)
+        totals = self.totals()
+        self.assertEqual(totals['day', ClickRollup.CATEGORY], (4, 3))
+        self.assertEqual(rebuild_rollups(), 4)
+        self.assertEqual(self.totals(), totals)
+
+    def test_delayed_run_stops_at_previous_high_water(self):
+        self.click('a')
+        self.assertEqual(rollup_clicks(), 0)
+        self.click('b')
+        self.assertEqual(rollup_clicks(), 1)
+        self.assertEqual(ClickRollup.objects.get(period='day', dimension=ClickRollup.TOTAL).clicks, 1)
+        self.assertEqual(rollup_clicks(), 1)
+        self.assertEqual(self.totals()['day', ClickRollup.TOTAL], (2, 2))
+
+
+@override_settings(**QUERY_BUDGET_SETTINGS)
+class ClickBufferTests(TestCase):
+    """Click prices are validated up front; refused rows and files are set aside."""
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp(dir=CLICK_SPILL_ROOT)
+        settings_override = override_settings(CLICK_SPILL_DIR=self.spill_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.buffer = ClickBuffer()
+
+    def click(self, price='10.00'):
+        return WhatsAppOrderClick(product_id='1', product_name='Frame', price=Decimal(price), clicked_at=timezone.now())
+
+    def spill_files(self, suffix=SPILL_SUFFIX):
+        return [name for name in os.listdir(self.spill_dir) if name.endswith(suffix)]
+
+    def test_tracking_rejects_bad_prices(self):
+        for price in ['NaN', 'Infinity', '1e12', '-1', 'cheap']:
+            response = self.client.post('/api/track-whatsapp-order/', json.dumps({'price': price}), content_type='application/json')
+            self.assertEqual(response.status_code, 400, price)
+
+    def test_tracking_queues_without_a_thread(self):
+        data = json.dumps({'product_id': 7, 'product_name': 'Tracked', 'price': '40'})
+        response = self.client.post('/api/track-whatsapp-order/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(click_buffer.thread)
+        self.assertFalse(WhatsAppOrderClick.objects.exists())
+        click_buffer.flush()
+        self.assertTrue(WhatsAppOrderClick.objects.filter(product_name='Tracked').exists())
+
+    def test_clean_price(self):
+        self.assertEqual(clean_price('12.346'), Decimal('12.35'))
+        self.assertEqual(clean_price(None), Decimal('0.00'))
+        with self.assertRaises(ValueError):
+            clean_price('99999999.999')
+
+    def test_flush_sets_aside_bad_rows(self):
+        for price in ['10.00', 'NaN', '12.00']:
+            self.buffer.queue.put(self.click(price))
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(WhatsAppOrderClick.objects.count(), 2)
+        self.assertEqual(self.buffer.counters['rejected'], 1)
+        self.assertEqual(len(self.spill_files(BAD_SUFFIX)), 1)
+
+    def test_replay_sets_aside_bad_file(self):
+        self.buffer._spill([self.click('10.00'), self.click('NaN')])
+        self.buffer._spill([self.click('12.00')])
+        self.buffer.replay_spilled()
+        # The bad file's good row is rolled back with it, not inserted twice later.
+        self.assertEqual(list(WhatsAppOrderClick.objects.values_list('price', flat=True)), [Decimal('12.00')])
+        self.assertEqual(self.spill_files(), [])
+        self.assertEqual(len(self.spill_files(BAD_SUFFIX)), 1)
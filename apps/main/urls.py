@@ -29,9 +29,11 @@ urlpatterns = [
     path('wishlist/add/<int:product_id>/', views.add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/remove/<int:product_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('wishlist/count/', views.get_wishlist_count, name='wishlist_count'),
+    path('api/visitor/', views.visitor_state, name='visitor_state'),
     
     # WhatsApp Actions
     path('product/<int:product_id>/quick-quote/', views.quick_quote, name='quick_quote'),
     path('product/<int:product_id>/share/', views.share_product, name='share_product'),
     path('api/track-whatsapp-order/', views.track_whatsapp_order, name='track_whatsapp_order'),
+    path('api/track-whatsapp-order/stats/', views.click_buffer_stats, name='click_buffer_stats'),
 ]
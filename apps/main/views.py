@@ -4,13 +4,14 @@ ALL 500 errors fixed
 """
 
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q, Count
 from django.contrib import messages
-from django.http import JsonResponse, Http404
-from django.views.decorators.http import require_http_methods
+from django.http import HttpResponse, JsonResponse, Http404
+from django.views.decorators.http import require_http_methods, condition
 from django.views.decorators.csrf import csrf_protect
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_page, never_cache
+from django.contrib.admin.views.decorators import staff_member_required
+from django.middleware.csrf import get_token
 from django.utils import timezone
 from django.conf import settings
 import json
@@ -19,36 +20,47 @@ from django.db import ProgrammingError, OperationalError
 
 from .models import (
     Product, Category, Testimonial, CompanyInfo, 
-    Newsletter, ContactMessage, Feature, AboutGlasses, Wishlist, WishlistItem, WhatsAppOrderClick
+    Newsletter, ContactMessage, Feature, AboutGlasses, Wishlist, WishlistItem
 )
 from .forms import ProductForm
+from .pagination import paginate
+from .facets import parse_filters, apply_filters, get_facets, has_active_filters
+from .search import search_products, order_by_relevance
+from .whatsapp import prime_whatsapp_links
+from .page_cache import cache_anonymous_page
+from .visitor import get_visitor_key, get_visitor_wishlist
+from .request_values import get_request_value, lazy_request_value, request_value
+from .fragments import get_or_compute
+from .related import get_related_products
+from .images import prime_manifests
+from .clicks import clean_price, record_click, stats as click_stats
+from .company import get_company_info
+from .static_sitemaps import INDEX_NAME, get_sitemaps, get_storage as get_sitemap_storage
+
+
+FRAGMENT_TIMEOUT = 60 * 15
+
+
+def load_home_blocks():
+    """The homepage product, category, testimonial and about blocks"""
+    return {
+        'sale_products': list(Product.objects.filter(
+            is_on_sale=True,
+            is_active=True
+        ).select_related('category').prefetch_related('features')[:6]),
+        'featured_products': list(Product.objects.filter(
+            is_featured=True, 
+            is_active=True
+        ).select_related('category').prefetch_related('features')[:6]),
+        'categories': list(Category.objects.filter(is_active=True)[:6]),
+        'testimonials': list(Testimonial.objects.filter(
+            is_active=True
+        ).order_by('-is_featured', '-created_at')[:3]),
+        'about_glasses_cards': list(AboutGlasses.objects.all().order_by('id')),
+    }
 
 
-def get_company_info():
-    """Get company info with proper error handling - PRODUCTION SAFE"""
-    from django.core.cache import cache
-    
-    # Try to get from cache first
-    company_info = cache.get('company_info')
-    
-    if company_info is None:
-        try:
-            company_info = CompanyInfo.objects.first()
-            # Don't auto-create in production
-            if company_info:
-                # Cache for 1 hour
-                cache.set('company_info', company_info, 60 * 60)
-            
-        except (ProgrammingError, OperationalError) as e:
-            print(f"Database error getting company info: {e}")
-            return None
-        except Exception as e:
-            print(f"Unexpected error getting company info: {e}")
-            return None
-    
-    return company_info
-
-
+@cache_anonymous_page('catalog', 'testimonials', 'about')
 def home(request):
     """Homepage view - PRODUCTION SAFE"""
     def chunked(iterable, n):
@@ -71,27 +83,18 @@ def home(request):
     about_glasses_cards = []
     
     try:
-        # Safely query products
-        sale_products = list(Product.objects.filter(
-            is_on_sale=True,
-            is_active=True
-        ).select_related('category').prefetch_related('features')[:6])
+        blocks = get_or_compute('home_blocks', load_home_blocks, FRAGMENT_TIMEOUT, tags=('catalog', 'testimonials', 'about'))
+        sale_products = blocks['sale_products']
+        featured_products = blocks['featured_products']
+        categories = blocks['categories']
+        testimonials = blocks['testimonials']
+        about_glasses_cards = blocks['about_glasses_cards']
         
         if sale_products:
             sale_product_groups = list(chunked(sale_products, 3))
         
-        featured_products = list(Product.objects.filter(
-            is_featured=True, 
-            is_active=True
-        ).select_related('category').prefetch_related('features')[:6])
-        
-        categories = list(Category.objects.filter(is_active=True)[:6])
-        
-        testimonials = list(Testimonial.objects.filter(
-            is_active=True
-        ).order_by('-is_featured', '-created_at')[:3])
-        
-        about_glasses_cards = list(AboutGlasses.objects.all().order_by('id'))
+        prime_whatsapp_links(sale_products + featured_products)
+        prime_manifests([p.image.name for p in sale_products + featured_products] + [c.image.name for c in categories])
         
     except (ProgrammingError, OperationalError) as e:
         print(f"Database error in home view: {e}")
@@ -112,14 +115,15 @@ def home(request):
     return render(request, 'main/home.html', context)
 
 
+@cache_anonymous_page('catalog')
 def shop(request):
     """Shop page - PRODUCTION SAFE"""
     # Initialize defaults
     products_list = Product.objects.none()
     categories = []
     search_query = ''
-    current_category = ''
-    price_filter = ''
+    filters = parse_filters(request.GET)
+    facets = None
     order_by = '-created_at'
     
     try:
@@ -132,32 +136,17 @@ def shop(request):
         # Search functionality
         search_query = request.GET.get('search', '').strip()
         if search_query:
-            products_list = products_list.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(category__name__icontains=search_query)
-            )
-        
-        # Category filtering
-        current_category = request.GET.get('category', '')
-        if current_category:
-            try:
-                products_list = products_list.filter(category__slug=current_category)
-            except Exception:
-                pass
+            products_list = search_products(products_list, search_query)
         
-        # Price filtering
-        price_filter = request.GET.get('price', '')
-        if price_filter == 'low':
-            products_list = products_list.filter(price__lt=15)
-        elif price_filter == 'mid':
-            products_list = products_list.filter(price__gte=15, price__lte=25)
-        elif price_filter == 'high':
-            products_list = products_list.filter(price__gt=25)
+        # Category, lens type, feature, material, sale and price facets
+        products_list = apply_filters(products_list, filters)
+        facets = get_facets(filters, search_query)
         
         # Ordering
         order_by = request.GET.get('order', '-created_at')
-        if order_by in ['price', '-price', 'name', '-name', '-created_at', '-is_featured']:
+        if search_query and 'order' not in request.GET:
+            products_list = order_by_relevance(products_list)
+        elif order_by in ['price', '-price', 'name', '-name', '-created_at', '-is_featured']:
             products_list = products_list.order_by(order_by)
         
     except (ProgrammingError, OperationalError) as e:
@@ -166,24 +155,20 @@ def shop(request):
         print(f"Unexpected error in shop view: {e}")
     
     # Pagination - always safe
-    paginator = Paginator(products_list, 12)
-    page = request.GET.get('page', 1)
+    products = paginate(request, products_list, 12)
     
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages if paginator.num_pages > 0 else 1)
-    except Exception:
-        products = paginator.page(1)
+    products.object_list = prime_whatsapp_links(products.object_list)
+    prime_manifests(p.image.name for p in products.object_list)
     
     context = {
         'products': products,
         'categories': categories,
         'search_query': search_query,
-        'current_category': current_category,
-        'price_filter': price_filter,
+        'current_category': filters['category'][0] if filters['category'] else '',
+        'price_filter': filters['price'][0] if filters['price'] else '',
+        'filters': filters,
+        'facets': facets,
+        'has_active_filters': has_active_filters(filters),
         'order_by': order_by,
         'company_info': get_company_info(),
     }
@@ -217,15 +202,18 @@ def about_glasses(request):
     })
 
 
+@cache_anonymous_page('catalog', 'about')
 def categories_list(request):
     """Categories page - PRODUCTION SAFE"""
     categories = []
     about = None
     
     try:
-        categories = list(Category.objects.filter(is_active=True).annotate(
-            product_count=Count('products', filter=Q(products__is_active=True))
-        ).order_by('order', 'name'))
+        categories = get_or_compute('category_menu:counts', lambda: list(
+            Category.objects.filter(is_active=True).annotate(
+                product_count=Count('products', filter=Q(products__is_active=True))
+            ).order_by('order', 'name')
+        ), FRAGMENT_TIMEOUT, tags=('catalog',))
         
         about = AboutGlasses.objects.order_by('-last_updated').first()
     except (ProgrammingError, OperationalError) as e:
@@ -239,6 +227,7 @@ def categories_list(request):
     return render(request, 'main/categories.html', context)
 
 
+@cache_anonymous_page('catalog')
 def category_detail(request, slug):
     """Category detail page - PRODUCTION SAFE"""
     try:
@@ -254,13 +243,10 @@ def category_detail(request, slug):
         return redirect('categories')
     
     # Pagination
-    paginator = Paginator(products_list, 12)
-    page = request.GET.get('page', 1)
+    products = paginate(request, products_list, 12)
     
-    try:
-        products = paginator.page(page)
-    except (PageNotAnInteger, EmptyPage):
-        products = paginator.page(1)
+    products.object_list = prime_whatsapp_links(products.object_list)
+    prime_manifests(p.image.name for p in products.object_list)
     
     context = {
         'category': category,
@@ -270,6 +256,21 @@ def category_detail(request, slug):
     return render(request, 'main/category_detail.html', context)
 
 
+def track_recently_viewed(request, slug):
+    """Remember the product in the visitor's session, even on cached pages"""
+    try:
+        product_id = Product.objects.filter(slug=slug, is_active=True).values_list('id', flat=True).first()
+    except (ProgrammingError, OperationalError):
+        return
+    if product_id is None:
+        return
+    recently_viewed = request.session.get('recently_viewed', [])
+    if recently_viewed[:1] != [product_id]:
+        recently_viewed = [product_id] + [pk for pk in recently_viewed if pk != product_id]
+        request.session['recently_viewed'] = recently_viewed[:5]
+
+
+@cache_anonymous_page('catalog', on_request=track_recently_viewed)
 def product_detail(request, slug):
     """Individual product detail page - PRODUCTION SAFE"""
     try:
@@ -284,12 +285,7 @@ def product_detail(request, slug):
         print(f"Error in product_detail: {e}")
         return redirect('shop')
     
-    # Track recently viewed products
     recently_viewed = request.session.get('recently_viewed', [])
-    if product.id not in recently_viewed:
-        recently_viewed.insert(0, product.id)
-        recently_viewed = recently_viewed[:5]
-        request.session['recently_viewed'] = recently_viewed
     
     # Get related products
     related_products = []
@@ -297,10 +293,7 @@ def product_detail(request, slug):
     additional_images = []
     
     try:
-        related_products = list(Product.objects.filter(
-            category=product.category,
-            is_active=True
-        ).select_related('category').exclude(id=product.id)[:4])
+        related_products = get_related_products(product, 4)
         
         recently_viewed_products = list(Product.objects.filter(
             id__in=recently_viewed,
@@ -311,6 +304,12 @@ def product_detail(request, slug):
     except Exception as e:
         print(f"Error loading related products: {e}")
     
+    prime_whatsapp_links([product] + related_products)
+    prime_manifests(
+        [p.image.name for p in [product] + related_products + recently_viewed_products] +
+        [image.image.name for image in additional_images]
+    )
+    
     context = {
         'product': product,
         'related_products': related_products,
@@ -321,6 +320,7 @@ def product_detail(request, slug):
     return render(request, 'main/product_detail.html', context)
 
 
+@cache_anonymous_page('testimonials')
 def about(request):
     """About page - PRODUCTION SAFE"""
     testimonials = []
@@ -449,6 +449,7 @@ def newsletter_signup(request):
         })
 
 
+@cache_anonymous_page('catalog')
 def search(request):
     """Search across products - PRODUCTION SAFE"""
     query = request.GET.get('q', '').strip()
@@ -460,26 +461,20 @@ def search(request):
     
     try:
         products_list = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query),
             is_active=True
         ).select_related('category').prefetch_related('features').order_by('-is_featured', '-created_at')
+        products_list = order_by_relevance(search_products(products_list, query))
     except (ProgrammingError, OperationalError):
         pass
     
-    paginator = Paginator(products_list, 12)
-    page = request.GET.get('page', 1)
-    
-    try:
-        products = paginator.page(page)
-    except (PageNotAnInteger, EmptyPage):
-        products = paginator.page(1)
+    products = paginate(request, products_list, 12)
+    products.object_list = prime_whatsapp_links(products.object_list)
+    prime_manifests(p.image.name for p in products.object_list)
     
     context = {
         'query': query,
         'products': products,
-        'total_results': paginator.count,
+        'total_results': products.paginator.count,
         'company_info': get_company_info(),
     }
     return render(request, 'main/shop.html', context)
@@ -489,10 +484,7 @@ def get_product_variants(request, product_id):
     """Get product variants for AJAX requests"""
     try:
         product = Product.objects.select_related('category').get(id=product_id, is_active=True)
-        variants = Product.objects.filter(
-            category=product.category,
-            is_active=True
-        ).exclude(id=product_id)[:4]
+        variants = get_related_products(product, 4)
         
         variants_data = []
         for variant in variants:
@@ -539,17 +531,22 @@ def get_category_products(request, category_slug):
         return JsonResponse({'error': 'Category not found'}, status=404)
 
 
-def site_context(request):
-    """Global context processor for site-wide data"""
-    main_categories = []
+@request_value('main_categories')
+def load_main_categories(request=None):
     try:
-        main_categories = list(Category.objects.filter(is_active=True)[:5])
+        return get_or_compute(
+            'category_menu:main', lambda: list(Category.objects.filter(is_active=True)[:5]),
+            FRAGMENT_TIMEOUT, tags=('catalog',),
+        )
     except (ProgrammingError, OperationalError):
-        pass
-    
+        return []
+
+
+def site_context(request):
+    """Global context processor for site-wide data; queried only if a template uses it"""
     return {
-        'company_info': get_company_info(),
-        'main_categories': main_categories,
+        'company_info': lazy_request_value('company_info', request),
+        'main_categories': lazy_request_value('main_categories', request),
     }
 
 
@@ -560,9 +557,7 @@ def add_to_wishlist(request, product_id):
     try:
         product = get_object_or_404(Product, id=product_id, is_active=True)
         
-        if not request.session.session_key:
-            request.session.create()
-        session_key = request.session.session_key
+        session_key = get_visitor_key(request, create=True)
         
         wishlist, created = Wishlist.objects.get_or_create(session_key=session_key)
         wishlist_item, item_created = WishlistItem.objects.get_or_create(
@@ -593,7 +588,7 @@ def add_to_wishlist(request, product_id):
 def remove_from_wishlist(request, product_id):
     """Remove product from wishlist"""
     try:
-        session_key = request.session.session_key
+        session_key = get_visitor_key(request)
         if not session_key:
             return JsonResponse({'success': False, 'message': 'No wishlist found'})
         
@@ -616,18 +611,13 @@ def remove_from_wishlist(request, product_id):
 
 def view_wishlist(request):
     """View all wishlist items"""
-    session_key = request.session.session_key
     wishlist_items = []
-    wishlist = None
+    wishlist = get_request_value('wishlist', request)
     
-    if session_key:
-        try:
-            wishlist = Wishlist.objects.get(session_key=session_key)
-            wishlist_items = list(wishlist.items.select_related(
-                'product__category'
-            ).prefetch_related('product__features').all())
-        except Wishlist.DoesNotExist:
-            pass
+    if wishlist is not None:
+        wishlist_items = list(wishlist.items.select_related(
+            'product__category'
+        ).prefetch_related('product__features').all())
     
     context = {
         'wishlist': wishlist,
@@ -639,41 +629,69 @@ def view_wishlist(request):
 
 def get_wishlist_count(request):
     """AJAX endpoint to get wishlist count"""
-    session_key = request.session.session_key
-    count = 0
-    
-    if session_key:
-        try:
-            wishlist = Wishlist.objects.get(session_key=session_key)
-            count = wishlist.items.count()
-        except Wishlist.DoesNotExist:
-            pass
+    count = get_request_value('wishlist_items_count', request)
     
     return JsonResponse({'count': count})
 
 
+@never_cache
+def visitor_state(request):
+    """Per-visitor bits that cached pages fill in client-side"""
+    count = get_request_value('wishlist_items_count', request)
+    
+    return JsonResponse({
+        'wishlist_count': count,
+        'csrf_token': get_token(request),
+    })
+
+
 @csrf_protect
 @require_http_methods(["POST"])
 def track_whatsapp_order(request):
-    """Track WhatsApp order button clicks for analytics"""
+    """Track WhatsApp order button clicks for analytics; queued, not saved inline"""
     try:
         data = json.loads(request.body)
-        
-        if not request.session.session_key:
-            request.session.create()
-        
-        WhatsAppOrderClick.objects.create(
-            product_id=data.get('product_id', ''),
-            product_name=data.get('product_name', ''),
-            price=data.get('price', 0),
-            session_key=request.session.session_key,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
-        )
-        
-        return JsonResponse({'success': True})
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+        price = clean_price(data.get('price'))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid click data'}, status=400)
+
+    record_click(
+        product_id=str(data.get('product_id', ''))[:50],
+        product_name=str(data.get('product_name', ''))[:200],
+        price=price,
+        # Existing visitors only: a click never creates a session.
+        session_key=get_visitor_key(request) or '',
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500],
+    )
+    return HttpResponse(status=204)
+
+
+@staff_member_required
+def click_buffer_stats(request):
+    """Queue depth and drop counters of this worker's click buffer"""
+    return JsonResponse(click_stats())
+
+
+def sitemap_last_modified(request, name):
+    storage = get_sitemap_storage()
+    return storage.get_modified_time(name) if storage.exists(name) else None
+
+
+@condition(last_modified_func=sitemap_last_modified)
+def serve_sitemap(request, name):
+    """Serve a prebuilt sitemap file; see static_sitemaps.py"""
+    storage = get_sitemap_storage()
+    if not storage.exists(name):
+        if name == INDEX_NAME:
+            # Not built yet: render the sitemap live.
+            from django.contrib.sitemaps.views import sitemap
+            return sitemap(request, sitemaps=get_sitemaps())
+        raise Http404('Sitemap not found')
+    with storage.open(name, 'rb') as f:
+        data = f.read()
+    content_type = 'application/gzip' if name.endswith('.gz') else 'application/xml'
+    return HttpResponse(data, content_type=content_type)
 
 
 def quick_quote(request, product_id):
@@ -688,31 +706,35 @@ def quick_quote(request, product_id):
 def share_product(request, product_id):
     """Generate product share WhatsApp link"""
     try:
-        product = get_object_or_404(Product, id=product_id, is_active=True)
+        product = get_object_or_404(
+            Product.objects.prefetch_related('features'), id=product_id, is_active=True
+        )
         return redirect(product.whatsapp_share_link)
     except:
         return redirect('shop')
 
 
-def wishlist_context(request):
-    """Context processor for wishlist"""
-    session_key = request.session.session_key
-    if not session_key:
-        request.session.create()
-        session_key = request.session.session_key
-    
-    wishlist = None
-    items_count = 0
-    
+@request_value('wishlist')
+def load_wishlist(request):
+    return get_visitor_wishlist(request) if request is not None else None
+
+
+@request_value('wishlist_items_count')
+def load_wishlist_items_count(request):
+    wishlist = get_request_value('wishlist', request)
+    if wishlist is None:
+        return 0
     try:
-        wishlist = Wishlist.objects.get(session_key=session_key)
-        items_count = wishlist.items.count()
-    except (Wishlist.DoesNotExist, ProgrammingError, OperationalError):
-        pass
-        
+        return wishlist.items.count()
+    except (ProgrammingError, OperationalError):
+        return 0
+
+
+def wishlist_context(request):
+    """Context processor for wishlist; queried only if a template uses it"""
     return {
-        'wishlist': wishlist,
-        'wishlist_items_count': items_count,
+        'wishlist': lazy_request_value('wishlist', request),
+        'wishlist_items_count': lazy_request_value('wishlist_items_count', request),
     }
 
 
@@ -0,0 +1,55 @@
+"""
+Anonymous visitor identity.
+
+Sessions are only created when a visitor does something worth remembering
+(adding to the wishlist, clicking a WhatsApp order button, viewing a
+product). Browsing alone never writes a session or sets a cookie.
+
+Wishlists and click records are keyed by a stable visitor key stored inside
+the session rather than by ``session.session_key``: with the signed-cookie
+engine the session key is the cookie payload itself and changes on every
+write.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.db import ProgrammingError, OperationalError
+
+from .models import Wishlist
+
+
+VISITOR_KEY = 'visitor_key'
+SIGNED_COOKIES_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+
+def get_visitor_key(request, create=False):
+    """
+    Return the visitor's key, or None if they have none yet.
+
+    With ``create=True`` a key is assigned (and the session saved by the
+    middleware) when missing.
+    """
+    session = request.session
+    key = session.get(VISITOR_KEY)
+    if key:
+        return key
+    # Sessions from before visitor keys existed used the session key for
+    # their wishlist; keep using it so those wishlists are not orphaned.
+    if settings.SESSION_ENGINE != SIGNED_COOKIES_ENGINE:
+        key = session.session_key
+    if create:
+        key = key or uuid.uuid4().hex
+        session[VISITOR_KEY] = key
+    return key
+
+
+def get_visitor_wishlist(request):
+    """The visitor's wishlist, without creating a session or a wishlist."""
+    key = get_visitor_key(request)
+    if not key:
+        return None
+    try:
+        return Wishlist.objects.filter(session_key=key).first()
+    except (ProgrammingError, OperationalError):
+        return None
@@ -0,0 +1,215 @@
+"""
+WhatsApp deep-link builder for product cards, product pages and wishlists.
+
+The WhatsApp number and site domain are resolved once per process and reused
+for every link until a CompanyInfo or Site save invalidates them. Saves made
+in another worker are picked up through the shared "company" cache tag, which
+is read once per request: the config is a request value, and the number comes
+from the same request-memoized company info the templates use.
+"""
+
+import threading
+import urllib.parse
+
+from django.urls import reverse
+
+from .request_values import get_request_value, request_value
+
+
+DEFAULT_WHATSAPP_NUMBER = '263784342632'
+FALLBACK_DOMAIN = 'eyedentity-gx20.onrender.com'
+
+_config = None
+_config_version = None
+_config_lock = threading.Lock()
+
+
+def _load_config():
+    from django.contrib.sites.models import Site
+    from .company import get_company_info
+
+    try:
+        company_info = get_company_info()
+        whatsapp_number = company_info.whatsapp.replace(' ', '').replace('-', '') if company_info else DEFAULT_WHATSAPP_NUMBER
+    except Exception:
+        whatsapp_number = DEFAULT_WHATSAPP_NUMBER
+
+    try:
+        domain = Site.objects.get_current().domain
+        protocol = 'https' if not domain.startswith('localhost') else 'http'
+        base_url = f"{protocol}://{domain}"
+    except Exception:
+        base_url = f"https://{FALLBACK_DOMAIN}"
+
+    return {
+        'whatsapp_number': whatsapp_number or DEFAULT_WHATSAPP_NUMBER,
+        'base_url': base_url,
+    }
+
+
+def get_link_config():
+    """Return the cached WhatsApp number and site base URL for this request."""
+    return get_request_value('whatsapp_link_config')
+
+
+@request_value('whatsapp_link_config')
+def load_link_config(request=None):
+    """The process-wide config, reloaded when the "company" tag has moved."""
+    from .cache_tags import get_tag_version
+
+    global _config, _config_version
+    version = get_tag_version('company')
+    config = _config
+    if config is None or _config_version != version:
+        with _config_lock:
+            if _config is None or _config_version != version:
+                _config = _load_config()
+                _config_version = version
+            config = _config
+    return config
+
+
+def invalidate_link_config(**kwargs):
+    """Signal receiver: drop the cached config after CompanyInfo/Site changes."""
+    global _config
+    with _config_lock:
+        _config = None
+
+
+def product_url(product, config=None):
+    config = config or get_link_config()
+    return f"{config['base_url']}{reverse('product_detail', kwargs={'slug': product.slug})}"
+
+
+def _wa_link(number, message):
+    encoded_message = urllib.parse.quote(message)
+    if number:
+        return f"https://wa.me/{number}?text={encoded_message}"
+    return f"https://wa.me/?text={encoded_message}"
+
+
+def order_link(product, config=None):
+    config = config or get_link_config()
+    if product.whatsapp_message:
+        message = product.whatsapp_message
+    else:
+        message_parts = [
+            "🛒 *ORDER REQUEST*",
+            "",
+            f"📦 Product: {product.name}",
+        ]
+        if product.product_code:
+            message_parts.append(f"🔢 Code: {product.product_code}")
+        message_parts.append(f"💰 Price: ${product.price}")
+        if product.old_price and product.old_price > product.price:
+            savings = float(product.old_price) - float(product.price)
+            message_parts.append(f"💸 You Save: ${savings:.2f}")
+        if product.stock_quantity <= 5 and product.stock_quantity > 0:
+            message_parts.append(f"⚠️ Only {product.stock_quantity} left in stock!")
+        message_parts.extend([
+            "",
+            f"📱 View product: {product_url(product, config)}",
+            "",
+            "Hi! I'd like to order this product. Please confirm availability and delivery options.",
+        ])
+        message = "\n".join(message_parts)
+    return _wa_link(config['whatsapp_number'], message)
+
+
+def quick_quote_link(product, config=None):
+    config = config or get_link_config()
+    message_parts = [f"Hi! I'd like a quote for {product.name}"]
+    if product.product_code:
+        message_parts[0] += f" (Code: {product.product_code})"
+    message_parts.extend([
+        ". Please provide:",
+        "- Availability",
+        "- Delivery cost to my location",
+        "- Payment options",
+        "- Total price"
+    ])
+    return _wa_link(config['whatsapp_number'], "\n".join(message_parts))
+
+
+def share_link(product, config=None):
+    config = config or get_link_config()
+    if product.whatsapp_share_message:
+        message = product.whatsapp_share_message.format(
+            product_name=product.name,
+            product_code=product.product_code if product.product_code else 'N/A',
+            price=product.price,
+            url=product_url(product, config)
+        )
+    else:
+        message_parts = [
+            f"👓 Check out this eyewear! 👓",
+            "",
+            f"*{product.name}*",
+        ]
+        if product.product_code:
+            message_parts.append(f"Code: {product.product_code}")
+        message_parts.append(f"Price: ${product.price}")
+        if product.old_price and product.old_price > product.price:
+            message_parts.append(f"🔥 Save {product.discount_percentage}% (Was ${product.old_price})")
+        # One query at most, or none when features were prefetched.
+        features = list(product.features.all()[:3])
+        if features:
+            features_list = ", ".join([f.name for f in features])
+            message_parts.append(f"✨ Features: {features_list}")
+        message_parts.extend([
+            "",
+            f"View details: {product_url(product, config)}",
+            "",
+            "🛒 Shop premium eyewear at Eyedentity!",
+        ])
+        message = "\n".join(message_parts)
+    return _wa_link(None, message)
+
+
+def wishlist_order_link(items, config=None):
+    config = config or get_link_config()
+    message_parts = [
+        "🛒 *MULTIPLE ITEMS ORDER*",
+        "",
+        "I'm interested in ordering the following items:",
+        "",
+    ]
+    total = 0.0
+    for item in items:
+        product = item.product
+        total += float(product.price)
+        message_parts.append(
+            f"📦 {product.name}\n"
+            f"   Code: {product.product_code}\n"
+            f"   Price: ${product.price}"
+        )
+        message_parts.append("")
+    message_parts.extend([
+        f"💰 *Total: ${total:.2f}*",
+        "",
+        "Please confirm:",
+        "- Availability of all items",
+        "- Total delivery cost to my location",
+        "- Payment options",
+        "- Estimated delivery time",
+    ])
+    return _wa_link(config['whatsapp_number'], "\n".join(message_parts))
+
+
+def prime_whatsapp_links(products, share=False):
+    """
+    Build the WhatsApp links for a page of products in one pass.
+
+    The links are stored on each instance so the ``whatsapp_link``,
+    ``whatsapp_quick_quote`` and ``whatsapp_share_link`` properties return
+    them without recomputing. Share links read ``features`` and should only be
+    primed for querysets that prefetched them.
+    """
+    config = get_link_config()
+    products = [p for p in products if p is not None]
+    for product in products:
+        product.__dict__['whatsapp_link'] = order_link(product, config)
+        product.__dict__['whatsapp_quick_quote'] = quick_quote_link(product, config)
+        if share:
+            product.__dict__['whatsapp_share_link'] = share_link(product, config)
+    return products